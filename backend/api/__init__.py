@@ -1,3 +1,4 @@
+import asyncio
 import traceback
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
@@ -6,8 +7,9 @@ from starlette.middleware.gzip import GZipMiddleware
 
 from app.order_fulfillment import init_register_logistics, init_register_channels
 from core.config2 import settings
-from core.db import init_db_mysql_for_app
+from core.db import init_db_mysql_for_app, mongo_pool, close_async_redis_pools
 from core.log import logger
+from crud.indexes import ensure_all_indexes
 from fastapi.responses import JSONResponse
 from schemas.basic import CodeEnum
 from .v1 import v1
@@ -43,6 +45,23 @@ app.add_middleware(GZipMiddleware, minimum_size=1024 * 1024)
 os.makedirs(settings.static.static_dir, exist_ok=True)
 os.makedirs(settings.static.upload_dir, exist_ok=True)
 os.makedirs(settings.static.image_dir, exist_ok=True)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    Content-addressed files (e.g. product image thumbnails) never change under the same URL.
+    """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+os.makedirs(os.path.join(settings.static.image_dir, "odoo"), exist_ok=True)
+app.mount("/static2/images/odoo",
+          ImmutableStaticFiles(directory=os.path.join(settings.static.image_dir, "odoo")),
+          name="odoo_images")
 app.mount("/static2",
           StaticFiles(directory=settings.static.static_dir),
           name="static2")
@@ -74,6 +93,10 @@ async def startup_event():
     hourly_scheduler.start()
     daily_scheduler.start()
     async_hourly_scheduler.start()
+    try:
+        await asyncio.to_thread(ensure_all_indexes)
+    except Exception as e:
+        logger.error(f"Failed to ensure MongoDB indexes: {e}")
 
 
 @app.on_event("shutdown")
@@ -82,6 +105,9 @@ async def shutdown_event():
     hourly_scheduler.shutdown()
     daily_scheduler.shutdown()
     async_hourly_scheduler.shutdown()
+    logger.info(f"Closing MongoDB client pool: {mongo_pool.stats()}")
+    mongo_pool.close()
+    await close_async_redis_pools()
 
 
 @app.exception_handler(Exception)
@@ -7,7 +7,7 @@ from fastapi.templating import Jinja2Templates
 from sp_api.base import Marketplaces
 
 import utils.time as time_utils
-from core.db import RedisDataManager
+from core.db import RedisDataManager, AsyncRedisDataManager
 from external.amazon.base import AmazonSpAPIKey
 from schemas import ResponseSuccess
 from schemas.amazon import DailySalesCountVO, PackSlipRequestBody
@@ -24,13 +24,15 @@ def get_amazon_orders(days_ago: int = Query(7, description="Fetch data for the l
                       status: List[str] = Query(None, description="Filter orders by status"),
                       offset: int = Query(0, description="Offset for pagination"),
                       limit: int = Query(100, description="Limit for pagination"),
+                      cursor: str = Query(None, description="nextCursor of the previous page, "
+                                                            "replaces offset for deep pages"),
                       api_key_index: int = Query(0, description="Index of API key in settings.API_KEYS list"),
                       ):
     marketplace = Marketplaces.DE
     with AmazonService(key_index=api_key_index, marketplace=marketplace) as svc:
         data = svc.query_amazon_orders(days_ago=days_ago, status=status,
                                        offset=offset, limit=limit,
-                                       up_to_date=False)
+                                       up_to_date=False, cursor=cursor)
     return ResponseSuccess(data=data)
 
 
@@ -142,9 +144,9 @@ async def upload_amazon_pack_slip_redis(request: Request,):
     html_content = await request.body()    # html content in bytes
     html_content = html_content.decode('utf-8') # convert bytes to string
     TIME_TO_LIVE_SEC = 3600 * 48  # 48 hours
-    man = RedisDataManager()
     KEY = f"AMZPS:{time_utils.now(pattern='%Y%m%d%H%M%S')}"
-    man.set(KEY, html_content, time_to_live_sec=TIME_TO_LIVE_SEC)
+    async with AsyncRedisDataManager() as man:
+        await man.set(KEY, html_content, time_to_live_sec=TIME_TO_LIVE_SEC)
     data = {
         "key": KEY,
         "message": "Packing slip has been successfully uploaded to Redis.",
@@ -170,18 +172,26 @@ def download_amazon_pack_slip_redis(
 @amz_order.get("/orders/fba/pack-rule",
                summary="Get FBA packing rule",
                response_model=BasicResponse[dict])
-def calc_fba_packing_rule(qty: int, sku: str, max_capacity: int):
-    with FbaService() as fba_svc:
+async def calc_fba_packing_rule(qty: int, sku: str, max_capacity: int):
+    async with FbaService() as fba_svc:
         rule = fba_svc.fba_packing_rule(qty, sku, max_capacity)
-        fba_svc.cache_fba_max_ctn_capacity(sku, max_capacity)
+        await fba_svc.cache_fba_max_ctn_capacity(sku, max_capacity)
     return ResponseSuccess(data=rule)
 
+@amz_order.get("/orders/fba/max-ctn-capacity",
+               summary="Get FBA max container capacities of multiple SKUs",
+               response_model=BasicResponse[dict])
+async def get_fba_max_ctn_capacities(skus: List[str] = Query(..., description="SKUs to look up")):
+    async with FbaService() as fba_svc:
+        capacities = await fba_svc.get_fba_max_ctn_capacities(skus)
+    return ResponseSuccess(data=capacities)
+
 @amz_order.get("/orders/fba/max-ctn-capacity/{sku}",
                summary="Get FBA max container capacity",
                response_model=BasicResponse[dict])
-def get_fba_max_ctn_capacity(sku: str):
-    with FbaService() as fba_svc:
-        max_capacity = fba_svc.get_fba_max_ctn_capacity(sku)
+async def get_fba_max_ctn_capacity(sku: str):
+    async with FbaService() as fba_svc:
+        max_capacity = await fba_svc.get_fba_max_ctn_capacity(sku)
         if max_capacity is None:
             return ResponseNotFound(message=f"FBA max container capacity for sku {sku} not found in cache.", data={})
     return ResponseSuccess(data=max_capacity)
@@ -4,7 +4,8 @@ from fastapi import APIRouter, HTTPException, UploadFile, File
 from core.config2 import settings
 from core.log import logger
 from schemas.barcode import ProductFullInfo, ProductBasicInfo, ProductUpdate, Quant, ProductPackaging, \
-    ProductPackagingUpdate, PutawayRule, PutawayRuleUpdate
+    ProductPackagingUpdate, PutawayRule, PutawayRuleUpdate, BarcodeResolveRequest, ResolvedBarcode, \
+    BulkQuantCountRequest, BulkQuantRelocationRequest, BulkPutawayRequest, BulkItemResult
 from services.odoo.OdooScannerServier import OdooScannerService
 
 barcode = APIRouter(prefix="/product", )
@@ -18,6 +19,14 @@ def get_product_by_keyword(keyword: str, offset: int = 0, limit: int = 50):
     return products
 
 
+@barcode.post("/resolve", response_model=Dict[str, ResolvedBarcode])
+def resolve_barcodes(request: BarcodeResolveRequest):
+    # 批量扫码：一次请求解析整托或收货单上的所有条码
+    with OdooScannerService(key_index=odoo_access_key_index, login=False) as svc:
+        results = svc.resolve_codes(request.codes, include_quants=request.include_quants)
+    return results
+
+
 @barcode.get("/pid/{id}", response_model=ProductFullInfo)
 def get_product_by_id(id: int, up_to_date: bool = False):
     with OdooScannerService(key_index=odoo_access_key_index, login=False) as svc:
@@ -93,6 +102,21 @@ def quant_relocation_by_id(quant_id: int, barcode: str):
     return success
 
 
+@barcode.put("/quants/counts", response_model=list[BulkItemResult])
+def request_quants_bulk(request: BulkQuantCountRequest):
+    # 批量盘点，例如整条货架
+    with OdooScannerService(key_index=odoo_access_key_index, login=True) as svc:
+        results = svc.request_quants_bulk(request.items)
+    return results
+
+
+@barcode.put("/quants/relocations", response_model=list[BulkItemResult])
+def relocate_quants_bulk(request: BulkQuantRelocationRequest):
+    with OdooScannerService(key_index=odoo_access_key_index, login=True) as svc:
+        results = svc.relocate_quants_bulk(request.items)
+    return results
+
+
 def update_inventory_by_id(inventory_id, data):
     pass
 
@@ -158,8 +182,15 @@ def upsert_putaway_rule(product_id: int, dest_barcode: str):
     return rule_
 
 
+@barcode.put("/putaway_rules", response_model=list[BulkItemResult])
+def upsert_putaway_rules_bulk(request: BulkPutawayRequest):
+    with OdooScannerService(key_index=odoo_access_key_index, login=True) as svc:
+        results = svc.upsert_putaway_rules_bulk(request.items)
+    return results
+
+
 @barcode.get("/delivery_order/{order_number}", response_model=List[Dict])
-def query_delivery_order_by_order_number(order_number: str):
+def query_delivery_order_by_order_number(order_number: str, refresh: bool = False):
     with OdooScannerService(key_index=odoo_access_key_index, login=False) as svc:
-        order = svc.query_delivery_order_by_order_number(order_number)
+        order = svc.query_delivery_order_by_order_number(order_number, refresh=refresh)
     return order
\ No newline at end of file
@@ -35,6 +35,25 @@ def find_gls_shipments(refs: str = Query(None, description="GLS Shipment referen
     return ResponseSuccess(data=shipments)
 
 
+@gls.get("/shipments/page",
+         summary="List recent GLS Shipments from database page by page",
+         response_model=BasicResponse[dict])
+def list_gls_shipments(days_ago: int = Query(30, description="Shipments created in the last x days"),
+                       limit: int = Query(100, le=1000, description="Page size"),
+                       cursor: str = Query(None, description="nextCursor of the previous page"),
+                       labels: bool = Query(False, description="Whether to include labels in the response")):
+    """
+    List GLS Shipments of the account, newest first. Pass nextCursor to get the next page.
+    """
+    with GlsShipmentService(key_index=settings.api_keys.gls_access_key_index) as man:
+        shipments, next_cursor = man.find_shipments_page(days_ago=days_ago, limit=limit, cursor=cursor)
+    if not labels:
+        for shipment in shipments:
+            shipment.label = ""
+    data = dict(shipments=shipments, size=len(shipments), nextCursor=next_cursor)
+    return ResponseSuccess(data=data)
+
+
 def get_gls_shipment_by_reference(ref: str = Query(None, description="GLS Shipment reference"),
                                   labels: bool = Query(False, description="Whether to include labels in the response")):
     """
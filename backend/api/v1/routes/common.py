@@ -7,6 +7,7 @@ from fastapi import APIRouter, UploadFile, HTTPException
 import hashlib
 
 from core.config2 import settings
+from core.db import mongo_pool
 from utils import OcrUtils
 from utils.OcrUtils import ImageParams
 
@@ -112,4 +113,10 @@ async def file_upload_without_name(file: UploadFile):
 @common_router.post("/ocr", response_model=dict)
 async def ocr_image(params: ImageParams):
     result = OcrUtils.ocr_image(params)
-    return result
\ No newline at end of file
+    return result
+
+
+@common_router.get("/db/pool-stats", response_model=dict,
+                   summary="Metrics of the shared MongoDB client pool")
+def get_db_pool_stats():
+    return mongo_pool.stats()
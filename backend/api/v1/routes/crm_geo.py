@@ -16,26 +16,32 @@ odoo_access_key_index = settings.api_keys.odoo_access_key_index
 def get_geo_contacts(longitude: float, latitude: float,
                       radius: float = 9999,
                       is_calc_distance: bool = False,
-                      include_leads: bool = False
+                      include_leads: bool = False,
+                      offset: int = 0,
+                      limit: Optional[int] = None,
                      ):
+    # is_calc_distance: 按距离排序并只返回 radius 公里内的联系人，total 为半径内的总数
+    min_customer_rank = 0 if include_leads else 1
     try:
         with OdooGeoService(key_index=odoo_access_key_index, login=None) as service:
-            if include_leads:
-                customers = service.query_all_geo_contacts(offset=0, limit=None)
-            else:
-                customers = service.query_all_geo_customers(offset=0, limit=None)
             if is_calc_distance:
-                customers = service.calc_distance(
+                customers, total = service.query_nearby_geo_contacts(
                     longitude,
                     latitude,
-                    customers,
+                    radius_km=radius,
+                    offset=offset,
+                    limit=limit,
+                    min_customer_rank=min_customer_rank,
                 )
-                customers = [c for c in customers if c.km_distance <= radius]
+            else:
+                customers = service.query_all_geo_contacts(offset=offset, limit=limit,
+                                                           min_customer_rank=min_customer_rank)
+                total = len(customers)
     except RuntimeError as e:
         return HTTPException(status_code=500, detail=str(e))
     return ListGeoContacts(
         contacts=customers,
-        total=len(customers)
+        total=total
     )
 
 @crm_geo.get("/contacts/keyword/{keyword}", response_model=ListGeoContacts,
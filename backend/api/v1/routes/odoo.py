@@ -1,17 +1,19 @@
+import datetime
 import io
 from typing import List
 
 import pandas as pd
-from fastapi import APIRouter, Body
+from fastapi import APIRouter, Body, Query, HTTPException
 from starlette.responses import StreamingResponse, HTMLResponse
 from core.config2 import settings
 from core.log import logger
 from schemas import ResponseSuccess, BasicResponse
 from schemas.vip import VipOrder, VipCustomer, PimProduct, CrmAddress, CrmContact
 from services.odoo.OdooDashboardService import OdooOrderDashboardService
-from services.odoo.OdooInventoryService import OdooInventoryService
+from services.odoo.OdooInventoryService import OdooInventoryService, QUANT_SNAPSHOT_RESOLUTIONS
 from services.odoo.OdooOrderService import OdooProductService, OdooContactService, OdooOrderService, OdooHsmsService
-from services.odoo.OdooStatistics import OdooStatisticsService
+from services.odoo.OdooStatistics import OdooStatisticsService, SALES_WINDOWS
+from services.odoo.OdooDeltaSync import DELTA_PAGE_SIZE
 
 odoo_inventory = APIRouter(prefix="/inventory",)
 odoo_sales = APIRouter(prefix="/sales", )
@@ -22,10 +24,17 @@ odoo_hsms = APIRouter(prefix="/hsms", )
 odoo_access_key_index = settings.api_keys.odoo_access_key_index
 
 @odoo_contact.get('/addresses')
-def get_odoo_contact_list():
-    #  Odoo Contact List API
+def get_odoo_contact_list(limit: int = Query(default=10000, le=10000), cursor: str = None):
+    #  Odoo Contact List API, cursor: 上一页返回的 nextCursor
     with OdooContactService(key_index=odoo_access_key_index, login=False) as svc:
-        data = svc.query_all_contact_shipping_addresses(offset=0, limit=10000)
+        data = svc.query_all_contact_shipping_addresses(offset=0, limit=limit, cursor=cursor)
+    return ResponseSuccess(data=data)
+
+@odoo_contact.get('/addresses/changes')
+def get_odoo_contact_changes(since: str = None, limit: int = Query(default=DELTA_PAGE_SIZE, le=10000)):
+    # 增量同步：since 为上次返回的 token，返回之后变更 (upserts) 和删除 (deleted) 的地址
+    with OdooContactService(key_index=odoo_access_key_index, login=False) as svc:
+        data = svc.query_contact_address_changes(since=since, limit=limit)
     return ResponseSuccess(data=data)
 
 @odoo_contact.get(
@@ -125,11 +134,18 @@ def create_odoo_contact_person_from_crm(
     return ResponseSuccess(data=ans)
 
 @odoo_inventory.get('/products')
-def get_odoo_product_list():
-    # Implement Odoo Product List API
+def get_odoo_product_list(limit: int = Query(default=10000, le=10000), cursor: str = None):
+    # Implement Odoo Product List API, cursor: 上一页返回的 nextCursor
     with OdooProductService(key_index=odoo_access_key_index, login=False) as svc:
         # data = svc.query_all_product_templates(offset=0, limit=10000)
-        data = svc.query_all_products(offset=0, limit=10000)
+        data = svc.query_all_products(offset=0, limit=limit, cursor=cursor)
+    return ResponseSuccess(data=data)
+
+@odoo_inventory.get('/products/changes')
+def get_odoo_product_changes(since: str = None, limit: int = Query(default=DELTA_PAGE_SIZE, le=10000)):
+    # 增量同步：since 为上次返回的 token，返回之后变更 (upserts) 和删除 (deleted) 的产品
+    with OdooProductService(key_index=odoo_access_key_index, login=False) as svc:
+        data = svc.query_product_changes(since=since, limit=limit)
     return ResponseSuccess(data=data)
 
 @odoo_inventory.get('/quants')
@@ -139,6 +155,30 @@ def get_odoo_quant_list():
         data = svc.query_all_quants(offset=0, limit=10000)
     return ResponseSuccess(data=data)
 
+@odoo_inventory.get('/quants/history')
+def get_odoo_quant_history(product_ids: List[int] = Query(..., max_length=500),
+                           days: int = Query(default=90, ge=1, le=730),
+                           resolution: str = "day",
+                           location_ids: List[int] = Query(default=None)):
+    # 库存趋势：最近 days 天的库存快照，resolution: day / hour（按小时的快照只保留 14 天）
+    if resolution not in QUANT_SNAPSHOT_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"Invalid resolution {resolution}")
+    end = datetime.datetime.now()
+    start = end - datetime.timedelta(days=days)
+    with OdooInventoryService(key_index=odoo_access_key_index, login=False) as svc:
+        data = svc.query_quant_history(product_ids, start, end, resolution=resolution, location_ids=location_ids)
+    return ResponseSuccess(data=data)
+
+@odoo_inventory.get('/products/{product_id}/inventory')
+def get_odoo_product_inventory(product_id: int):
+    # 产品库存视图：各库位库存、上架规则和包装
+    with OdooInventoryService(key_index=odoo_access_key_index, login=False) as svc:
+        data = svc.query_product_inventory(product_id)
+        if data is None:
+            svc.rebuild_product_inventories([product_id])
+            data = svc.query_product_inventory(product_id)
+    return ResponseSuccess(data=data)
+
 @odoo_inventory.get('/locations')
 def get_odoo_location_list():
     #  Odoo Location List API
@@ -147,12 +187,20 @@ def get_odoo_location_list():
     return ResponseSuccess(data=data)
 
 
+@odoo_inventory.get('/locations/changes')
+def get_odoo_location_changes(since: str = None, limit: int = Query(default=DELTA_PAGE_SIZE, le=10000)):
+    # 增量同步：since 为上次返回的 token，返回之后变更 (upserts) 和删除 (deleted) 的库位
+    with OdooInventoryService(key_index=odoo_access_key_index, login=False) as svc:
+        data = svc.query_location_changes(since=since, limit=limit)
+    return ResponseSuccess(data=data)
+
+
 @odoo_inventory.get('/delivery_order/{order_number}',
                     summary="Get Odoo Delivery Order by Order Number",
                     response_model=BasicResponse[dict])
-def get_odoo_delivery_order(order_number: str):
+def get_odoo_delivery_order(order_number: str, refresh: bool = False):
     with OdooOrderService(key_index=odoo_access_key_index, login=False) as svc:
-        data = svc.query_delivery_order_by_order_number(order_number)
+        data = svc.query_delivery_order_by_order_number(order_number, refresh=refresh)
     return ResponseSuccess(data=data)
 
 
@@ -184,12 +232,22 @@ def render_sales_order_report_bubble_chart(days_ago: int = 365):
     return HTMLResponse(html)
 
 
+@odoo_dashboard.get('/customer_segments',
+                    summary="Get cached customer RFM segments")
+def get_customer_segments():
+    # asOf: 最后一次增量更新的时间；calibratedAt: 分位点的计算时间（每天重新计算）
+    with OdooOrderDashboardService(key_index=odoo_access_key_index, login=False) as svc:
+        data = svc.query_customer_segments()
+    return ResponseSuccess(data=data)
+
+
 # 销量统计
 @odoo_dashboard.post('/sales_volume_report',
                     summary="Get Sales Volume Report")
-def download_sales_volume_count():
+def download_sales_volume_count(windows: List[int] = Query(default=list(SALES_WINDOWS))):
+    # windows: 统计销量的时间窗口（天），例如 ?windows=7&windows=30
     service = OdooStatisticsService(key_index=odoo_access_key_index)
-    df_sales = service.product_sales_report()
+    df_sales = service.product_sales_report(windows=windows)
     output = io.BytesIO()
     with pd.ExcelWriter(output) as writer:
         df_sales.to_excel(writer, sheet_name='sheet1', index=False)
@@ -49,6 +49,11 @@ class StaticConfig(BaseModel):
 class MongoDBConfig(BaseModel):
     host: str
     port: int
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    max_idle_time_ms: int = 300000
+    server_selection_timeout_ms: int = 10000
+    health_check_interval_sec: int = 30
 
 class MySqlConfig(BaseModel):
     user: str
@@ -63,6 +68,7 @@ class RedisConfig(BaseModel):
     db: int
     username: str
     password: str
+    max_connections: int = 100
 
 class SSLConfig(BaseModel):
     cert_file: str
@@ -104,6 +110,9 @@ class SchedulerConfig(BaseModel):
     lingxing_fetch_enabled: bool
     woocommerce_fetch_enabled: bool
     odoo_fetch_enabled: bool
+    odoo_sync_workers: int = 3
+    odoo_requests_per_sec: float = 5.0
+    odoo_quant_snapshot_hourly: bool = False  # 除按天外，另外写入按小时的库存快照
 
 class Config(BaseModel):
     app: AppConfig
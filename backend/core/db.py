@@ -1,11 +1,17 @@
+import asyncio
+import base64
 import datetime
 import glob
 import os
 import subprocess
+import threading
 import time
 from abc import abstractmethod
-from typing import List, Optional
+from typing import Dict, List, Optional
+import motor.motor_asyncio
 import pymongo
+from bson import json_util
+from pymongo import monitoring
 from tortoise import Tortoise
 from tortoise.contrib.fastapi import register_tortoise
 from fastapi import FastAPI
@@ -14,6 +20,7 @@ from core.log import logger
 from pymongo.errors import ServerSelectionTimeoutError
 from models.orders import StandardOrder
 import redis
+import redis.asyncio as aioredis
 import json
 
 from models.shipment import StandardShipment
@@ -77,8 +84,28 @@ def clean_old_mysql_db_backups(retain_days=7):
             logger.info(f"Removed old backup file：{file}")
 
 redis_pool = None
+_redis_pool_lock = threading.Lock()
+
+
+def get_redis_pool() -> redis.ConnectionPool:
+    """
+    进程级共享的 Redis 连接池。
+    """
+    global redis_pool
+    if redis_pool is None:
+        with _redis_pool_lock:
+            if redis_pool is None:
+                redis_pool = redis.ConnectionPool(host=settings.redis.host,
+                                                  port=settings.redis.port,
+                                                  db=settings.redis.db,
+                                                  decode_responses=True,
+                                                  max_connections=settings.redis.max_connections)
+    return redis_pool
+
 
 class RedisDataManager:
+    SCAN_BATCH_SIZE = 500
+
     def __init__(self, *args, **kwargs):
         self.redis_host = settings.redis.host
         self.redis_port = settings.redis.port
@@ -86,19 +113,10 @@ class RedisDataManager:
         # self.redis_password = settings.REDIS_PASSWORD
         self.redis_db = settings.redis.db
         self.encoding = 'utf-8'
-
-        if not redis_pool:
-            redis.ConnectionPool(max_connections=100)
-        self.client = redis.Redis(host=self.redis_host,
-                                  port=self.redis_port,
-                                  db=self.redis_db,
-                                  decode_responses=True,
-                                  connection_pool=redis_pool, **kwargs)
+        self.client = redis.Redis(connection_pool=get_redis_pool(), **kwargs)
 
     def set(self, key: str, value: str, time_to_live_sec: int = None):
-        self.client.set(key, value)
-        if time_to_live_sec:
-            self.client.expire(key, time_to_live_sec)
+        self.client.set(key, value, ex=time_to_live_sec or None)
 
     def get(self, key: str) -> str:
         return self.client.get(key)
@@ -106,50 +124,527 @@ class RedisDataManager:
     def delete(self, key: str):
         self.client.delete(key)
 
-    def scan(self, pattern: str) -> List[str]:
-        cursor = '0'
-        keys = []
-        while cursor != 0:
-            cursor, partial_keys = self.client.scan(cursor, match=pattern)
-            keys.extend(partial_keys)
-        data = {key: self.client.get(key) for key in keys}
+    def scan(self, pattern: str) -> Dict[str, str]:
+        return self.scan_values(pattern)
+
+    def scan_keys(self, pattern: str) -> List[str]:
+        return list(self.client.scan_iter(match=pattern, count=self.SCAN_BATCH_SIZE))
+
+    def scan_values(self, pattern: str) -> Dict[str, str]:
+        """
+        按 pattern 扫描所有键，并通过 MGET 分批读取值（每批一次往返）。
+        """
+        keys = self.scan_keys(pattern)
+        data = {}
+        for i in range(0, len(keys), self.SCAN_BATCH_SIZE):
+            batch = keys[i:i + self.SCAN_BATCH_SIZE]
+            data.update(zip(batch, self.client.mget(batch)))
         return data
 
     def get_ttl(self, key: str) -> int:
         return self.client.ttl(key)
 
     def set_json(self, key: str, value: dict, time_to_live_sec: int = None):
-        self.client.set(key, json.dumps(value))
-        if time_to_live_sec:
-            self.client.expire(key, time_to_live_sec)
+        self.client.set(key, json.dumps(value), ex=time_to_live_sec or None)
 
     def get_json(self, key: str) -> dict:
-        # return json.loads(self.client.get(key))
-        value = self.client.get(key)
-        ttl = self.client.ttl(key)
-        if value:
-            data = json.loads(value)
-            data['ttl'] = ttl
-            return data
-        else:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        value, ttl = pipe.execute()
+        return self._load_json(value, ttl)
+
+    def mset(self, mapping: Dict[str, str], time_to_live_sec: int = None):
+        """
+        批量写入字符串，一次往返。
+        """
+        if not mapping:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=time_to_live_sec or None)
+        pipe.execute()
+
+    def mget(self, keys: List[str]) -> Dict[str, str]:
+        if not keys:
+            return {}
+        return dict(zip(keys, self.client.mget(keys)))
+
+    def mset_json(self, mapping: Dict[str, dict], time_to_live_sec: int = None):
+        self.mset({key: json.dumps(value) for key, value in mapping.items()},
+                  time_to_live_sec=time_to_live_sec)
+
+    def mget_json(self, keys: List[str]) -> Dict[str, Optional[dict]]:
+        """
+        批量读取 JSON（包含 ttl 字段），一次往返。不存在的键返回 None。
+        """
+        if not keys:
+            return {}
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+            pipe.ttl(key)
+        results = pipe.execute()
+        return {key: self._load_json(results[2 * i], results[2 * i + 1])
+                for i, key in enumerate(keys)}
+
+    @staticmethod
+    def _load_json(value, ttl) -> Optional[dict]:
+        if not value:
             return None
+        data = json.loads(value)
+        data['ttl'] = ttl
+        return data
+
+
+_async_redis_pools = {}  # event loop -> redis.asyncio.ConnectionPool
+
+
+def pop_closed_loops(resources: dict) -> list:
+    """
+    从 {事件循环: 资源} 中移除已关闭的事件循环（例如 asyncio.run 结束后），返回它们的资源。
+    调用方需持有保护 resources 的锁。
+    """
+    closed = [loop for loop in resources if loop.is_closed()]
+    return [resources.pop(loop) for loop in closed]
+
+
+def get_async_redis_pool() -> aioredis.ConnectionPool:
+    """
+    进程级共享的异步 Redis 连接池。异步连接绑定事件循环，因此每个事件循环各一个连接池。
+    已关闭的事件循环的连接池在这里释放。
+    """
+    loop = asyncio.get_running_loop()
+    with _redis_pool_lock:
+        # 事件循环已关闭，无法再 await disconnect()；清空连接池，连接随传输对象一起回收
+        for stale_pool in pop_closed_loops(_async_redis_pools):
+            stale_pool.reset()
+        pool = _async_redis_pools.get(loop)
+        if pool is None:
+            pool = aioredis.ConnectionPool(host=settings.redis.host,
+                                           port=settings.redis.port,
+                                           db=settings.redis.db,
+                                           decode_responses=True,
+                                           max_connections=settings.redis.max_connections)
+            _async_redis_pools[loop] = pool
+    return pool
+
+
+async def close_async_redis_pools():
+    """
+    关闭当前事件循环的异步 Redis 连接池。短生命周期的事件循环结束前调用。
+    """
+    loop = asyncio.get_running_loop()
+    with _redis_pool_lock:
+        pool = _async_redis_pools.pop(loop, None)
+    if pool is not None:
+        await pool.disconnect()
+
+
+class AsyncRedisDataManager:
+    """
+    RedisDataManager 的异步版本（redis.asyncio），供事件循环中的路由与服务使用，避免阻塞事件循环。
+    """
+    SCAN_BATCH_SIZE = RedisDataManager.SCAN_BATCH_SIZE
+
+    def __init__(self, *args, **kwargs):
+        self.redis_host = settings.redis.host
+        self.redis_port = settings.redis.port
+        self.redis_db = settings.redis.db
+        self.encoding = 'utf-8'
+        self._kwargs = kwargs
+        self.client = None
+
+    def _get_client(self) -> aioredis.Redis:
+        if self.client is None:
+            self.client = aioredis.Redis(connection_pool=get_async_redis_pool(), **self._kwargs)
+        return self.client
+
+    async def __aenter__(self):
+        self._get_client()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        # The shared pool stays open, only the client is released
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def set(self, key: str, value: str, time_to_live_sec: int = None):
+        await self._get_client().set(key, value, ex=time_to_live_sec or None)
+
+    async def get(self, key: str) -> str:
+        return await self._get_client().get(key)
+
+    async def delete(self, key: str):
+        await self._get_client().delete(key)
+
+    async def get_ttl(self, key: str) -> int:
+        return await self._get_client().ttl(key)
+
+    async def scan_keys(self, pattern: str) -> List[str]:
+        return [key async for key in self._get_client().scan_iter(match=pattern, count=self.SCAN_BATCH_SIZE)]
+
+    async def scan_values(self, pattern: str) -> Dict[str, str]:
+        keys = await self.scan_keys(pattern)
+        data = {}
+        for i in range(0, len(keys), self.SCAN_BATCH_SIZE):
+            batch = keys[i:i + self.SCAN_BATCH_SIZE]
+            data.update(zip(batch, await self._get_client().mget(batch)))
+        return data
+
+    async def set_json(self, key: str, value: dict, time_to_live_sec: int = None):
+        await self.set(key, json.dumps(value), time_to_live_sec=time_to_live_sec)
+
+    async def get_json(self, key: str) -> dict:
+        pipe = self._get_client().pipeline(transaction=False)
+        pipe.get(key)
+        pipe.ttl(key)
+        value, ttl = await pipe.execute()
+        return RedisDataManager._load_json(value, ttl)
+
+    async def mset(self, mapping: Dict[str, str], time_to_live_sec: int = None):
+        if not mapping:
+            return
+        pipe = self._get_client().pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=time_to_live_sec or None)
+        await pipe.execute()
+
+    async def mget(self, keys: List[str]) -> Dict[str, str]:
+        if not keys:
+            return {}
+        return dict(zip(keys, await self._get_client().mget(keys)))
+
+    async def mset_json(self, mapping: Dict[str, dict], time_to_live_sec: int = None):
+        await self.mset({key: json.dumps(value) for key, value in mapping.items()},
+                        time_to_live_sec=time_to_live_sec)
+
+    async def mget_json(self, keys: List[str]) -> Dict[str, Optional[dict]]:
+        if not keys:
+            return {}
+        pipe = self._get_client().pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+            pipe.ttl(key)
+        results = await pipe.execute()
+        return {key: RedisDataManager._load_json(results[2 * i], results[2 * i + 1])
+                for i, key in enumerate(keys)}
+
+
+class _PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """
+    统计 pymongo 连接池的连接数量（创建、关闭、借出、归还）。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checkout_failed = 0
+
+    def _incr(self, name, delta=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + delta)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._incr("created")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._incr("closed")
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._incr("checkout_failed")
+
+    def connection_checked_out(self, event):
+        self._incr("checked_out")
+
+    def connection_checked_in(self, event):
+        self._incr("checked_out", -1)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "connections_open": self.created - self.closed,
+                "connections_created": self.created,
+                "connections_closed": self.closed,
+                "connections_in_use": self.checked_out,
+                "checkout_failed": self.checkout_failed,
+            }
+
+
+class MongoClientPool:
+    """
+    进程级共享的 MongoDB 客户端（同步 pymongo 与异步 Motor 各一个）。
+    所有 MongoDBDataManager / AsyncMongoDBDataManager 通过 acquire/release 借用客户端，
+    close() 只归还租约，不会断开底层连接。
+    """
+
+    def __init__(self, config=None):
+        self.config = config or settings.mongodb
+        self._lock = threading.Lock()
+        self._client: Optional[pymongo.MongoClient] = None
+        self._async_clients = {}  # event loop -> AsyncIOMotorClient
+        self._listener = _PoolMetricsListener()
+        self._last_health_check = 0.0
+        self._leases = 0
+        self._async_leases = 0
+        self._total_acquired = 0
+
+    def _client_options(self) -> dict:
+        return dict(
+            host=self.config.host,
+            port=self.config.port,
+            maxPoolSize=self.config.max_pool_size,
+            minPoolSize=self.config.min_pool_size,
+            maxIdleTimeMS=self.config.max_idle_time_ms,
+            serverSelectionTimeoutMS=self.config.server_selection_timeout_ms,
+        )
+
+    def _health_check(self, client: pymongo.MongoClient, force=False):
+        interval = self.config.health_check_interval_sec
+        now_ = time.monotonic()
+        if not force and now_ - self._last_health_check < interval:
+            return
+        client.admin.command("ping")
+        self._last_health_check = now_
+
+    def acquire(self) -> pymongo.MongoClient:
+        with self._lock:
+            try:
+                if self._client is None:
+                    logger.info(f"Creating shared MongoDB client {self.config.host}:{self.config.port} "
+                                f"(maxPoolSize={self.config.max_pool_size})")
+                    self._client = pymongo.MongoClient(event_listeners=[self._listener],
+                                                       **self._client_options())
+                    self._health_check(self._client, force=True)
+                else:
+                    self._health_check(self._client)
+            except ServerSelectionTimeoutError as e:
+                logger.error(f"Error connecting to MongoDB: {e}")
+                raise RuntimeError("Error connecting to MongoDB")
+            self._leases += 1
+            self._total_acquired += 1
+            return self._client
+
+    def release(self):
+        with self._lock:
+            self._leases = max(self._leases - 1, 0)
+
+    def acquire_async(self) -> motor.motor_asyncio.AsyncIOMotorClient:
+        # Motor 客户端绑定事件循环，因此每个事件循环各持有一个客户端
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            for stale_client in pop_closed_loops(self._async_clients):
+                stale_client.close()
+            client = self._async_clients.get(loop)
+            if client is None:
+                logger.info(f"Creating shared async MongoDB client {self.config.host}:{self.config.port}")
+                client = motor.motor_asyncio.AsyncIOMotorClient(io_loop=loop, **self._client_options())
+                self._async_clients[loop] = client
+            self._async_leases += 1
+            self._total_acquired += 1
+            return client
+
+    def release_async(self):
+        with self._lock:
+            self._async_leases = max(self._async_leases - 1, 0)
+
+    async def close_async(self):
+        """
+        关闭当前事件循环的 Motor 客户端。短生命周期的事件循环（脚本中的 asyncio.run）结束前调用。
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.pop(loop, None)
+        if client is not None:
+            client.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = {
+                "host": f"{self.config.host}:{self.config.port}",
+                "max_pool_size": self.config.max_pool_size,
+                "min_pool_size": self.config.min_pool_size,
+                "sync_client": self._client is not None,
+                "async_clients": len(self._async_clients),
+                "active_leases": self._leases,
+                "active_async_leases": self._async_leases,
+                "total_acquired": self._total_acquired,
+            }
+        data.update(self._listener.to_dict())
+        return data
+
+    def close(self):
+        """
+        关闭所有共享客户端，仅在进程退出时调用。
+        """
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+            for client in self._async_clients.values():
+                client.close()
+            self._async_clients.clear()
+
+
+mongo_pool = MongoClientPool()
+
+
+class MongoIndexRegistry:
+    """
+    数据管理类声明的 MongoDB 索引登记表。
+    数据管理类通过类属性 INDEXES = {collection_name: [IndexModel, ...]} 声明索引，
+    并用 @mongo_index_registry.register 注册。
+    """
+
+    def __init__(self):
+        self._managers = []
+
+    def register(self, manager_cls):
+        if manager_cls not in self._managers:
+            self._managers.append(manager_cls)
+        return manager_cls
+
+    def specs(self) -> Dict[tuple, List[pymongo.IndexModel]]:
+        """
+        :return: {(db_name, collection_name): [IndexModel, ...]}
+        """
+        specs = {}
+        for manager_cls in self._managers:
+            db_name = manager_cls().db_name
+            for collection_name, indexes in manager_cls.INDEXES.items():
+                models = specs.setdefault((db_name, collection_name), [])
+                names = {m.document['name'] for m in models}
+                models.extend(m for m in indexes if m.document['name'] not in names)
+        return specs
+
+    def ensure_indexes(self, client: pymongo.MongoClient) -> List[dict]:
+        """
+        创建缺失的索引（幂等）。
+        :return: 每个集合新建的索引名
+        """
+        results = []
+        for (db_name, collection_name), models in self.specs().items():
+            collection = client[db_name][collection_name]
+            existing = set(collection.index_information().keys())
+            missing = [m for m in models if m.document['name'] not in existing]
+            if missing:
+                logger.info(f"Creating indexes on {db_name}.{collection_name}: "
+                            f"{[m.document['name'] for m in missing]}")
+                collection.create_indexes(missing)
+            results.append(dict(collection=f"{db_name}.{collection_name}",
+                                created=[m.document['name'] for m in missing]))
+        return results
+
+    def report(self, client: pymongo.MongoClient) -> List[dict]:
+        """
+        报告每个集合中未使用（自统计开始后 ops 为 0）、冗余（键是另一索引的前缀）以及未声明的索引。
+        """
+        results = []
+        for (db_name, collection_name), models in self.specs().items():
+            collection = client[db_name][collection_name]
+            info = collection.index_information()
+            declared = {m.document['name'] for m in models}
+            ops = {s['name']: s['accesses']['ops']
+                   for s in collection.aggregate([{"$indexStats": {}}])}
+            keys = {name: list(idx['key']) for name, idx in info.items()}
+            redundant = []
+            for name, key in keys.items():
+                if name == '_id_' or info[name].get('unique'):
+                    continue
+                for other, other_key in keys.items():
+                    if other != name and len(other_key) > len(key) and other_key[:len(key)] == key:
+                        redundant.append(dict(index=name, covered_by=other))
+                        break
+            results.append(dict(
+                collection=f"{db_name}.{collection_name}",
+                unused=[name for name in info if name != '_id_' and ops.get(name, 0) == 0],
+                redundant=redundant,
+                undeclared=[name for name in info if name != '_id_' and name not in declared],
+                missing=sorted(declared - set(info.keys())),
+            ))
+        return results
+
+
+mongo_index_registry = MongoIndexRegistry()
+
+
+def encode_page_cursor(values: list) -> str:
+    """
+    不透明的分页游标：最后一条记录的排序键值和 _id。
+    """
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode()).decode()
+
+
+def decode_page_cursor(cursor: str) -> list:
+    """
+    :raises ValueError: 游标无效
+    """
+    try:
+        values = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid page cursor: {cursor}") from e
+    if not isinstance(values, list) or len(values) != 2:
+        raise ValueError(f"Invalid page cursor: {cursor}")
+    return values
+
+
+def keyset_filter(sort_key: str, direction: int, last_value, last_id) -> dict:
+    """
+    按 (sort_key, _id) 排序时，位于 (last_value, last_id) 之后的文档。
+    """
+    op = "$gt" if direction == pymongo.ASCENDING else "$lt"
+    if sort_key == "_id":
+        return {"_id": {op: last_id}}
+    return {"$or": [{sort_key: {op: last_value}}, {sort_key: last_value, "_id": {op: last_id}}]}
+
+
+def _get_path(document: dict, path: str):
+    value = document
+    for key in path.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    return value
 
 
 class MongoDBDataManager:
+    INDEXES: Dict[str, List[pymongo.IndexModel]] = {}
+    # 命名的投影预设，例如 {"list": {"data.name": 1, ...}}
+    PROJECTIONS: Dict[str, dict] = {}
 
     def __init__(self):
         self.db_host = settings.mongodb.host
         self.db_port = settings.mongodb.port
         self.db_client = None
+        self._leased = False
 
     def connect(self):
-        # Connect to MongoDB
-        try:
-            self.db_client = pymongo.MongoClient(self.db_host, self.db_port, serverSelectionTimeoutMS=10000)  # Connect
-            names = self.db_client.list_database_names()
-        except ServerSelectionTimeoutError as e:
-            logger.error(f"Error connecting to MongoDB: {e}")
-            raise RuntimeError("Error connecting to MongoDB")
+        # Borrow the shared client of this process
+        if not self._leased:
+            self.db_client = mongo_pool.acquire()
+            self._leased = True
         return self
 
     def get_client(self):
@@ -157,6 +652,18 @@ class MongoDBDataManager:
 
     def set_client(self, client):
         self.db_client = client
+
+    def resolve_projection(self, projection):
+        """
+        :param projection: None（返回完整文档）、预设名称（见 PROJECTIONS）或 MongoDB 投影
+        """
+        if projection is None or not isinstance(projection, str):
+            return projection
+        if projection not in self.PROJECTIONS:
+            raise ValueError(f"Unknown projection preset '{projection}' of {type(self).__name__}, "
+                             f"available: {list(self.PROJECTIONS.keys())}")
+        return self.PROJECTIONS[projection]
+
     def __enter__(self):
         self.connect()
         return self
@@ -166,8 +673,10 @@ class MongoDBDataManager:
         del self
 
     def close(self):
-        if self.db_client:
-            self.db_client.close()
+        # Release the lease only, the shared client stays connected
+        if self._leased:
+            mongo_pool.release()
+            self._leased = False
 
     def delete_random_documents(
         self,
@@ -213,6 +722,70 @@ class MongoDBDataManager:
         logger.info(f"已删除 {result.deleted_count} 条文档。")
         return result.deleted_count
 
+    def query_field_by_ids(self, database_name: str, collection_name: str,
+                           ids: list, field: str) -> dict:
+        """
+        只投影一个字段，按 _id 批量查询。
+        :return: {_id: value}，字段不存在时 value 为 None
+        """
+        collection = self.db_client[database_name][collection_name]
+        cursor = collection.find({"_id": {"$in": list(ids)}}, projection={field: 1})
+        result = {}
+        for doc in cursor:
+            value = doc
+            for key in field.split('.'):
+                value = value.get(key) if isinstance(value, dict) else None
+            result[doc["_id"]] = value
+        return result
+
+    def query_ids(self, database_name: str, collection_name: str, filter_: dict) -> list:
+        collection = self.db_client[database_name][collection_name]
+        return [doc["_id"] for doc in collection.find(filter_, projection={"_id": 1})]
+
+    def delete_documents_by_ids(self, database_name: str, collection_name: str, ids: list) -> int:
+        if not ids:
+            return 0
+        collection = self.db_client[database_name][collection_name]
+        result = collection.delete_many({"_id": {"$in": list(ids)}})
+        logger.info(f"Deleted {result.deleted_count} documents from {database_name}.{collection_name}")
+        return result.deleted_count
+
+    def query_page(self, database_name: str, collection_name: str, filter_: dict, limit: int,
+                   cursor: str = None, sort_key: str = "_id", direction: int = pymongo.ASCENDING,
+                   projection=None) -> tuple:
+        """
+        Keyset 分页：按 (sort_key, _id) 排序，从游标位置继续读取，代价与页深无关（skip 随页深线性增长）。
+        集合需要以 sort_key, _id 结尾的索引；sort_key 在所有文档中都应存在，投影需包含 sort_key。
+        :param cursor: 上一页返回的游标，None 表示第一页
+        :return: (documents, next_cursor)，没有下一页时 next_cursor 为 None
+        :raises ValueError: 游标无效
+        """
+        if cursor:
+            last_value, last_id = decode_page_cursor(cursor)
+            filter_ = {"$and": [filter_ or {}, keyset_filter(sort_key, direction, last_value, last_id)]}
+        sort = [(sort_key, direction)] if sort_key == "_id" else [(sort_key, direction), ("_id", direction)]
+        collection = self.db_client[database_name][collection_name]
+        documents = list(collection.find(filter_, projection=self.resolve_projection(projection))
+                         .sort(sort).limit(limit + 1))
+        if len(documents) <= limit:
+            return documents, None
+        documents = documents[:limit]
+        last = documents[-1]
+        return documents, encode_page_cursor([_get_path(last, sort_key), last["_id"]])
+
+    def bulk_upsert_documents(self, database_name: str, collection_name: str,
+                              ids: list, documents: List[dict]):
+        """
+        用一次 bulk_write 按 _id 批量 upsert 文档。
+        :return: BulkWriteResult，没有文档时返回 None
+        """
+        collection = self.db_client[database_name][collection_name]
+        operations = [pymongo.UpdateOne({"_id": id_}, {"$set": document}, upsert=True)
+                      for id_, document in zip(ids, documents)]
+        if not operations:
+            return None
+        return collection.bulk_write(operations, ordered=False)
+
 class OrderQueryParams:
     limit: int = 100
     offset: int = 0
@@ -286,13 +859,14 @@ class ShipmentMongoDBDataManager(MongoDBDataManager):
         return ";".join(shipment.references)
 
 
-import motor.motor_asyncio
-
 class AsyncMongoDBDataManager:
+    INDEXES: Dict[str, List[pymongo.IndexModel]] = {}
+
     def __init__(self):
         self.db_host = settings.mongodb.host
         self.db_port = settings.mongodb.port
         self.db_client = None
+        self._leased = False
 
     def get_client(self):
         return self.db_client
@@ -305,17 +879,18 @@ class AsyncMongoDBDataManager:
         await self.close()
 
     async def close(self):
-        if self.db_client:
-            self.db_client.close()
-            self.db_client = None
+        if self._leased:
+            mongo_pool.release_async()
+            self._leased = False
+        self.db_client = None
 
     async def connect(self):
+        if self._leased:
+            return self
         try:
-            host = f"mongodb://{self.db_host}:{self.db_port}"
-            self.db_client = motor.motor_asyncio.AsyncIOMotorClient(host)  # Connect
-            # names = self.db_client.list_database_names()
+            self.db_client = mongo_pool.acquire_async()
+            self._leased = True
         except Exception as e:
             logger.error(f"Error connecting to MongoDB: {e}")
             raise RuntimeError("Error connecting to MongoDB") from e
         return self
-
@@ -1,8 +1,9 @@
-from typing import List
+from typing import List, Tuple
 
+from pymongo import IndexModel, ASCENDING, DESCENDING
 from pymongo.collection import Collection
 
-from core.db import OrderMongoDBDataManager, MongoDBDataManager
+from core.db import OrderMongoDBDataManager, MongoDBDataManager, mongo_index_registry
 from core.log import logger
 from external.amazon import AmazonAddress
 from models.orders import StandardOrder, OrderItem
@@ -10,8 +11,18 @@ from models.shipment import Address
 from utils.stringutils import jsonpath, isEmpty
 
 
+@mongo_index_registry.register
 class AmazonOrderMongoDB(OrderMongoDBDataManager):
 
+    INDEXES = {
+        "orders": [
+            IndexModel([("order.PurchaseDate", DESCENDING)]),
+            IndexModel([("order.OrderStatus", ASCENDING), ("order.FulfillmentChannel", ASCENDING),
+                        ("account_id", ASCENDING), ("order.PurchaseDate", DESCENDING)]),
+            IndexModel([("account_id", ASCENDING), ("order.PurchaseDate", DESCENDING), ("_id", DESCENDING)]),
+        ]
+    }
+
     def __init__(self):
         super().__init__()
         self.db_name = "amazon_data"
@@ -41,6 +52,19 @@ class AmazonOrderMongoDB(OrderMongoDBDataManager):
         results = [self.to_standard_order(r) for r in results]
         return results
 
+    def query_orders_page(self, filter_: dict, limit: int = 100, cursor: str = None) -> Tuple[List[StandardOrder], str]:
+        """
+        Keyset pagination of orders, newest first (order.PurchaseDate, _id).
+        :param cursor: next_cursor of the previous page
+        :return: (orders, next_cursor), next_cursor is None on the last page
+        """
+        results, next_cursor = self.query_page(self.db_name, self.db_collection_name, filter_, limit, cursor,
+                                               sort_key="order.PurchaseDate", direction=DESCENDING)
+        return [self.to_standard_order(r) for r in results], next_cursor
+
+    def count_orders(self, filter_: dict) -> int:
+        return self.get_db_collection().count_documents(filter_)
+
     def query_order_by_id(self, id: str, *args, **kwargs) -> StandardOrder:
         result = self.query_orders_by_ids([id])
         return result[0] if result else None
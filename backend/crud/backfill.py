@@ -0,0 +1,31 @@
+"""
+一次性的数据回填，部署新版本后手动运行一次。
+
+命令行用法：
+    ENV=dev python -m crud.backfill contact-locations   # 为旧联系人文档生成 GeoJSON location（附近客户查询所需）
+"""
+import argparse
+
+from core.db import mongo_pool
+from core.log import logger
+from crud.odoo import OdooContactMongoDB
+
+
+def backfill_contact_locations() -> int:
+    with OdooContactMongoDB() as mdb_contact:
+        backfilled = mdb_contact.backfill_locations()
+    logger.info(f"Backfilled geo locations of {backfilled} contacts")
+    return backfilled
+
+
+BACKFILLS = {
+    "contact-locations": backfill_contact_locations,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run one-off MongoDB data backfills")
+    parser.add_argument("name", choices=sorted(BACKFILLS.keys()))
+    args = parser.parse_args()
+    print(f"{args.name}: {BACKFILLS[args.name]()} documents updated")
+    mongo_pool.close()
@@ -1,12 +1,22 @@
-from typing import List
+from typing import List, Tuple
 
-from core.db import ShipmentMongoDBDataManager
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+from core.db import ShipmentMongoDBDataManager, mongo_index_registry
 from models.shipment import StandardShipment, Event
 from utils.stringutils import jsonpath
 
 
+@mongo_index_registry.register
 class GlsShipmentMongoDB(ShipmentMongoDBDataManager):
 
+    INDEXES = {
+        "shipments": [
+            IndexModel([("details.carrier", ASCENDING), ("_id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("details.createdAt", DESCENDING), ("_id", DESCENDING)]),
+        ]
+    }
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.carrier_name = "gls"
@@ -29,6 +39,18 @@ class GlsShipmentMongoDB(ShipmentMongoDBDataManager):
         result = list(result)
         return list(map(lambda x: self.to_standard_shipment(x), result))
 
+    def query_shipments_page(self, filter_: dict, limit: int = 100,
+                             cursor: str = None) -> Tuple[List[StandardShipment], str]:
+        """
+        Keyset pagination of shipments, newest first (details.createdAt, _id).
+        :param cursor: next_cursor of the previous page
+        :return: (shipments, next_cursor), next_cursor is None on the last page
+        """
+        filter_ = {**filter_, "details.carrier": self.carrier_name}
+        result, next_cursor = self.query_page(self.db_name, self.db_collection_name, filter_, limit, cursor,
+                                              sort_key="details.createdAt", direction=DESCENDING)
+        return [self.to_standard_shipment(x) for x in result], next_cursor
+
     def query_shipment_by_id(self, id: str) -> StandardShipment:
         """
         Find shipment data in database by reference number.
@@ -0,0 +1,51 @@
+"""
+MongoDB 索引引导。
+各数据管理类通过 INDEXES 声明所需索引，这里统一创建缺失的索引并生成索引报告。
+
+命令行用法：
+    ENV=dev python -m crud.indexes            # 创建缺失的索引
+    ENV=dev python -m crud.indexes --report   # 报告未使用 / 冗余 / 未声明 / 缺失的索引
+"""
+import argparse
+import json
+from typing import List
+
+from core.db import mongo_pool, mongo_index_registry
+from core.log import logger
+
+# 导入即注册
+import crud.amazon  # noqa: F401
+import crud.gls  # noqa: F401
+import crud.lingxing  # noqa: F401
+import crud.odoo  # noqa: F401
+import crud.woocommerce  # noqa: F401
+
+
+def ensure_all_indexes() -> List[dict]:
+    client = mongo_pool.acquire()
+    try:
+        results = mongo_index_registry.ensure_indexes(client)
+    finally:
+        mongo_pool.release()
+    logger.info(f"MongoDB indexes ensured: {results}")
+    return results
+
+
+def report_indexes() -> List[dict]:
+    client = mongo_pool.acquire()
+    try:
+        return mongo_index_registry.report(client)
+    finally:
+        mongo_pool.release()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Bootstrap declared MongoDB indexes")
+    parser.add_argument("--report", action="store_true",
+                        help="Report unused, redundant, undeclared and missing indexes instead of creating them")
+    args = parser.parse_args()
+    if args.report:
+        print(json.dumps(report_indexes(), indent=2, default=str))
+    else:
+        print(json.dumps(ensure_all_indexes(), indent=2, default=str))
+    mongo_pool.close()
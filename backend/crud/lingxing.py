@@ -1,9 +1,9 @@
 from typing import List
 
-from pymongo import UpdateOne
+from pymongo import UpdateOne, IndexModel, ASCENDING, DESCENDING
 
 from core.log import logger
-from core.db import AsyncMongoDBDataManager
+from core.db import AsyncMongoDBDataManager, mongo_index_registry
 
 
 
@@ -36,8 +36,17 @@ async def bulk_upsert(
         logger.error(f"Failed to upsert documents: {e}")
         raise
 
+@mongo_index_registry.register
 class AsyncLingxingListingDB(AsyncMongoDBDataManager):
 
+    INDEXES = {
+        "listings": [
+            IndexModel([("data.fnsku", ASCENDING), ("data.is_delete", ASCENDING)]),
+            IndexModel([("data.seller_sku", ASCENDING), ("data.is_delete", ASCENDING)]),
+            IndexModel([("data.sid", ASCENDING), ("data.is_delete", ASCENDING)]),
+        ]
+    }
+
     def __init__(self):
         super().__init__()
         self.db_name = "lingxing_data"
@@ -150,7 +159,20 @@ class AsyncLingxingBasicDataDB(AsyncMongoDBDataManager):
         return result
 
 
+@mongo_index_registry.register
 class AsyncLingxingInventoryDB(AsyncMongoDBDataManager):
+
+    INDEXES = {
+        "inventory": [
+            IndexModel([("data.wid", ASCENDING)]),
+            IndexModel([("data.sku", ASCENDING), ("data.wid", ASCENDING)]),
+        ],
+        "inventory_bin": [
+            IndexModel([("data.wid", ASCENDING)]),
+            IndexModel([("data.sku", ASCENDING)]),
+            IndexModel([("data.whb_id", ASCENDING)]),
+        ],
+    }
     def __init__(self):
         super().__init__()
         self.db_name = "lingxing_data"
@@ -245,8 +267,15 @@ class AsyncLingxingInventoryDB(AsyncMongoDBDataManager):
         return result
 
 
+@mongo_index_registry.register
 class AsyncLingxingFbaShipmentPlanDB(AsyncMongoDBDataManager):
 
+    INDEXES = {
+        "fba_shipment_plan": [
+            IndexModel([("data.seq", ASCENDING)]),
+        ]
+    }
+
     def __init__(self):
         super().__init__()
         self.db_name = "lingxing_data"
@@ -285,7 +314,18 @@ class AsyncLingxingFbaShipmentPlanDB(AsyncMongoDBDataManager):
         return result
 
 
+@mongo_index_registry.register
 class AsyncLingxingOrderDB(AsyncMongoDBDataManager):
+
+    INDEXES = {
+        "orders": [
+            IndexModel([("data.purchase_date_local", DESCENDING)]),
+        ],
+        "order_details": [
+            IndexModel([("data.purchase_date_local", DESCENDING)]),
+            IndexModel([("data.is_business_order", ASCENDING), ("data.purchase_date_local", DESCENDING)]),
+        ],
+    }
     def __init__(self):
         super().__init__()
         self.db_name = "lingxing_data"
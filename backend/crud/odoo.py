@@ -1,8 +1,136 @@
+import datetime
+import uuid
 from typing import List, Optional
-from pymongo import UpdateOne
-from core.db import MongoDBDataManager
+from pymongo import UpdateOne, ReplaceOne, DeleteMany, IndexModel, ASCENDING, GEOSPHERE
+from core.db import MongoDBDataManager, mongo_index_registry, keyset_filter
+import utils.time as time_utils
+
+
+def data_fields(*fields) -> dict:
+    """
+    投影：文档元数据加上 data 中的指定字段。
+    """
+    projection = {"_id": 1, "alias": 1, "fetchedAt": 1, "createdAt": 1}
+    projection.update({f"data.{field}": 1 for field in fields})
+    return projection
+
+
+# 产品列表与条码扫描共用的字段
+PRODUCT_LIST_FIELDS = ('id', 'name', 'default_code', 'barcode', 'standard_price', 'list_price', 'description',
+                       'weight', 'uom_name', 'active', 'type', 'qty_available', 'image_digest', 'write_date')
+
+# 删除记录的墓碑保留天数，更早同步过的客户端需要重新全量下载
+TOMBSTONE_RETENTION_DAYS = 30
+# 与 MongoDB 球面几何（$geoNear 的 maxDistance）使用的地球半径一致，count_nearby 和 query_nearby 的结果才能对上
+EARTH_RADIUS_KM = 6378.1
+
+
+def to_geo_point(contact_data: dict) -> Optional[dict]:
+    """
+    Odoo 联系人坐标 -> GeoJSON Point。Odoo 未定位的联系人坐标为 0，返回 None。
+    """
+    longitude = contact_data.get("partner_longitude") or 0
+    latitude = contact_data.get("partner_latitude") or 0
+    if (longitude == 0 and latitude == 0) or not (-180 <= longitude <= 180 and -90 <= latitude <= 90):
+        return None
+    return {"type": "Point", "coordinates": [longitude, latitude]}
+
+
+@mongo_index_registry.register
+class OdooSyncTombstoneMongoDB(MongoDBDataManager):
+    """
+    已从本地删除的 Odoo 记录（墓碑），供客户端增量同步时删除本地缓存。过期后由 TTL 索引清除。
+    """
+
+    INDEXES = {
+        "sync.tombstone": [
+            IndexModel([("alias", ASCENDING), ("model", ASCENDING), ("deletedAt", ASCENDING)]),
+            IndexModel([("expiresAt", ASCENDING)], expireAfterSeconds=0),
+        ]
+    }
 
-class OdooContactMongoDB(MongoDBDataManager):
+    def __init__(self):
+        super().__init__()
+        self.db_name = "odoo_data"
+        self.db_collection_name = "sync.tombstone"
+
+    def get_db_collection(self):
+        return self.db_client[self.db_name][self.db_collection_name]
+
+    def save_tombstones(self, model: str, alias_by_id: dict):
+        """
+        :param alias_by_id: {记录 id: alias}
+        """
+        deleted_at = time_utils.now()
+        expires_at = datetime.datetime.now() + datetime.timedelta(days=TOMBSTONE_RETENTION_DAYS)
+        ids = [f"{alias}:{model}:{id_}" for id_, alias in alias_by_id.items()]
+        documents = [dict(alias=alias, model=model, recordId=id_, deletedAt=deleted_at, expiresAt=expires_at)
+                     for id_, alias in alias_by_id.items()]
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, ids, documents)
+
+    def query_deleted_ids(self, alias: str, model: str, since: str) -> List[int]:
+        cursor = self.get_db_collection().find({"alias": alias, "model": model, "deletedAt": {"$gte": since}},
+                                               projection={"recordId": 1})
+        return [doc["recordId"] for doc in cursor]
+
+
+class DeltaSyncMixin:
+    """
+    客户端增量同步：按 (fetchedAt, _id) 升序分页读取变更的文档，删除文档时留下墓碑。
+    集合需要 (alias, fetchedAt, _id) 索引。
+    """
+
+    def query_changes(self, alias: str, fetched_at: str, after_id=None, limit: int = 1000,
+                      projection=None) -> List[dict]:
+        """
+        :param fetched_at: 返回 fetchedAt 不早于此时间的文档
+        :param after_id: 与 fetched_at 组成 keyset，从 (fetched_at, after_id) 之后继续
+        """
+        if after_id is None:
+            filter_ = {"alias": alias, "fetchedAt": {"$gte": fetched_at}}
+        else:
+            filter_ = {"alias": alias, **keyset_filter("fetchedAt", ASCENDING, fetched_at, after_id)}
+        cursor = self.get_db_collection().find(filter_, projection=self.resolve_projection(projection))
+        return list(cursor.sort([("fetchedAt", ASCENDING), ("_id", ASCENDING)]).limit(limit))
+
+    def query_deleted_ids(self, alias: str, since: str) -> List[int]:
+        mdb_tombstone = OdooSyncTombstoneMongoDB()
+        mdb_tombstone.set_client(self.db_client)
+        return mdb_tombstone.query_deleted_ids(alias, self.db_collection_name, since)
+
+    def delete_by_ids(self, ids: List[int]) -> int:
+        if not ids:
+            return 0
+        alias_by_id = self.query_field_by_ids(self.db_name, self.db_collection_name, list(ids), "alias")
+        mdb_tombstone = OdooSyncTombstoneMongoDB()
+        mdb_tombstone.set_client(self.db_client)
+        mdb_tombstone.save_tombstones(self.db_collection_name, alias_by_id)
+        return self.delete_documents_by_ids(self.db_name, self.db_collection_name, ids)
+
+
+@mongo_index_registry.register
+class OdooContactMongoDB(DeltaSyncMixin, MongoDBDataManager):
+
+    INDEXES = {
+        "res.partner": [
+            IndexModel([("alias", ASCENDING), ("data.id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.write_date", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.active", ASCENDING),
+                        ("data.is_company", ASCENDING), ("data.customer_rank", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.x_studio_vip_id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("fetchedAt", ASCENDING), ("_id", ASCENDING)]),
+            # 没有坐标的联系人 location 为 null，不进入 2dsphere 索引
+            IndexModel([("location", GEOSPHERE), ("alias", ASCENDING)]),
+        ]
+    }
+
+    PROJECTIONS = {
+        "list": data_fields('id', 'name', 'complete_name', 'is_company', 'parent_name', 'ref', 'street', 'street2',
+                            'zip', 'city', 'country_code', 'email', 'phone', 'mobile', 'active', 'write_date'),
+        "geo": data_fields('id', 'complete_name', 'industry_id', 'email', 'phone', 'mobile', 'street', 'street2',
+                           'zip', 'city', 'country_code', 'customer_rank', 'total_invoiced', 'active',
+                           'partner_longitude', 'partner_latitude', 'user_id', 'is_company'),
+    }
 
     def __init__(self):
         super().__init__()
@@ -12,28 +140,35 @@ class OdooContactMongoDB(MongoDBDataManager):
     def get_db_collection(self):
         return self.db_client[self.db_name][self.db_collection_name]
 
-    def query_contacts(self, offset: int = 0, limit: int = None, *args, **kwargs):
+    def query_contacts(self, offset: int = 0, limit: int = None, projection=None, *args, **kwargs):
         collection = self.get_db_collection()
-        results = collection.find(**kwargs)
+        results = collection.find(projection=self.resolve_projection(projection), **kwargs)
         if limit is not None:
             results = results.limit(limit)
         if offset > 0:
             results = results.skip(offset)
         return list(results)
 
-    def query_contact_by_ids(self, ids: List[int]):
+    def query_contacts_page(self, filter_: dict, limit: int, cursor: str = None, projection=None):
+        """
+        :return: (contacts, next_cursor)，按 _id 排序
+        """
+        return self.query_page(self.db_name, self.db_collection_name, filter_, limit, cursor, projection=projection)
+
+    def query_contact_by_ids(self, ids: List[int], projection=None):
         filter_ = {"_id": {"$in": ids}}
-        contacts = list(self.query_contacts(filter=filter_, limit=len(ids)))
+        contacts = list(self.query_contacts(filter=filter_, limit=len(ids), projection=projection))
         # TODO Sort the contacts by the given ids
         # if len(contacts) > 0:
         #     contact_dict = {}
         return contacts
 
-    def query_contact_by_id(self, id: int):
-        result = self.query_contact_by_ids(ids=[id])
+    def query_contact_by_id(self, id: int, projection=None):
+        result = self.query_contact_by_ids(ids=[id], projection=projection)
         return result[0] if result else None
 
     def save_contact(self, contact_id, document):
+        document["location"] = to_geo_point(document["data"])
         collection = self.get_db_collection()
         result = collection.update_one(
             {"_id": contact_id},
@@ -42,6 +177,64 @@ class OdooContactMongoDB(MongoDBDataManager):
         )
         return result
 
+    def save_contacts(self, contact_ids, documents):
+        for document in documents:
+            document["location"] = to_geo_point(document["data"])
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, contact_ids, documents)
+
+    def backfill_locations(self) -> int:
+        """
+        为还没有 location 字段的联系人（旧数据）生成 GeoJSON 坐标。一次性运行：python -m crud.backfill contact-locations
+        :return: 更新的文档数
+        """
+        collection = self.get_db_collection()
+        cursor = collection.find({"location": {"$exists": False}},
+                                 projection={"data.partner_longitude": 1, "data.partner_latitude": 1})
+        operations = [UpdateOne({"_id": doc["_id"]}, {"$set": {"location": to_geo_point(doc.get("data", {}))}})
+                      for doc in cursor]
+        for i in range(0, len(operations), 1000):
+            collection.bulk_write(operations[i:i + 1000], ordered=False)
+        return len(operations)
+
+    def query_nearby(self, alias: str, longitude: float, latitude: float, max_km: float = None,
+                     filter_: dict = None, offset: int = 0, limit: int = None, projection=None) -> List[dict]:
+        """
+        按距离从近到远返回联系人，文档增加 km_distance 字段（公里）。
+        :param max_km: 最大距离，None 表示不限（配合 limit 查询最近的 k 个）
+        :param filter_: 附加的查询条件，在 $geoNear 中执行
+        """
+        geo_near = {
+            "near": {"type": "Point", "coordinates": [longitude, latitude]},
+            "key": "location",
+            "distanceField": "km_distance",
+            "distanceMultiplier": 0.001,
+            "spherical": True,
+            "query": {"alias": alias, **(filter_ or {})},
+        }
+        if max_km is not None:
+            geo_near["maxDistance"] = max_km * 1000
+        pipeline = [{"$geoNear": geo_near}]
+        if offset > 0:
+            pipeline.append({"$skip": offset})
+        if limit is not None:
+            pipeline.append({"$limit": limit})
+        projection = self.resolve_projection(projection)
+        if projection:
+            pipeline.append({"$project": {**projection, "km_distance": 1}})
+        return list(self.get_db_collection().aggregate(pipeline))
+
+    def count_nearby(self, alias: str, longitude: float, latitude: float, max_km: float,
+                     filter_: dict = None) -> int:
+        filter_ = {"alias": alias, **(filter_ or {}),
+                   "location": {"$geoWithin": {"$centerSphere": [[longitude, latitude], max_km / EARTH_RADIUS_KM]}}}
+        return self.get_db_collection().count_documents(filter_)
+
+    def query_write_dates(self, ids: List[int]) -> dict:
+        return self.query_field_by_ids(self.db_name, self.db_collection_name, ids, "data.write_date")
+
+    def query_ids_by_alias(self, alias: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias})
+
     def to_standard_contact(self, contact: dict):
         # TODO: To Standard Contact Object
         pass
@@ -54,7 +247,23 @@ class OdooContactMongoDB(MongoDBDataManager):
         )
 
 
-class OdooProductTemplateMongoDB(MongoDBDataManager):
+@mongo_index_registry.register
+class OdooProductTemplateMongoDB(DeltaSyncMixin, MongoDBDataManager):
+
+    INDEXES = {
+        "product.template": [
+            IndexModel([("alias", ASCENDING), ("data.id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.write_date", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.active", ASCENDING), ("data.type", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.default_code", ASCENDING)]),
+        ]
+    }
+
+    PROJECTIONS = {
+        "list": data_fields(*PRODUCT_LIST_FIELDS),
+        "scanner": data_fields(*PRODUCT_LIST_FIELDS, 'product_variant_id', 'packaging_ids',
+                               'image_1920'),  # image_1920: documents saved before the image store
+    }
 
     def __init__(self):
         super().__init__()
@@ -64,22 +273,22 @@ class OdooProductTemplateMongoDB(MongoDBDataManager):
     def get_db_collection(self):
         return self.db_client[self.db_name][self.db_collection_name]
 
-    def query_product_templates(self, offset: int = 0, limit=None, *args, **kwargs):
+    def query_product_templates(self, offset: int = 0, limit=None, projection=None, *args, **kwargs):
         collection = self.get_db_collection()
-        result = collection.find(**kwargs)
+        result = collection.find(projection=self.resolve_projection(projection), **kwargs)
         if offset > 0:
             result = result.skip(offset)
         if limit is not None:
             result = result.limit(limit)
         return list(result)
 
-    def query_product_template_by_ids(self, ids: List[int]):
+    def query_product_template_by_ids(self, ids: List[int], projection=None):
         filter_ = {"_id": {"$in": ids}}
-        product_templates = list(self.query_product_templates(filter=filter_, limit=len(ids)))
+        product_templates = list(self.query_product_templates(filter=filter_, limit=len(ids), projection=projection))
         return product_templates
 
-    def query_product_template_by_id(self, id: int):
-        result = self.query_product_template_by_ids(ids=[id])
+    def query_product_template_by_id(self, id: int, projection=None):
+        result = self.query_product_template_by_ids(ids=[id], projection=projection)
         return result[0] if result else None
 
     def save_product_template(self, product_templ_id, document):
@@ -91,6 +300,15 @@ class OdooProductTemplateMongoDB(MongoDBDataManager):
         )
         return result
 
+    def save_product_templates(self, product_templ_ids, documents):
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, product_templ_ids, documents)
+
+    def query_write_dates(self, ids: List[int]) -> dict:
+        return self.query_field_by_ids(self.db_name, self.db_collection_name, ids, "data.write_date")
+
+    def query_ids_by_alias(self, alias: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias})
+
     def to_standard_product(self, product_template: dict):
         #TODO: To Standard Product Object
         raise NotImplementedError
@@ -103,33 +321,57 @@ class OdooProductTemplateMongoDB(MongoDBDataManager):
         )
 
 
+@mongo_index_registry.register
 class OdooProductMongoDB(OdooProductTemplateMongoDB):
 
+    INDEXES = {
+        "product.product": [
+            IndexModel([("alias", ASCENDING), ("data.id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.write_date", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.active", ASCENDING), ("data.type", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.default_code", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.barcode", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("fetchedAt", ASCENDING), ("_id", ASCENDING)]),
+        ]
+    }
+
+    PROJECTIONS = {
+        "list": data_fields(*PRODUCT_LIST_FIELDS),
+        "scanner": data_fields(*PRODUCT_LIST_FIELDS, 'product_tmpl_id', 'stock_quant_ids', 'putaway_rule_ids',
+                               'packaging_ids', 'image_1920'),  # image_1920: documents saved before the image store
+    }
+
     def __init__(self):
         super().__init__()
         self.db_collection_name = "product.product"
 
-    def query_products(self, offset: int = 0, limit=None, *args, **kwargs):
+    def query_products(self, offset: int = 0, limit=None, projection=None, *args, **kwargs):
         # TODO: 实现查询产品的功能
         # return super().query_product_templates(offset, limit, *args, **kwargs)
 
         collection = self.get_db_collection()
-        result = collection.find(**kwargs)
+        result = collection.find(projection=self.resolve_projection(projection), **kwargs)
         if offset > 0:
             result = result.skip(offset)
         if limit is not None:
             result = result.limit(limit)
         return list(result)
 
-    def query_product_by_ids(self, ids: List[int]):
+    def query_products_page(self, filter_: dict, limit: int, cursor: str = None, projection=None):
+        """
+        :return: (products, next_cursor)，按 _id 排序
+        """
+        return self.query_page(self.db_name, self.db_collection_name, filter_, limit, cursor, projection=projection)
+
+    def query_product_by_ids(self, ids: List[int], projection=None):
         # TODO: 实现查询产品的功能
         filter_ = {"_id": {"$in": ids}}
-        products = list(self.query_products(filter=filter_, limit=len(ids)))
+        products = list(self.query_products(filter=filter_, limit=len(ids), projection=projection))
         return products
 
-    def query_product_by_id(self, id: int):
+    def query_product_by_id(self, id: int, projection=None):
         # TODO: 实现查询产品的功能
-        result = self.query_product_by_ids(ids=[id])
+        result = self.query_product_by_ids(ids=[id], projection=projection)
         return result[0] if result else None
 
     def save_product(self, product_id, document):
@@ -142,6 +384,18 @@ class OdooProductMongoDB(OdooProductTemplateMongoDB):
         )
         return result
 
+    def save_products(self, product_ids, documents):
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, product_ids, documents)
+
+    def query_write_dates(self, ids: List[int]) -> dict:
+        return self.query_field_by_ids(self.db_name, self.db_collection_name, ids, "data.write_date")
+
+    def query_ids_by_alias(self, alias: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias})
+
+    def query_ids_fetched_since(self, alias: str, since: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias, "fetchedAt": {"$gte": since}})
+
     def to_standard_product(self, product_template: dict):
         #TODO: To Standard Product Object
         raise NotImplementedError
@@ -152,7 +406,23 @@ class OdooProductMongoDB(OdooProductTemplateMongoDB):
         )
 
 
-class OdooPackagingMongoDB(MongoDBDataManager):
+@mongo_index_registry.register
+class OdooPackagingMongoDB(DeltaSyncMixin, MongoDBDataManager):
+
+    INDEXES = {
+        "product.packaging": [
+            IndexModel([("alias", ASCENDING), ("data.id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.write_date", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.barcode", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("fetchedAt", ASCENDING), ("_id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.product_id", ASCENDING)]),
+        ]
+    }
+
+    PROJECTIONS = {
+        "list": data_fields('id', 'name', 'product_id', 'qty', 'product_uom_id', 'barcode'),
+        "scanner": data_fields('id', 'name', 'product_id', 'qty', 'product_uom_id', 'barcode'),
+    }
 
     def __init__(self):
         super().__init__()
@@ -162,22 +432,22 @@ class OdooPackagingMongoDB(MongoDBDataManager):
     def get_db_collection(self):
         return self.db_client[self.db_name][self.db_collection_name]
 
-    def query_packagings(self, offset: int = 0, limit=None, *args, **kwargs):
+    def query_packagings(self, offset: int = 0, limit=None, projection=None, *args, **kwargs):
         collection = self.get_db_collection()
-        results = collection.find(**kwargs)
+        results = collection.find(projection=self.resolve_projection(projection), **kwargs)
         if limit is not None:
             results = results.limit(limit)
         if offset > 0:
             results = results.skip(offset)
         return list(results)
 
-    def query_packaging_by_ids(self, ids: List[int]):
+    def query_packaging_by_ids(self, ids: List[int], projection=None):
         filter_ = {"_id": {"$in": ids}}
-        packagings = list(self.query_packagings(filter=filter_, limit=len(ids)))
+        packagings = list(self.query_packagings(filter=filter_, limit=len(ids), projection=projection))
         return packagings
 
-    def query_packaging_by_id(self, id: int):
-        result = self.query_packaging_by_ids(ids=[id])
+    def query_packaging_by_id(self, id: int, projection=None):
+        result = self.query_packaging_by_ids(ids=[id], projection=projection)
         return result[0] if result else None
 
     def save_packaging(self, packaging_id, document):
@@ -189,6 +459,23 @@ class OdooPackagingMongoDB(MongoDBDataManager):
         )
         return result
 
+    def save_packagings(self, packaging_ids, documents):
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, packaging_ids, documents)
+
+    def query_write_dates(self, ids: List[int]) -> dict:
+        return self.query_field_by_ids(self.db_name, self.db_collection_name, ids, "data.write_date")
+
+    def query_ids_by_alias(self, alias: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias})
+
+    def query_product_ids_fetched_since(self, alias: str, since: str) -> List[int]:
+        return self.distinct_product_ids({"alias": alias, "fetchedAt": {"$gte": since}})
+
+    def distinct_product_ids(self, filter_: dict) -> List[int]:
+        # data.product_id 是 [id, name]，distinct 会同时返回名称
+        values = self.get_db_collection().distinct("data.product_id", filter_)
+        return [v for v in values if isinstance(v, int)]
+
     def delete_random_documents(self, **kwargs) -> Optional[int]:
         return super().delete_random_documents(
             database_name=self.db_name,
@@ -198,7 +485,23 @@ class OdooPackagingMongoDB(MongoDBDataManager):
 
 
 
-class OdooStorageLocationMongoDB(MongoDBDataManager):
+@mongo_index_registry.register
+class OdooStorageLocationMongoDB(DeltaSyncMixin, MongoDBDataManager):
+
+    INDEXES = {
+        "stock.location": [
+            IndexModel([("alias", ASCENDING), ("data.id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.write_date", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.barcode", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.active", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("fetchedAt", ASCENDING), ("_id", ASCENDING)]),
+        ]
+    }
+
+    PROJECTIONS = {
+        "list": data_fields('id', 'name', 'complete_name', 'barcode', 'usage', 'active', 'location_id', 'warehouse_id'),
+        "scanner": data_fields('id', 'name', 'complete_name', 'barcode', 'active'),
+    }
 
     def __init__(self):
         super().__init__()
@@ -208,22 +511,22 @@ class OdooStorageLocationMongoDB(MongoDBDataManager):
     def get_db_collection(self):
         return self.db_client[self.db_name][self.db_collection_name]
 
-    def query_storage_locations(self, offset: int = 0, limit=None, *args, **kwargs):
+    def query_storage_locations(self, offset: int = 0, limit=None, projection=None, *args, **kwargs):
         collection = self.get_db_collection()
-        results = collection.find(**kwargs)
+        results = collection.find(projection=self.resolve_projection(projection), **kwargs)
         if limit is not None:
             results = results.limit(limit)
         if offset > 0:
             results = results.skip(offset)
         return list(results)
 
-    def query_storage_location_by_ids(self, ids: List[int]):
+    def query_storage_location_by_ids(self, ids: List[int], projection=None):
         filter_ = {"_id": {"$in": ids}}
-        storage_locations = list(self.query_storage_locations(filter=filter_, limit=len(ids)))
+        storage_locations = list(self.query_storage_locations(filter=filter_, limit=len(ids), projection=projection))
         return storage_locations
 
-    def query_storage_location_by_id(self, id: int):
-        result = self.query_storage_location_by_ids(ids=[id])
+    def query_storage_location_by_id(self, id: int, projection=None):
+        result = self.query_storage_location_by_ids(ids=[id], projection=projection)
         return result[0] if result else None
 
     def save_storage_location(self, storage_location_id, document):
@@ -235,6 +538,18 @@ class OdooStorageLocationMongoDB(MongoDBDataManager):
         )
         return result
 
+    def save_storage_locations(self, location_ids, documents):
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, location_ids, documents)
+
+    def query_write_dates(self, ids: List[int]) -> dict:
+        return self.query_field_by_ids(self.db_name, self.db_collection_name, ids, "data.write_date")
+
+    def query_ids_by_alias(self, alias: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias})
+
+    def query_ids_fetched_since(self, alias: str, since: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias, "fetchedAt": {"$gte": since}})
+
     def to_standard_storage_location(self, storage_location: dict):
         #TODO: To Standard Storage Location Object
         pass
@@ -247,8 +562,25 @@ class OdooStorageLocationMongoDB(MongoDBDataManager):
         )
 
 
+@mongo_index_registry.register
 class OdooPutawayRuleMongoDB(MongoDBDataManager):
 
+    INDEXES = {
+        "stock.putaway.rule": [
+            IndexModel([("alias", ASCENDING), ("data.id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.write_date", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.active", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("fetchedAt", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.product_id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.location_out_id", ASCENDING)]),
+        ]
+    }
+
+    PROJECTIONS = {
+        "list": data_fields('id', 'product_id', 'location_in_id', 'location_out_id', 'active', 'sequence',
+                            'company_id'),
+    }
+
     def __init__(self):
         super().__init__()
         self.db_name = "odoo_data"
@@ -257,9 +589,9 @@ class OdooPutawayRuleMongoDB(MongoDBDataManager):
     def get_db_collection(self):
         return self.db_client[self.db_name][self.db_collection_name]
 
-    def query_putaway_rules(self, offset: int = 0, limit=None, *args, **kwargs):
+    def query_putaway_rules(self, offset: int = 0, limit=None, projection=None, *args, **kwargs):
         collection = self.get_db_collection()
-        results = collection.find(**kwargs)
+        results = collection.find(projection=self.resolve_projection(projection), **kwargs)
         if limit is not None:
             results = results.limit(limit)
         if offset > 0:
@@ -267,13 +599,13 @@ class OdooPutawayRuleMongoDB(MongoDBDataManager):
         return list(results)
 
 
-    def query_putaway_rule_by_ids(self, ids: List[int]):
+    def query_putaway_rule_by_ids(self, ids: List[int], projection=None):
         filter_ = {"_id": {"$in": ids}}
-        putaway_rules = list(self.query_putaway_rules(filter=filter_, limit=len(ids)))
+        putaway_rules = list(self.query_putaway_rules(filter=filter_, limit=len(ids), projection=projection))
         return putaway_rules
 
-    def query_putaway_rule_by_id(self, id: int):
-        result = self.query_putaway_rule_by_ids(ids=[id])
+    def query_putaway_rule_by_id(self, id: int, projection=None):
+        result = self.query_putaway_rule_by_ids(ids=[id], projection=projection)
         return result[0] if result else None
 
     def save_putaway_rule(self, putaway_rule_id, document):
@@ -285,6 +617,36 @@ class OdooPutawayRuleMongoDB(MongoDBDataManager):
         )
         return result
 
+    def save_putaway_rules(self, putaway_rule_ids, documents):
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, putaway_rule_ids, documents)
+
+    def query_write_dates(self, ids: List[int]) -> dict:
+        return self.query_field_by_ids(self.db_name, self.db_collection_name, ids, "data.write_date")
+
+    def query_ids_by_alias(self, alias: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias})
+
+    def query_product_ids_fetched_since(self, alias: str, since: str) -> List[int]:
+        return self.distinct_product_ids({"alias": alias, "fetchedAt": {"$gte": since}})
+
+    def query_product_ids_by_location_ids(self, alias: str, location_ids: List[int]) -> List[int]:
+        return self.distinct_product_ids({"alias": alias, "data.location_out_id": {"$in": list(location_ids)}})
+
+    def query_ids_by_product_ids(self, alias: str, product_ids: List[int]) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name,
+                              {"alias": alias, "data.product_id": {"$in": list(product_ids)}})
+
+    def query_product_ids_by_ids(self, ids: List[int]) -> List[int]:
+        return self.distinct_product_ids({"_id": {"$in": list(ids)}})
+
+    def distinct_product_ids(self, filter_: dict) -> List[int]:
+        # data.product_id 是 [id, name]，distinct 会同时返回名称
+        values = self.get_db_collection().distinct("data.product_id", filter_)
+        return [v for v in values if isinstance(v, int)]
+
+    def delete_by_ids(self, ids: List[int]) -> int:
+        return self.delete_documents_by_ids(self.db_name, self.db_collection_name, ids)
+
     def delete_random_documents(self, **kwargs) -> Optional[int]:
         return super().delete_random_documents(
             database_name=self.db_name,
@@ -293,8 +655,25 @@ class OdooPutawayRuleMongoDB(MongoDBDataManager):
         )
 
 
+@mongo_index_registry.register
 class OdooQuantMongoDB(MongoDBDataManager):
 
+    INDEXES = {
+        "stock.quant": [
+            IndexModel([("alias", ASCENDING), ("data.id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.write_date", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("fetchedAt", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.product_id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.location_id", ASCENDING)]),
+        ]
+    }
+
+    PROJECTIONS = {
+        "list": data_fields('id', 'product_id', 'product_uom_id', 'quantity', 'reserved_quantity',
+                            'available_quantity', 'inventory_quantity', 'inventory_quantity_set',
+                            'location_id', 'warehouse_id', 'last_count_date'),
+    }
+
     def __init__(self):
         super().__init__()
         self.db_name = "odoo_data"
@@ -304,22 +683,22 @@ class OdooQuantMongoDB(MongoDBDataManager):
     def get_db_collection(self):
         return self.db_client[self.db_name][self.db_collection_name]
 
-    def query_quants(self, offset: int = 0, limit=None, *args, **kwargs):
+    def query_quants(self, offset: int = 0, limit=None, projection=None, *args, **kwargs):
         collection = self.get_db_collection()
-        results = collection.find(**kwargs)
+        results = collection.find(projection=self.resolve_projection(projection), **kwargs)
         if limit is not None:
             results = results.limit(limit)
         if offset > 0:
             results = results.skip(offset)
         return list(results)
 
-    def query_quant_by_ids(self, ids: List[int]):
+    def query_quant_by_ids(self, ids: List[int], projection=None):
         filter_ = {"_id": {"$in": ids}}
-        quants = list(self.query_quants(filter=filter_, limit=len(ids)))
+        quants = list(self.query_quants(filter=filter_, limit=len(ids), projection=projection))
         return quants
 
-    def query_quant_by_id(self, id: int):
-        result = self.query_quant_by_ids(ids=[id])
+    def query_quant_by_id(self, id: int, projection=None):
+        result = self.query_quant_by_ids(ids=[id], projection=projection)
         return result[0] if result else None
 
     def save_quant(self, quant_id, document):
@@ -331,6 +710,53 @@ class OdooQuantMongoDB(MongoDBDataManager):
         )
         return result
 
+    def save_quants(self, quant_ids, documents):
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, quant_ids, documents)
+
+    def query_write_dates(self, ids: List[int]) -> dict:
+        return self.query_field_by_ids(self.db_name, self.db_collection_name, ids, "data.write_date")
+
+    def query_ids_by_alias(self, alias: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias})
+
+    def query_product_ids_fetched_since(self, alias: str, since: str) -> List[int]:
+        return self.distinct_product_ids({"alias": alias, "fetchedAt": {"$gte": since}})
+
+    def query_product_ids_by_location_ids(self, alias: str, location_ids: List[int]) -> List[int]:
+        return self.distinct_product_ids({"alias": alias, "data.location_id": {"$in": list(location_ids)}})
+
+    def query_ids_by_product_ids(self, alias: str, product_ids: List[int]) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name,
+                              {"alias": alias, "data.product_id": {"$in": list(product_ids)}})
+
+    def query_product_ids_by_ids(self, ids: List[int]) -> List[int]:
+        return self.distinct_product_ids({"_id": {"$in": list(ids)}})
+
+    def aggregate_quantities(self, alias: str) -> List[dict]:
+        """
+        按 产品 × 库位 汇总库存数量（合并批次和包裹）。
+        :return: [{"productId", "locationId", "quantity"}]
+        """
+        pipeline = [
+            {"$match": {"alias": alias}},
+            {"$group": {
+                "_id": {"p": {"$arrayElemAt": ["$data.product_id", 0]},
+                        "l": {"$arrayElemAt": ["$data.location_id", 0]}},
+                "quantity": {"$sum": "$data.quantity"},
+            }},
+        ]
+        return [dict(productId=row["_id"]["p"], locationId=row["_id"]["l"], quantity=row["quantity"])
+                for row in self.get_db_collection().aggregate(pipeline, allowDiskUse=True)
+                if row["_id"]["p"] is not None and row["_id"]["l"] is not None]
+
+    def distinct_product_ids(self, filter_: dict) -> List[int]:
+        # data.product_id 是 [id, name]，distinct 会同时返回名称
+        values = self.get_db_collection().distinct("data.product_id", filter_)
+        return [v for v in values if isinstance(v, int)]
+
+    def delete_by_ids(self, ids: List[int]) -> int:
+        return self.delete_documents_by_ids(self.db_name, self.db_collection_name, ids)
+
     def to_standard_quant(self, quant: dict):
         # TODO: To Standard Quant Object
         raise NotImplementedError
@@ -343,8 +769,102 @@ class OdooQuantMongoDB(MongoDBDataManager):
         )
 
 
+# 库存快照的分辨率：桶的时间范围、桶内样本键和保留天数
+QUANT_SNAPSHOT_RESOLUTIONS = {
+    "day": dict(bucket="%Y-%m", key="%d", retention_days=730),
+    "hour": dict(bucket="%Y-%m-%d", key="%H", retention_days=14),
+}
+
+
+@mongo_index_registry.register
+class OdooQuantSnapshotMongoDB(MongoDBDataManager):
+    """
+    库存数量的时间序列快照，每个 产品 × 库位 × 桶 一个文档：
+    按天的快照每月一个桶，按小时的快照每天一个桶，样本保存在 samples {"18": 12.0} 中。
+    同一时间段内多次快照只保留最后一次。桶过期后由 TTL 索引清除。
+    """
+
+    INDEXES = {
+        "stock.quant.snapshot": [
+            IndexModel([("alias", ASCENDING), ("resolution", ASCENDING), ("productId", ASCENDING),
+                        ("bucket", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("resolution", ASCENDING), ("bucket", ASCENDING)]),
+            IndexModel([("expiresAt", ASCENDING)], expireAfterSeconds=0),
+        ]
+    }
+
+    WRITE_CHUNK_SIZE = 1000
+
+    def __init__(self):
+        super().__init__()
+        self.db_name = "odoo_data"
+        self.db_collection_name = "stock.quant.snapshot"
+
+    def get_db_collection(self):
+        return self.db_client[self.db_name][self.db_collection_name]
+
+    def save_snapshot(self, alias: str, resolution: str, at: datetime.datetime, quantities: List[dict]) -> int:
+        """
+        写入一次快照。
+        :param at: 快照时间
+        :param quantities: [{"productId", "locationId", "quantity"}]，OdooQuantMongoDB.aggregate_quantities 的结果
+        :return: 写入的样本数
+        """
+        spec = QUANT_SNAPSHOT_RESOLUTIONS[resolution]
+        bucket, key = at.strftime(spec["bucket"]), at.strftime(spec["key"])
+        expires_at = at + datetime.timedelta(days=spec["retention_days"])
+        collection = self.get_db_collection()
+        operations = [
+            UpdateOne(
+                {"_id": f"{alias}:{resolution}:{q['productId']}:{q['locationId']}:{bucket}"},
+                {"$set": {f"samples.{key}": q["quantity"], "expiresAt": expires_at},
+                 "$setOnInsert": {"alias": alias, "resolution": resolution, "productId": q["productId"],
+                                  "locationId": q["locationId"], "bucket": bucket}},
+                upsert=True)
+            for q in quantities
+        ]
+        for i in range(0, len(operations), self.WRITE_CHUNK_SIZE):
+            collection.bulk_write(operations[i:i + self.WRITE_CHUNK_SIZE], ordered=False)
+        # 本桶中已有、但这次没有库存的 产品 × 库位 记为 0
+        collection.update_many({"alias": alias, "resolution": resolution, "bucket": bucket,
+                                f"samples.{key}": {"$exists": False}},
+                               {"$set": {f"samples.{key}": 0}})
+        return len(operations)
+
+    def query_snapshots(self, alias: str, resolution: str, product_ids: List[int],
+                        start: datetime.datetime, end: datetime.datetime,
+                        location_ids: Optional[List[int]] = None) -> List[dict]:
+        """
+        :return: [{"productId", "locationId", "time": datetime, "quantity"}]，按时间排序，只包含 [start, end] 内的样本
+        """
+        spec = QUANT_SNAPSHOT_RESOLUTIONS[resolution]
+        filter_ = {"alias": alias, "resolution": resolution, "productId": {"$in": list(product_ids)},
+                   "bucket": {"$gte": start.strftime(spec["bucket"]), "$lte": end.strftime(spec["bucket"])}}
+        if location_ids:
+            filter_["locationId"] = {"$in": list(location_ids)}
+        results = []
+        for doc in self.get_db_collection().find(filter_, projection={"_id": 0, "expiresAt": 0}):
+            for key, quantity in doc.get("samples", {}).items():
+                at = datetime.datetime.strptime(f"{doc['bucket']} {key}", f"{spec['bucket']} {spec['key']}")
+                if start <= at <= end:
+                    results.append(dict(productId=doc["productId"], locationId=doc["locationId"],
+                                        time=at, quantity=quantity))
+        results.sort(key=lambda r: r["time"])
+        return results
+
+
+@mongo_index_registry.register
 class OdooOrderlineMongoDB(MongoDBDataManager):
 
+    INDEXES = {
+        "sale.order.line": [
+            IndexModel([("alias", ASCENDING), ("data.id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.salesman_id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.order_id", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.create_date", ASCENDING)]),
+        ]
+    }
+
     def __init__(self):
         super().__init__()
         self.db_name = "odoo_data"
@@ -381,19 +901,367 @@ class OdooOrderlineMongoDB(MongoDBDataManager):
         else:
             return None
 
-    def query_orderlines(self, offset: int = 0, limit=None, *args, **kwargs):
+    def query_orderlines(self, offset: int = 0, limit=None, projection=None, *args, **kwargs):
         collection = self.get_db_collection()
-        results = collection.find(**kwargs)
+        results = collection.find(projection=self.resolve_projection(projection), **kwargs)
         if limit is not None:
             results = results.limit(limit)
         if offset > 0:
             results = results.skip(offset)
         return list(results)
 
+    def query_write_dates(self, ids: List[int]) -> dict:
+        return self.query_field_by_ids(self.db_name, self.db_collection_name, ids, "data.write_date")
+
     def to_standard_orderline(self, orderline: dict):
         raise NotImplementedError
 
 
+def many2one(field: str, index: int):
+    # Odoo many2one 字段为 [id, name]，空值为 False
+    return {"$cond": [{"$isArray": f"$data.{field}"}, {"$arrayElemAt": [f"$data.{field}", index]}, None]}
+
+
+@mongo_index_registry.register
+class OdooSalesCubeMongoDB(MongoDBDataManager):
+    """
+    预聚合的销售数据：每个 alias × 天 × 产品模板 × 客户 × 销售员 一个单元格。
+    只统计已确认（state=sale）且单价不为 0 的订单行，与看板的数据清洗规则一致。
+    """
+
+    INDEXES = {
+        "sales.cube": [
+            IndexModel([("alias", ASCENDING), ("day", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("partner_id", ASCENDING), ("day", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("product_id", ASCENDING), ("day", ASCENDING)]),
+        ]
+    }
+
+    DIMENSIONS = ("day", "month", "product_id", "product_name", "partner_id", "partner",
+                  "salesman_id", "salesman", "currency")
+    DAYS_PER_QUERY = 100
+
+    def __init__(self):
+        super().__init__()
+        self.db_name = "odoo_data"
+        self.db_collection_name = "sales.cube"
+        self.source_collection_name = "sale.order.line"
+
+    def get_db_collection(self):
+        return self.db_client[self.db_name][self.db_collection_name]
+
+    def has_alias(self, alias: str) -> bool:
+        return self.get_db_collection().find_one({"alias": alias}, projection={"_id": 1}) is not None
+
+    def rebuild(self, alias: str, days: Optional[List[str]] = None, updated_at: str = None) -> int:
+        """
+        从订单行重新聚合指定日期的单元格。
+        :param days: ["2024-07-25", ...]，None 表示全部重建
+        :return: 写入的单元格数
+        """
+        # 本次重建写入的单元格带有同一个版本号，写入后删除范围内其他版本的单元格
+        version = uuid.uuid4().hex
+        if days is None:
+            cells = self._aggregate_cells(alias, {}, updated_at)
+            return self._replace_cells(alias, {}, cells, version)
+        days = sorted(set(days))
+        count = 0
+        for i in range(0, len(days), self.DAYS_PER_QUERY):
+            chunk = days[i:i + self.DAYS_PER_QUERY]
+            match = {"$or": [{"data.create_date": {"$gte": f"{day} 00:00:00", "$lte": f"{day} 23:59:59"}}
+                             for day in chunk]}
+            cells = self._aggregate_cells(alias, match, updated_at)
+            count += self._replace_cells(alias, {"day": {"$in": chunk}}, cells, version)
+        return count
+
+    def _replace_cells(self, alias: str, scope: dict, cells: List[dict], version: str) -> int:
+        """
+        一次 bulk_write 中先覆盖新单元格，再删除范围内旧版本的单元格。
+        单元格 _id 由维度组成，覆盖是原地替换，看板在重建期间不会读到空的日期。
+        """
+        requests = [ReplaceOne({"_id": cell["_id"]}, {**cell, "version": version}, upsert=True) for cell in cells]
+        requests.append(DeleteMany({"alias": alias, **scope, "version": {"$ne": version}}))
+        self.get_db_collection().bulk_write(requests, ordered=True)
+        return len(cells)
+
+    def _aggregate_cells(self, alias: str, match: dict, updated_at: str) -> List[dict]:
+        source = self.db_client[self.db_name][self.source_collection_name]
+        pipeline = [
+            {"$match": {"alias": alias, "data.state": "sale", "data.price_unit": {"$ne": 0},
+                        "data.product_template_id": {"$ne": False}, **match}},
+            {"$group": {
+                "_id": {
+                    "day": {"$substrBytes": ["$data.create_date", 0, 10]},
+                    "product_id": many2one("product_template_id", 0),
+                    "partner_id": many2one("order_partner_id", 0),
+                    "salesman_id": many2one("salesman_id", 0),
+                },
+                "product_name": {"$first": many2one("product_template_id", 1)},
+                "partner": {"$first": many2one("order_partner_id", 1)},
+                "salesman": {"$first": many2one("salesman_id", 1)},
+                "currency": {"$first": many2one("currency_id", 1)},
+                "qty": {"$sum": "$data.product_uom_qty"},
+                "price_subtotal": {"$sum": "$data.price_subtotal"},
+                "price_tax": {"$sum": "$data.price_tax"},
+                "price_total": {"$sum": "$data.price_total"},
+                "line_count": {"$sum": 1},
+                "order_numbers": {"$addToSet": many2one("order_id", 1)},
+            }},
+            {"$project": {
+                "_id": 0,
+                "alias": {"$literal": alias},
+                "day": "$_id.day",
+                "month": {"$substrBytes": ["$_id.day", 0, 7]},
+                "product_id": "$_id.product_id",
+                "partner_id": "$_id.partner_id",
+                "salesman_id": "$_id.salesman_id",
+                "product_name": 1, "partner": 1, "salesman": 1, "currency": 1,
+                "qty": 1, "price_subtotal": 1, "price_tax": 1, "price_total": 1,
+                "line_count": 1, "order_numbers": 1,
+                "updatedAt": {"$literal": updated_at},
+            }},
+        ]
+        cells = list(source.aggregate(pipeline, allowDiskUse=True))
+        for cell in cells:
+            cell["_id"] = f"{alias}:{cell['day']}:{cell['product_id']}:{cell['partner_id']}:{cell['salesman_id']}"
+        return cells
+
+    def aggregate_sales(self, alias: str, group_by: List[str], since_day: str = None,
+                        until_day: str = None, filter_: dict = None) -> List[dict]:
+        """
+        按维度汇总销售额、数量、订单数和最后下单日期。
+        :param group_by: DIMENSIONS 中的字段，例如 ["partner"]、["month"]、["product_id", "product_name"]
+        """
+        unknown = set(group_by) - set(self.DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown sales cube dimensions: {unknown}")
+        match = {"alias": alias, **(filter_ or {})}
+        if since_day or until_day:
+            match["day"] = {}
+            if since_day:
+                match["day"]["$gte"] = since_day
+            if until_day:
+                match["day"]["$lte"] = until_day
+        collection = self.get_db_collection()
+        sums = list(collection.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {d: f"${d}" for d in group_by},
+                "qty": {"$sum": "$qty"},
+                "price_subtotal": {"$sum": "$price_subtotal"},
+                "price_tax": {"$sum": "$price_tax"},
+                "price_total": {"$sum": "$price_total"},
+                "line_count": {"$sum": "$line_count"},
+                "currency": {"$first": "$currency"},
+                "first_day": {"$min": "$day"},
+                "last_day": {"$max": "$day"},
+                # 一个订单可能跨多个单元格（多个产品），订单数要按订单号去重
+                "order_numbers": {"$push": "$order_numbers"},
+            }},
+            {"$project": {
+                "_id": 1, "qty": 1, "price_subtotal": 1, "price_tax": 1, "price_total": 1,
+                "line_count": 1, "currency": 1, "first_day": 1, "last_day": 1,
+                "order_count": {"$size": {"$reduce": {
+                    "input": "$order_numbers", "initialValue": [],
+                    "in": {"$setUnion": ["$$value", "$$this"]}}}},
+            }},
+        ], allowDiskUse=True))
+        rows = []
+        for doc in sums:
+            row = dict(doc.pop("_id"))
+            row.update(doc)
+            rows.append(row)
+        return rows
+
+
+@mongo_index_registry.register
+class OdooCustomerRfmMongoDB(MongoDBDataManager):
+    """
+    缓存的客户 RFM 评分（每个 alias × 客户一个文档）及每个 alias 的分位点。
+    """
+
+    INDEXES = {
+        "customer.rfm": [
+            IndexModel([("alias", ASCENDING), ("partner", ASCENDING)]),
+        ]
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.db_name = "odoo_data"
+        self.db_collection_name = "customer.rfm"
+        self.calibration_collection_name = "customer.rfm.calibration"
+
+    def get_db_collection(self):
+        return self.db_client[self.db_name][self.db_collection_name]
+
+    def save_customers(self, alias: str, documents: List[dict]):
+        ids = [f"{alias}:{doc['partner']}" for doc in documents]
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, ids, documents)
+
+    def query_customers(self, alias: str) -> List[dict]:
+        cursor = self.get_db_collection().find({"alias": alias}, projection={"_id": 0})
+        return sorted(cursor, key=lambda doc: doc.get("price_subtotal") or 0, reverse=True)
+
+    def delete_customers(self, alias: str, partners: List[str]) -> int:
+        return self.delete_documents_by_ids(self.db_name, self.db_collection_name,
+                                            [f"{alias}:{partner}" for partner in partners])
+
+    def delete_customers_not_in(self, alias: str, partners: List[str]) -> int:
+        result = self.get_db_collection().delete_many({"alias": alias, "partner": {"$nin": list(partners)}})
+        return result.deleted_count
+
+    def get_calibration(self, alias: str) -> Optional[dict]:
+        return self.db_client[self.db_name][self.calibration_collection_name].find_one({"_id": alias})
+
+    def save_calibration(self, alias: str, values: dict):
+        return self.db_client[self.db_name][self.calibration_collection_name].update_one(
+            {"_id": alias}, {"$set": values}, upsert=True)
+
+
+@mongo_index_registry.register
+class OdooProductInventoryMongoDB(MongoDBDataManager):
+    """
+    产品库存的物化视图：每个产品一个文档，包含各库位的库存、上架规则和包装。
+    由 product.product、stock.quant、stock.location、stock.putaway.rule 和 product.packaging 生成。
+    """
+
+    INDEXES = {
+        "product.inventory": [
+            IndexModel([("alias", ASCENDING), ("updatedAt", ASCENDING)]),
+        ]
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.db_name = "odoo_data"
+        self.db_collection_name = "product.inventory"
+
+    def get_db_collection(self):
+        return self.db_client[self.db_name][self.db_collection_name]
+
+    def query_product_inventories(self, offset: int = 0, limit=None, projection=None, *args, **kwargs):
+        collection = self.get_db_collection()
+        results = collection.find(projection=self.resolve_projection(projection), **kwargs)
+        if offset > 0:
+            results = results.skip(offset)
+        if limit is not None:
+            results = results.limit(limit)
+        return list(results)
+
+    def query_product_inventory_by_ids(self, ids: List[int], projection=None):
+        filter_ = {"_id": {"$in": ids}}
+        return self.query_product_inventories(filter=filter_, limit=len(ids), projection=projection)
+
+    def query_product_inventory_by_id(self, id: int, projection=None):
+        result = self.query_product_inventory_by_ids(ids=[id], projection=projection)
+        return result[0] if result else None
+
+    def save_product_inventories(self, product_ids, documents):
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, product_ids, documents)
+
+    def query_ids_by_alias(self, alias: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias})
+
+    def delete_by_ids(self, ids: List[int]) -> int:
+        return self.delete_documents_by_ids(self.db_name, self.db_collection_name, ids)
+
+
+@mongo_index_registry.register
+class OdooDeliveryOrderMongoDB(MongoDBDataManager):
+    """
+    待打包出库单 (stock.picking) 的本地镜像，文档额外包含出库单的 stock.move (moves)。
+    只保存未完成的出库单，完成或取消后由同步任务删除。
+    """
+
+    INDEXES = {
+        "stock.picking.delivery": [
+            IndexModel([("alias", ASCENDING), ("data.name", ASCENDING)]),
+            IndexModel([("alias", ASCENDING), ("data.state", ASCENDING)]),
+        ]
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.db_name = "odoo_data"
+        self.db_collection_name = "stock.picking.delivery"
+
+    def get_db_collection(self):
+        return self.db_client[self.db_name][self.db_collection_name]
+
+    def save_delivery_orders(self, picking_ids, documents):
+        return self.bulk_upsert_documents(self.db_name, self.db_collection_name, picking_ids, documents)
+
+    def query_delivery_orders_by_name(self, alias: str, name: str) -> List[dict]:
+        collection = self.get_db_collection()
+        return list(collection.find({"alias": alias, "data.name": name}))
+
+    def query_ids_by_alias(self, alias: str) -> List[int]:
+        return self.query_ids(self.db_name, self.db_collection_name, {"alias": alias})
+
+    def delete_by_ids(self, ids: List[int]) -> int:
+        return self.delete_documents_by_ids(self.db_name, self.db_collection_name, ids)
+
+
+class OdooSyncCheckpointMongoDB(MongoDBDataManager):
+    """
+    增量同步的检查点：每个 alias / model 记录最后一次成功同步的 (write_date, id)。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.db_name = "odoo_data"
+        self.db_collection_name = "sync.checkpoint"
+
+    def get_db_collection(self):
+        return self.db_client[self.db_name][self.db_collection_name]
+
+    def get_checkpoint(self, alias: str, model: str) -> Optional[dict]:
+        collection = self.get_db_collection()
+        return collection.find_one({"_id": f"{alias}:{model}"})
+
+    def save_checkpoint(self, alias: str, model: str, write_date: str, record_id: int, updated_at: str):
+        collection = self.get_db_collection()
+        result = collection.update_one(
+            {"_id": f"{alias}:{model}"},
+            {"$set": {
+                "alias": alias,
+                "model": model,
+                "write_date": write_date,
+                "record_id": record_id,
+                "updatedAt": updated_at,
+            }},
+            upsert=True
+        )
+        return result
+
+    def save_watermark(self, alias: str, model: str, fetched_at: str, updated_at: str):
+        """
+        由本地文档派生的数据（如产品库存视图）的检查点：记录已处理到的 fetchedAt，与 Odoo 的 write_date 分开保存。
+        """
+        collection = self.get_db_collection()
+        return collection.update_one(
+            {"_id": f"{alias}:{model}"},
+            {"$set": {"alias": alias, "model": model, "fetchedAt": fetched_at, "updatedAt": updated_at}},
+            upsert=True
+        )
+
+    def delete_checkpoint(self, alias: str, model: str):
+        collection = self.get_db_collection()
+        return collection.delete_one({"_id": f"{alias}:{model}"})
+
+    def query_latest_write_date(self, alias: str, model: str) -> Optional[str]:
+        """
+        已保存数据中最新的 write_date，用于首次增量同步时初始化检查点。
+        """
+        collection = self.db_client[self.db_name][model]
+        doc = collection.find_one({"alias": alias}, projection={"data.write_date": 1},
+                                  sort=[("data.write_date", -1)])
+        if doc is None:
+            return None
+        return doc.get("data", {}).get("write_date") or None
+
+
 
 
 
@@ -1,6 +1,6 @@
-from pymongo import UpdateOne
+from pymongo import UpdateOne, IndexModel, ASCENDING, DESCENDING
 
-from core.db import AsyncMongoDBDataManager
+from core.db import AsyncMongoDBDataManager, mongo_index_registry
 from core.log import logger
 
 
@@ -34,8 +34,16 @@ async def bulk_upsert(
         raise
 
 
+@mongo_index_registry.register
 class AsyncWoocommerceOrderDB(AsyncMongoDBDataManager):
 
+    INDEXES = {
+        "orders": [
+            IndexModel([("date_created", DESCENDING)]),
+            IndexModel([("data.date_created", ASCENDING)]),
+        ]
+    }
+
     def __init__(self):
         super().__init__()
         self.db_name = "woocommerce_data"
@@ -1,10 +1,16 @@
+import contextlib
 import datetime
+import http.client
 import os
+import threading
+import time
 import xmlrpc.client
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from pydantic import BaseModel, Field
 from core.config2 import settings
+from core.log import logger
+from utils.ratelimit import TokenBucket
 import json
 
 DATETIME_PATTERN = '%Y-%m-%d %H:%M:%S'
@@ -36,7 +42,32 @@ class OdooAPIKey(BaseModel):
         return k
 
 
+_request_budget = threading.local()
+
+
+@contextlib.contextmanager
+def odoo_request_budget(limiter: Optional[TokenBucket]):
+    """
+    Throttle the Odoo requests made by the current thread with the given token bucket.
+    Other threads (e.g. interactive API requests) sharing the same OdooClient are not affected.
+    """
+    previous = getattr(_request_budget, 'limiter', None)
+    _request_budget.limiter = limiter
+    try:
+        yield limiter
+    finally:
+        _request_budget.limiter = previous
+
+
 class OdooClient(object):
+    """
+    XML-RPC client of an Odoo instance.
+    The uid is cached for UID_TTL_SEC and re-authenticated on expiry or access errors.
+    ServerProxy objects are kept per thread, so that each thread reuses its keep-alive HTTP connection.
+    """
+    UID_TTL_SEC = 3600
+    # Methods without side effects, which may be retried after a connection error
+    RETRYABLE_METHODS = frozenset({'search_read', 'read', 'search', 'search_count', 'fields_get'})
 
     def __init__(self, api_key: OdooAPIKey):
         self.api_key = api_key
@@ -45,20 +76,68 @@ class OdooClient(object):
         self.password = api_key.password
         self.host = api_key.host
         self.uid = None
-        self.models = None
-
-    def login(self):
-        print("Odoo API Login")
-        common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(self.host))
-        self.uid = common.authenticate(self.db, self.username, self.password, {})
-        self.models = xmlrpc.client.ServerProxy('{}/xmlrpc/2/object'.format(self.host))
+        self._uid_expires_at = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def models(self):
+        if getattr(self._local, 'models', None) is None:
+            self._local.models = xmlrpc.client.ServerProxy('{}/xmlrpc/2/object'.format(self.host))
+        return self._local.models
+
+    @property
+    def common(self):
+        if getattr(self._local, 'common', None) is None:
+            self._local.common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(self.host))
+        return self._local.common
+
+    def _reset_connections(self):
+        self._local.models = None
+        self._local.common = None
+
+    def login(self, force=False):
+        with self._lock:
+            if force or self.uid is None or time.monotonic() >= self._uid_expires_at:
+                logger.info(f"Odoo API Login: {self.username}@{self.host}")
+                uid = self.common.authenticate(self.db, self.username, self.password, {})
+                if not uid:
+                    raise PermissionError(f"Odoo authentication failed for {self.username}@{self.host}")
+                self.uid = uid
+                self._uid_expires_at = time.monotonic() + self.UID_TTL_SEC
         return self
 
     def version(self):
-        common = xmlrpc.client.ServerProxy('{}/xmlrpc/2/common'.format(self.host))
-        return common.version()
+        return self.common.version()
 
     def execute_kw(self, model, method, *args, **kwargs):
+        if self.uid is None:
+            self.login()
+        try:
+            return self._execute_kw(model, method, *args, **kwargs)
+        except xmlrpc.client.Fault as e:
+            if 'AccessDenied' not in str(e.faultString) and 'Access Denied' not in str(e.faultString):
+                raise
+            # The cached uid is no longer valid: authenticate again and retry once
+            logger.warning(f"Odoo access denied, re-authenticating: {e.faultString}")
+            self.login(force=True)
+        except ConnectionRefusedError as e:
+            # The request was never sent, so retrying cannot apply it twice
+            logger.warning(f"Odoo connection refused, reconnecting: {e}")
+            self._reset_connections()
+        except (xmlrpc.client.ProtocolError, ConnectionError, http.client.HTTPException) as e:
+            # Stale keep-alive connection. The server may already have executed the request,
+            # so only read methods are retried; a retried create/write could be applied twice.
+            self._reset_connections()
+            if method not in self.RETRYABLE_METHODS:
+                raise
+            logger.warning(f"Odoo connection error, reconnecting: {e}")
+        return self._execute_kw(model, method, *args, **kwargs)
+
+    def _execute_kw(self, model, method, *args, **kwargs):
+        limiter = getattr(_request_budget, 'limiter', None)
+        if limiter is not None:
+            limiter.acquire()
         return self.models.execute_kw(self.db, self.uid, self.password,
                                       model, method, *args, **kwargs)
 
@@ -78,11 +157,37 @@ class OdooClient(object):
         return self.execute_kw(model, 'write', *args, **kwargs)
 
 
+class OdooClientRegistry:
+    """
+    Process-wide OdooClient instances keyed by the API key (host, db, username).
+    """
+
+    def __init__(self):
+        self._clients: Dict[tuple, OdooClient] = {}
+        self._lock = threading.Lock()
+
+    def get(self, api_key: OdooAPIKey) -> OdooClient:
+        key = (api_key.host, api_key.db, api_key.username)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None or client.password != api_key.password:
+                client = OdooClient(api_key)
+                self._clients[key] = client
+            return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+
+odoo_client_registry = OdooClientRegistry()
+
+
 class OdooAPIBase(object):
 
     def __init__(self, api_key: OdooAPIKey, login=True, *args, **kwargs):
         self.api_key = api_key
-        self.client = OdooClient(self.api_key)
+        self.client = odoo_client_registry.get(self.api_key)
         if login:
             self.login()
 
@@ -105,6 +210,26 @@ class OdooAPIBase(object):
     def fetch_write_date(self, model, ids, *args, **kwargs):
         return self.client.read(model, [ids], {'fields': ['id', 'write_date']})
 
+    def fetch_changed_records(self, model, domain, since=None, since_id=0, limit=200, fields=None):
+        """
+        Fetch records modified after the checkpoint (since, since_id), ordered by (write_date, id).
+        Keyset paging: pass write_date and id of the last record as the next checkpoint.
+        :param model: Odoo model name
+        :param domain: Base domain of the model
+        :param since: write_date of the checkpoint, None to start from the beginning
+        :param since_id: id of the last record saved at `since`
+        :param limit: Page size
+        :param fields: Fields to read, all fields if None. Must include write_date.
+        """
+        domain = list(domain)
+        if since:
+            domain += ['|', ('write_date', '>', since),
+                       '&', ('write_date', '=', since), ('id', '>', since_id)]
+        options = {'limit': limit, 'order': 'write_date asc, id asc'}
+        if fields:
+            options['fields'] = fields
+        return self.client.search_read(model, [domain], options)
+
 class OdooBasicAPI(OdooAPIBase):
     def __init__(self, api_key: OdooAPIKey, *args, **kwargs):
         super().__init__(api_key, *args, **kwargs)
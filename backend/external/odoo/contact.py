@@ -22,6 +22,10 @@ class OdooContactAPI(OdooAPIBase):
     def fetch_contact_write_date(self, ids):
         return self.fetch_write_date('res.partner', ids)
 
+    def fetch_changed_contacts(self, since=None, since_id=0, limit=200):
+        domain = [('active', 'in', [True, False])]
+        return self.fetch_changed_records('res.partner', domain, since, since_id, limit)
+
     def fetch_company_by_ref(self, ref) -> List[Dict]:
         logger.info("Fetching company by ref")
         domain = [('ref', '=', ref), ('is_company', '=', True)]
@@ -33,6 +33,10 @@ class OdooInventoryAPI(OdooAPIBase):
     def fetch_location_write_date(self, ids):
         return self.fetch_write_date('stock.location', ids)
 
+    def fetch_changed_internal_locations(self, since=None, since_id=0, limit=200):
+        domain = [('usage', '=', 'internal'), ('active', 'in', [True, False])]
+        return self.fetch_changed_records('stock.location', domain, since, since_id, limit)
+
     def fetch_putaway_rule_ids(self, domain = []):
         logger.info("Fetching putaway rule ids")
         domain += [('active', 'in', [True, False])]
@@ -45,6 +49,10 @@ class OdooInventoryAPI(OdooAPIBase):
     def fetch_putaway_rule_write_date(self, ids):
         return self.fetch_write_date('stock.putaway.rule', ids)
 
+    def fetch_changed_putaway_rules(self, since=None, since_id=0, limit=200):
+        domain = [('active', 'in', [True, False])]
+        return self.fetch_changed_records('stock.putaway.rule', domain, since, since_id, limit)
+
     def fetch_quant_ids(self, domain=[]):
         """
         This method fetches all the quant ids from the stock.quant model.
@@ -71,15 +79,29 @@ class OdooInventoryAPI(OdooAPIBase):
     def fetch_quant_write_date(self, ids,):
         return self.fetch_write_date('stock.quant', ids)
 
+    def fetch_changed_quants(self, since=None, since_id=0, limit=200):
+        domain = [('location_id', 'ilike', "WH/Stock")]
+        return self.fetch_changed_records('stock.quant', domain, since, since_id, limit)
+
     def request_quant_by_id(self, quant_id, inv_quantity) -> bool:
         logger.info(f"Requesting quant_inventory by id {quant_id} with quantity {inv_quantity}")
         return self.client.write('stock.quant', [[quant_id],
                 {'inventory_quantity': inv_quantity}])
 
+    def request_quants(self, quant_ids, inv_quantity) -> bool:
+        """ 多个库存设为同一盘点数量，一次 write """
+        logger.info(f"Requesting {len(quant_ids)} quant_inventories with quantity {inv_quantity}")
+        return self.client.write('stock.quant', [list(quant_ids), {'inventory_quantity': inv_quantity}])
+
     def quant_relocation_by_id(self, quant_id, location_id, message) -> bool:
         logger.info(f"Relocating quant_inventory by id {quant_id} to location {location_id}")
+        return self.relocate_quants([quant_id], location_id, message)
+
+    def relocate_quants(self, quant_ids, location_id, message):
+        """ 多个库存移到同一库位，一次移库向导 """
+        logger.info(f"Relocating {len(quant_ids)} quant_inventories to location {location_id}")
         # 创建移库
-        quant_ids = [quant_id]
+        quant_ids = list(quant_ids)
         relocate_id = self.client.create('stock.quant.relocate', [{
             'quant_ids': [(6, 0, quant_ids)],  # 选中要移动的库存
             'dest_location_id': location_id,  # 目标位置
@@ -107,5 +129,20 @@ class OdooInventoryAPI(OdooAPIBase):
                      {'location_in_id': location_in_id,
                       'location_out_id': location_out_id}])
 
+    def create_putaway_rules(self, rules) -> list:
+        """
+        :param rules: [{'product_id', 'location_in_id', 'location_out_id'}]
+        :return: 新建规则的 id，与 rules 顺序一致
+        """
+        logger.info(f"Creating {len(rules)} putaway rules")
+        return self.client.create('stock.putaway.rule', [list(rules)])
+
+    def update_putaway_rules(self, rule_ids, location_out_id, location_in_id=8) -> bool:
+        logger.info(f"Updating {len(rule_ids)} putaway rules with location_out_id {location_out_id} "
+                    f"and location_in_id {location_in_id}")
+        return self.client.write('stock.putaway.rule', [list(rule_ids),
+                     {'location_in_id': location_in_id,
+                      'location_out_id': location_out_id}])
+
 
 
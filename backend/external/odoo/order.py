@@ -1,6 +1,13 @@
 from core.log import logger
 from .base import OdooAPIKey, OdooAPIBase
 
+# 出库单：发货作业类型，不含退货
+DELIVERY_ORDER_DOMAIN = [('picking_type_id', '=', 2), ('is_return_picking', '=', False)]
+# 等待打包的出库单状态
+DELIVERY_ORDER_OPEN_STATES = ['assigned', 'confirmed']
+DELIVERY_MOVE_FIELDS = ['id', 'picking_id', 'product_id', 'name', 'state', 'product_uom_qty', 'product_qty',
+                        'product_uom', 'location_id', 'location_dest_id', 'write_date']
+
 
 class OdooOrderAPI(OdooAPIBase):
 
@@ -18,7 +25,7 @@ class OdooOrderAPI(OdooAPIBase):
         fields = ['order_id', 'name', 'currency_id', 'order_partner_id', 'salesman_id', 'product_template_id',
                   'state', 'product_uom', 'product_uom_qty', 'product_qty', 'price_unit',
                   'price_subtotal', 'price_tax', 'price_total', 'qty_to_invoice', 'qty_to_deliver',
-                  'product_type', 'create_date', 'is_delivery', 'display_type', 'discount'
+                  'product_type', 'create_date', 'write_date', 'is_delivery', 'display_type', 'discount'
                   ]
         return self.client.read('sale.order.line', [ids], {"fields": fields})
 
@@ -43,4 +50,25 @@ class OdooOrderAPI(OdooAPIBase):
                   ('name', '=', order_number),
                   ('is_return_picking', '=', False)]
         orders = self.client.search_read('stock.picking', [domain])
-        return orders
\ No newline at end of file
+        return orders
+
+    def fetch_open_delivery_order_ids(self):
+        logger.info("Fetching open delivery order ids")
+        domain = DELIVERY_ORDER_DOMAIN + [('state', 'in', DELIVERY_ORDER_OPEN_STATES)]
+        return self.client.search('stock.picking', [domain])
+
+    def fetch_delivery_orders_by_ids(self, ids):
+        return self.client.read('stock.picking', [ids])
+
+    def fetch_changed_delivery_orders(self, since, since_id=0, limit=200):
+        # 包括已完成和取消的出库单，用于从本地镜像中移除
+        return self.fetch_changed_records('stock.picking', DELIVERY_ORDER_DOMAIN, since, since_id, limit,
+                                          fields=['id', 'write_date'])
+
+    def fetch_changed_delivery_moves(self, since, since_id=0, limit=200):
+        return self.fetch_changed_records('stock.move', [('picking_type_id', '=', 2)], since, since_id, limit,
+                                          fields=['id', 'write_date', 'picking_id'])
+
+    def fetch_delivery_moves_by_picking_ids(self, picking_ids):
+        domain = [('picking_id', 'in', list(picking_ids))]
+        return self.client.search_read('stock.move', [domain], {'fields': DELIVERY_MOVE_FIELDS})
@@ -37,6 +37,10 @@ class OdooProductAPI(OdooAPIBase):
     def fetch_product_template_write_date(self, ids):
         return self.fetch_write_date("product.template", ids)
 
+    def fetch_changed_product_templates(self, since=None, since_id=0, limit=200):
+        domain = [('active', 'in', [True, False])]
+        return self.fetch_changed_records("product.template", domain, since, since_id, limit)
+
     def fetch_product_ids(self, domain=[]):
         logger.info("Fetching product ids")
         domain += [('active', 'in', [True, False])]
@@ -55,6 +59,10 @@ class OdooProductAPI(OdooAPIBase):
     def fetch_product_write_date(self, ids):
         return self.fetch_write_date("product.product", ids)
 
+    def fetch_changed_products(self, since=None, since_id=0, limit=200):
+        domain = [('active', 'in', [True, False])]
+        return self.fetch_changed_records("product.product", domain, since, since_id, limit)
+
     def fetch_product_ids_to_complete_details(self) -> List[int]:
         logger.info("Fetching product to complete details")
         domain = ["&", "&", "&", ("qty_available", ">", 0), ("type", "=", "product"), ("default_code", "!=", False), "|", "|", ("barcode", "=", False), ("weight", "=", 0), ("image_1920", "=", False)]
@@ -107,6 +115,9 @@ class OdooProductPackagingAPI(OdooAPIBase):
     def fetch_packaging_write_date(self, ids):
         return self.fetch_write_date("product.packaging", ids)
 
+    def fetch_changed_packaging(self, since=None, since_id=0, limit=200):
+        return self.fetch_changed_records("product.packaging", [], since, since_id, limit)
+
     def update_packaging_by_id(self, id: int, data: PackagingUpdate):
         values_to_update = {}
         if data.name:
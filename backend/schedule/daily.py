@@ -2,8 +2,9 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from core.db import backup_mysql_db, clean_old_mysql_db_backups
 from core.log import logger
-from schedule.hourly import odoo_access_key_index
-from services.odoo import OdooProductService, OdooContactService, OdooInventoryService
+from schedule.hourly import odoo_access_key_index, save_odoo_data_jobs
+from services.odoo import OdooProductService
+from services.odoo.OdooDashboardService import OdooOrderDashboardService
 
 daily_scheduler = AsyncIOScheduler()
 
@@ -29,34 +30,29 @@ def standardize_raw_data():
     print('Standardize raw data')
     # TODO common.standardize
 
-@daily_scheduler.scheduled_job('cron', hour="20,22,0,2", minute=50)
-def random_delete_odoo_doc_in_mongodb():
+@daily_scheduler.scheduled_job('cron', hour=3, minute=10, max_instances=1, coalesce=True)
+def reconcile_odoo_data_in_mongodb():
     """
-    目的：每天晚上20:47至22:47，随机删除MongoDB中Odoo相关的文档，以强制程序重新拉取数据。
+    每天03:10与 Odoo 对账：重新拉取 write_date 不一致的记录，删除 Odoo 中已不存在的记录。
     :return:
     """
+    logger.info("Reconcile Odoo data in MongoDB...")
+    save_odoo_data_jobs(full_sync=True)
     try:
-        logger.info("Random delete Odoo Products in MongoDB...")
         with OdooProductService(key_index=odoo_access_key_index, login=False) as svc:
-            svc.mdb_product.delete_random_documents(percentage=0.1)
-            svc.mdb_product_templ.delete_random_documents(percentage=0.1)
+            svc.move_inline_images_to_store()
     except Exception as e:
-        logger.error(f"Error occurred when random delete documents in MongoDB: {e}")
+        logger.error(f"Error occurred when moving inline product images to the image store: {e}")
 
-    try:
-        logger.info("Random delete Odoo Contacts in MongoDB...")
-        with OdooContactService(key_index=odoo_access_key_index, login=False) as svc:
-            svc.mdb_contact.delete_random_documents(percentage=0.1)
-    except Exception as e:
-        logger.error(f"Error occurred when random delete documents in MongoDB: {e}")
 
+@daily_scheduler.scheduled_job('cron', hour=3, minute=40)
+def recalibrate_customer_segments():
+    """
+    每天03:40重新计算客户 RFM 的分位点和所有客户的评分（对账完成之后）。
+    """
+    logger.info("Recalibrate customer RFM segments...")
     try:
-        logger.info("Random delete Odoo Inventory in MongoDB...")
-        with OdooInventoryService(key_index=odoo_access_key_index, login=False) as svc:
-            svc.mdb_quant.delete_random_documents(percentage=0.1)
-            svc.mdb_location.delete_random_documents(percentage=0.1)
+        with OdooOrderDashboardService(key_index=odoo_access_key_index, login=False) as svc:
+            svc.recalibrate_customer_segments()
     except Exception as e:
-        logger.error(f"Error occurred when random delete documents in MongoDB: {e}")
-
-
-
+        logger.error(f"Error occurred when recalibrating customer RFM segments: {e}")
@@ -13,13 +13,15 @@ from services.kaufland.KauflandOrderService import KauflandOrderSerice
 from external.kaufland.base import Storefront
 from services.woocommerce.woocommerce import OrderService as WooCommerceOrderService
 from services.lingxing.services import OrderService as LingXingOrderService
-from services.odoo import OdooProductService, OdooInventoryService, OdooContactService
-from services.odoo.OdooOrderService import OdooProductPackagingService, OdooOrderService
+from services.odoo.OdooSyncRunner import OdooSyncRunner
+from services.odoo.OdooOrderService import OdooOrderService
 
 hourly_scheduler = BackgroundScheduler()
 
 odoo_access_key_index = settings.api_keys.odoo_access_key_index
 interval_seconds = settings.scheduler.interval_seconds
+DELIVERY_ORDER_REFRESH_SECONDS = 120  # 打包台出库单镜像的刷新间隔
+QUANT_SNAPSHOT_RESOLUTIONS = ("day", "hour") if settings.scheduler.odoo_quant_snapshot_hourly else ("day",)
 
 # @hourlyScheduler.scheduled_job('interval', seconds=10)
 def hourly_job():
@@ -103,69 +105,42 @@ def save_amazon_catalog_job(key_index, marketplace):
     logger.info("Successfully scheduled Amazon catalog scheduler job...")
 
 
-def save_odoo_data_jobs():
+def save_odoo_data_jobs(full_sync=False):
+    """
+    :param full_sync: False: 只同步上次检查点之后修改过的记录；True: 全量比对 write_date（对账）
+    """
     if not settings.scheduler.odoo_fetch_enabled:
         logger.info("Scheduled job to save data to Odoo is disabled in config")
         return
 
     try:
-        logger.info("Scheduled job to save product data to Odoo")
-        with OdooProductService(key_index=odoo_access_key_index, login=True) as svc:
-            svc.save_all_product_templates()
-            svc.save_all_products()
+        logger.info("Scheduled job to save Odoo data")
+        runner = OdooSyncRunner(key_index=odoo_access_key_index,
+                                max_workers=settings.scheduler.odoo_sync_workers,
+                                requests_per_sec=settings.scheduler.odoo_requests_per_sec,
+                                full_sync=full_sync,
+                                snapshot_resolutions=QUANT_SNAPSHOT_RESOLUTIONS)
+        runner.run()
     except Exception as e:
-        logger.error(f"Error in scheduled job to save product data to Odoo: {e}")
-    finally:
-        # wait for 15 seconds before running the next job, to avoid rate limiting
-        time.sleep(15)
-
-    try:
-        logger.info("Scheduled job to save contact data to Odoo")
-        with OdooContactService(key_index=odoo_access_key_index, login=True) as svc:
-            svc.save_all_contacts()
-    except Exception as e:
-        logger.error(f"Error in scheduled job to save contact data to Odoo: {e}")
-    finally:
-        # wait for 15 seconds before running the next job, to avoid rate limiting
-        time.sleep(15)
-
-    try:
-        logger.info("Scheduled job to save inventory data to Odoo")
-        with OdooInventoryService(key_index=odoo_access_key_index, login=True) as svc:
-            svc.save_all_quants()
-            svc.save_all_putaway_rules()
-            svc.save_all_internal_locations()
-    except Exception as e:
-        logger.error(f"Error in scheduled job to save inventory data to Odoo: {e}")
-    finally:
-        # wait for 15 seconds before running the next job, to avoid rate limiting
-        time.sleep(15)
+        logger.error(f"Error in scheduled job to save Odoo data: {e}")
 
+    logger.info("Successfully scheduled Odoo data scheduler job...")
 
+@hourly_scheduler.scheduled_job('interval', seconds=DELIVERY_ORDER_REFRESH_SECONDS, max_instances=1, coalesce=True)
+def refresh_odoo_delivery_orders_job():
+    """
+    增量刷新待打包出库单的本地镜像
+    """
+    if not settings.scheduler.odoo_fetch_enabled:
+        return
     try:
-        logger.info("Scheduled job to save packaging data to Odoo")
-        with OdooProductPackagingService(key_index=odoo_access_key_index, login=True) as svc:
-            svc.save_all_product_packaging()
-    except Exception as e:
-        logger.error(f"Error in scheduled job to save packaging data to Odoo: {e}")
-    finally:
-        # wait for 15 seconds before running the next job, to avoid rate limiting
-        time.sleep(15)
-
-    try:
-        logger.info("Scheduled job to save order data to Odoo")
-        with OdooOrderService(key_index=odoo_access_key_index, login=True) as svc:
-            svc.save_all_orderlines()
+        with OdooOrderService(key_index=odoo_access_key_index, login=False) as svc:
+            svc.refresh_delivery_orders()
     except Exception as e:
-        logger.error(f"Error in scheduled job to save order data to Odoo: {e}")
-    finally:
-        # wait for 15 seconds before running the next job, to avoid rate limiting
-        time.sleep(15)
+        logger.error(f"Error in scheduled job to refresh Odoo delivery orders: {e}")
 
 
-    logger.info("Successfully scheduled Odoo data scheduler job...")
-
-@hourly_scheduler.scheduled_job('interval', seconds=interval_seconds)
+@hourly_scheduler.scheduled_job('interval', seconds=interval_seconds, max_instances=1, coalesce=True)
 def common_scheduler_2hrs():
     """
     To schedule jobs every 2 hours
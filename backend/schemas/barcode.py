@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
@@ -87,3 +89,51 @@ class PutawayRuleUpdate(BaseModel):
     location_in_id: int
     location_out_id: int
 
+# 批量解析一次最多的条码数
+MAX_RESOLVE_CODES = 500
+
+class BarcodeResolveRequest(BaseModel):
+    codes: list[str] = Field(..., min_length=1, max_length=MAX_RESOLVE_CODES,
+                             description="Barcodes, SKUs, packaging or location barcodes")
+    include_quants: bool = Field(True, description="Whether to include the quants of the products")
+
+class ResolvedBarcode(BaseModel):
+    code: str
+    found: bool
+    products: list[ProductFullInfo] = Field(default_factory=list)
+    packagings: list[ProductPackaging] = Field(default_factory=list, description="Packagings with this barcode")
+    quants: list[Quant] = Field(default_factory=list)
+    location_id: Optional[int] = Field(None, description="Location with this barcode")
+    location_name: Optional[str] = None
+
+# 批量盘点、移库和上架规则一次最多的条目数
+MAX_BULK_ITEMS = 1000
+
+class QuantCount(BaseModel):
+    quant_id: int
+    quantity: float = Field(..., description="Counted quantity")
+
+class QuantRelocation(BaseModel):
+    quant_id: int
+    location_barcode: str = Field(..., description="Barcode of the destination location")
+
+class PutawayChange(BaseModel):
+    product_id: int
+    location_barcode: str = Field(..., description="Barcode of the destination location (location_out)")
+    location_in_id: int = Field(8, description="Source location (location_in) of the rule")
+
+class BulkQuantCountRequest(BaseModel):
+    items: list[QuantCount] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class BulkQuantRelocationRequest(BaseModel):
+    items: list[QuantRelocation] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class BulkPutawayRequest(BaseModel):
+    items: list[PutawayChange] = Field(..., min_length=1, max_length=MAX_BULK_ITEMS)
+
+class BulkItemResult(BaseModel):
+    index: int = Field(..., description="Position of the item in the request")
+    id: int = Field(..., description="Quant id or product id of the item")
+    success: bool
+    message: str = ""
+    record_id: Optional[int] = Field(None, description="Id of the created or updated putaway rule")
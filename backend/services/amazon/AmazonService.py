@@ -1,9 +1,9 @@
 import time
 from datetime import datetime, timedelta
 from random import random
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Tuple
 from sp_api.base import Marketplaces, SellingApiRequestThrottledException
-from core.db import OrderQueryParams, RedisDataManager
+from core.db import OrderQueryParams, AsyncRedisDataManager
 from core.exceptions import DimensionNotFoundException
 from core.log import logger
 from crud.amazon import AmazonOrderMongoDB, AmazonCatalogMongoDB
@@ -220,6 +220,20 @@ class AmazonOrderService:
                                      **kwargs)
 
     def find_orders_by_query_params(self, query_params: OrderQueryParams) -> List[StandardOrder]:
+        return self.find_orders(filter=self.to_order_filter(query_params))
+
+    def find_orders_page(self, query_params: OrderQueryParams, cursor: str = None) -> Tuple[List[StandardOrder], str]:
+        """
+        Find a page of orders in MongoDB (keyset pagination, newest first).
+        :param cursor: next_cursor of the previous page
+        :return: (orders, next_cursor)
+        """
+        return self.mdb.query_orders_page(self.to_order_filter(query_params), limit=query_params.limit, cursor=cursor)
+
+    def count_orders(self, query_params: OrderQueryParams) -> int:
+        return self.mdb.count_orders(self.to_order_filter(query_params))
+
+    def to_order_filter(self, query_params: OrderQueryParams) -> dict:
         query = {}
         if query_params.purchasedDateTo:
             query.setdefault("order.PurchaseDate", {})["$lte"] = query_params.purchasedDateTo
@@ -234,7 +248,7 @@ class AmazonOrderService:
             query['_id'] = {"$in": query_params.orderIds}
 
         query['account_id'] = self.api.get_account_id()
-        return self.find_orders(filter=query)
+        return query
 
     def find_orders_by_ids(self, ids: List[str]) -> List[StandardOrder]:
         """
@@ -535,9 +549,10 @@ class AmazonService:
                 shipment.imageUrl = asin_image_url.get(shipment.asin, "")
         return daily_sales_vo
 
-    def query_amazon_orders(self, days_ago, status, offset, limit, up_to_date=False):
+    def query_amazon_orders(self, days_ago, status, offset, limit, up_to_date=False, cursor=None):
         """
         Query an Amazon orders.
+        :param cursor: nextCursor of the previous page (keyset pagination); offset > 0 falls back to skip
         """
         if up_to_date:
             self.order_service.save_all_orders(days_ago=days_ago, FulfillmentChannels=self.fulfillment_channels)
@@ -549,14 +564,14 @@ class AmazonService:
         params.offset = offset
         params.limit = limit
 
-        orders = self.order_service.find_orders_by_query_params(params)
-        lengthOrders = len(orders)
-        start = 0
-        end = 0
-        if lengthOrders > 0:
-            start = offset
-            end = min(len(orders), offset + limit)
-            orders = orders[start:end]
+        # Paginate in MongoDB instead of loading all matching orders and slicing them
+        if offset > 0:
+            orders = self.order_service.find_orders(offset=offset, limit=limit,
+                                                    filter=self.order_service.to_order_filter(params))
+            next_cursor = None
+        else:
+            orders, next_cursor = self.order_service.find_orders_page(params, cursor=cursor)
+        lengthOrders = self.order_service.count_orders(params)
 
         # Add image URL to each order item
         asin_to_image_url = self.catalog_service.create_asin_image_url_dict()
@@ -569,8 +584,9 @@ class AmazonService:
                 "api_client": self.api.get_account_id(),
                 "offset": offset,
                 "limit": limit,
-                "length": end - start,
-                "size": lengthOrders
+                "length": len(orders),
+                "size": lengthOrders,
+                "nextCursor": next_cursor,
                 }
 
     def query_unshipped_amazon_orders(self, days_ago=7, up_to_date=False):
@@ -707,13 +723,14 @@ class AmazonService:
 class FbaService:
 
     def __init__(self):
-        self.redis_manager = RedisDataManager()
+        self.redis_manager = AsyncRedisDataManager()
 
-    def __enter__(self):
+    async def __aenter__(self):
+        await self.redis_manager.__aenter__()
         return self
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.redis_manager.__aexit__(exc_type, exc_val, exc_tb)
 
     def fba_packing_rule(self, shipment_qty, sku, ctn_capacity) -> Dict:
         """
@@ -747,7 +764,7 @@ class FbaService:
             "utiliz_rates": utilization_rates
         }
 
-    def cache_fba_max_ctn_capacity(self, sku, ctn_capacity):
+    async def cache_fba_max_ctn_capacity(self, sku, ctn_capacity):
         """
         缓存FBA装箱规则
         :param sku: SKU名称
@@ -759,20 +776,29 @@ class FbaService:
             "ctn_capacity": ctn_capacity
         }
         three_months = 3 * 30 * 24 * 60 * 60
-        self.redis_manager.set_json(f"FBA_MAX_CTN:{sku}", mapping, three_months)
+        await self.redis_manager.set_json(f"FBA_MAX_CTN:{sku}", mapping, three_months)
 
-    def get_fba_max_ctn_capacity(self, sku) -> dict:
+    async def get_fba_max_ctn_capacity(self, sku) -> dict:
         """
         获取FBA最大箱容量
         :param sku: SKU名称
         :return: 最大箱容量
         """
-        return self.redis_manager.get_json(f"FBA_MAX_CTN:{sku}")
+        return await self.redis_manager.get_json(f"FBA_MAX_CTN:{sku}")
+
+    async def get_fba_max_ctn_capacities(self, skus: List[str]) -> Dict[str, dict]:
+        """
+        批量获取FBA最大箱容量（一次Redis往返）
+        :param skus: SKU名称列表
+        :return: {sku: 最大箱容量}，未缓存的SKU值为None
+        """
+        data = await self.redis_manager.mget_json([f"FBA_MAX_CTN:{sku}" for sku in skus])
+        return {sku: data[f"FBA_MAX_CTN:{sku}"] for sku in skus}
 
-    def delete_fba_max_ctn_capacity(self, sku):
+    async def delete_fba_max_ctn_capacity(self, sku):
         """
         删除FBA最大箱容量缓存
         :param sku: SKU名称
         :return: None
         """
-        self.redis_manager.delete(f"FBA_MAX_CTN:{sku}")
+        await self.redis_manager.delete(f"FBA_MAX_CTN:{sku}")
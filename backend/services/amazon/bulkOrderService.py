@@ -72,7 +72,6 @@ class AmazonBulkPackSlipDE:
         slips[0].insert(0, new_hr)
         order_ids = self.get_order_ids()
         page_map = {}
-        man_redis = RedisDataManager()
         TIME_TO_LIVE = 3600 * 12  # 12 hours
         for i, slip in enumerate(slips):
             order_id = order_ids[i]
@@ -83,7 +82,9 @@ class AmazonBulkPackSlipDE:
             # slip.insert(0, barcode_node)
             slip.select_one("hr:first-of-type").insert_after(barcode_node)
             page_map[order_id] = slip
-            man_redis.set(f"PACK_AMZ:{order_id}", str(slip), time_to_live_sec=TIME_TO_LIVE)
+        # 一次往返写入所有装箱单
+        RedisDataManager().mset({f"PACK_AMZ:{order_id}": str(slip) for order_id, slip in page_map.items()},
+                                time_to_live_sec=TIME_TO_LIVE)
         return page_map
 
     @staticmethod
@@ -93,9 +94,9 @@ class AmazonBulkPackSlipDE:
         :param orderIds: A list of order IDs
         :return: A HTML page containing all packing slips.
         """
-        man_redis = RedisDataManager()
-        page_map = {id: bs4.BeautifulSoup(man_redis.get(f"PACK_AMZ:{id}"), 'html.parser')
-                    for id in orderIds}
+        cached = RedisDataManager().mget([f"PACK_AMZ:{id}" for id in orderIds])
+        page_map = {id: bs4.BeautifulSoup(cached[f"PACK_AMZ:{id}"], 'html.parser')
+                    for id in orderIds if cached[f"PACK_AMZ:{id}"]}
 
         with open("assets/static/packslip-amazon.html", "r", encoding="utf-8") as fp:
             soup = bs4.BeautifulSoup(fp.read(), 'html.parser')
@@ -61,6 +61,17 @@ class GlsShipmentService:
         """
         return self.mdb.query_shipments(filter_)
 
+    def find_shipments_page(self, days_ago: int = 30, limit: int = 100,
+                            cursor: str = None) -> Tuple[List[StandardShipment], str]:
+        """
+        Find shipments of this account created in the last days, newest first.
+        :param cursor: next_cursor of the previous page
+        :return: (shipments, next_cursor)
+        """
+        filter_ = {"details.createdAt": {"$gte": time_utils.days_ago(days_ago)},
+                   "alias": self.api.api_key.alias}
+        return self.mdb.query_shipments_page(filter_, limit=limit, cursor=cursor)
+
     def find_shipments_by_ids(self, ids: List[str]) -> List[StandardShipment]:
         """
         Find shipment data in database by reference numbers.
@@ -0,0 +1,177 @@
+import datetime
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+import utils.time as time_utils
+from core.log import logger
+
+# 缓存的 RFM 分群统计最近 n 天的订单
+RFM_WINDOW_DAYS = 365
+RFM_LABELS = [1, 2, 3, 4, 5]
+CUSTOMER_SALES_COLUMNS = ['order_partner', 'price_subtotal', 'currency', 'order_count', 'last_day']
+
+
+def classify_customer(row):
+    """
+    Classify customers into different types based on their RFM scores.
+    """
+    # 高价值客户: 忠诚度评分较高，购买金额、频率较高，且最近购买时间较短。
+    if row['loyalty_score'] >= 4.0:
+        return 'High-Value Customers'
+    # 潜在流失客户: 最近购买时间较久，频率较高，曾经是重要客户，但可能流失。
+    elif row['recency_score'] in [1, 2] and row['frequency_score'] >= 4 and row['monetary_score'] >= 4:
+        return 'At-Risk Customers'
+    # 新客户: 最近购买时间短，但购买频率和金额较低。
+    elif row['recency_score'] >= 4 and row['frequency_score'] <= 2 and row['monetary_score'] <= 2:
+        return 'New Customers'
+    # 其他客户
+    else:
+        return 'Others'
+
+
+def customer_sales_frame(rows: List[dict]) -> pd.DataFrame:
+    """
+    sales.cube 按 partner 聚合的结果转成 CUSTOMER_SALES_COLUMNS 列的 DataFrame。
+    """
+    df = pd.DataFrame(rows).rename(columns={'partner': 'order_partner'})
+    return df.reindex(columns=CUSTOMER_SALES_COLUMNS)
+
+
+def prepare_customer_sales(df_customer_sales: pd.DataFrame) -> pd.DataFrame:
+    """
+    :param df_customer_sales: 每个客户一行：order_partner, price_subtotal, currency, order_count, last_day (YYYY-MM-DD)
+    """
+    reference_date = pd.Timestamp.now().normalize()
+    df_customer_sales = df_customer_sales.sort_values('price_subtotal', ascending=False).reset_index(drop=True)
+    df_customer_sales['avg_order_price'] = df_customer_sales['price_subtotal'] / df_customer_sales['order_count']
+    df_customer_sales['avg_order_price'] = df_customer_sales['avg_order_price'].round(2)
+
+    # 距离上次购买时间 (天)
+    df_customer_sales['last_order_days'] = (reference_date - pd.to_datetime(df_customer_sales['last_day'])).dt.days
+    return df_customer_sales
+
+
+def rfm_bin_edges(df_customer_sales: pd.DataFrame) -> Dict[str, List[float]]:
+    """
+    五分位的分箱边界，保存下来后增量更新的客户沿用同一套边界评分。
+    """
+    # 订单次数重复很多，加一点噪声使分位点唯一
+    noisy_order_count = df_customer_sales['order_count'] + np.random.uniform(0, 0.01, size=len(df_customer_sales))
+    _, monetary = pd.qcut(df_customer_sales['price_subtotal'], 5, retbins=True)
+    _, frequency = pd.qcut(noisy_order_count, 5, retbins=True)
+    _, recency = pd.qcut(df_customer_sales['last_order_days'], 5, retbins=True)
+    return dict(monetary=monetary.tolist(), frequency=frequency.tolist(), recency=recency.tolist())
+
+
+def _score(values: pd.Series, edges: List[float]) -> np.ndarray:
+    # 与 qcut 一致：区间左开右闭，超出边界的值归入首尾两档
+    return np.searchsorted(edges[1:-1], values.to_numpy(), side='left') + 1
+
+
+def apply_rfm_scores(df_customer_sales: pd.DataFrame, edges: Dict[str, List[float]]) -> pd.DataFrame:
+    # 订单金额评分
+    df_customer_sales['monetary_score'] = _score(df_customer_sales['price_subtotal'], edges['monetary'])
+    # 订单次数评分
+    df_customer_sales['frequency_score'] = _score(df_customer_sales['order_count'], edges['frequency'])
+    # 回购评分（天数越少分数越高）
+    df_customer_sales['recency_score'] = 6 - _score(df_customer_sales['last_order_days'], edges['recency'])
+
+    # 忠诚度得分：综合 RFM 评分（可加权）
+    df_customer_sales['loyalty_score'] = df_customer_sales['recency_score'] + \
+                                         df_customer_sales['frequency_score'] + \
+                                         df_customer_sales['monetary_score']
+    df_customer_sales['loyalty_score'] = df_customer_sales['loyalty_score'] / 3
+    df_customer_sales['loyalty_score'] = df_customer_sales['loyalty_score'].round(1)
+
+    # 客户类型分类
+    if len(df_customer_sales) > 0:
+        df_customer_sales['tag'] = df_customer_sales.apply(classify_customer, axis=1)
+    else:
+        df_customer_sales['tag'] = []
+    return df_customer_sales
+
+
+def score_customers(df_customer_sales: pd.DataFrame) -> pd.DataFrame:
+    """
+    按当前数据重新计算分位点并评分（不使用缓存）。
+    """
+    df_customer_sales = prepare_customer_sales(df_customer_sales)
+    return apply_rfm_scores(df_customer_sales, rfm_bin_edges(df_customer_sales))
+
+
+class OdooCustomerRfm:
+    """
+    缓存的客户 RFM 分群。
+    - recalibrate(): 重新计算所有客户的指标和分位点（定时执行）
+    - update(partners): 有新订单行的客户按已保存的分位点重新评分（订单行同步后执行）
+    """
+
+    def __init__(self, mdb_sales_cube, mdb_customer_rfm, alias: str, window_days: int = RFM_WINDOW_DAYS):
+        self.mdb_sales_cube = mdb_sales_cube
+        self.mdb_customer_rfm = mdb_customer_rfm
+        self.alias = alias
+        self.window_days = window_days
+
+    def customer_sales(self, partners: List[str] = None) -> pd.DataFrame:
+        since_day = (datetime.date.today() - datetime.timedelta(days=self.window_days)).isoformat()
+        filter_ = {"partner": {"$in": list(partners)}} if partners is not None else None
+        rows = self.mdb_sales_cube.aggregate_sales(self.alias, group_by=['partner'], since_day=since_day,
+                                                   filter_=filter_)
+        return prepare_customer_sales(customer_sales_frame(rows))
+
+    def _save(self, df_customer_sales: pd.DataFrame, as_of: str) -> int:
+        df_customer_sales = df_customer_sales.replace({np.nan: None})
+        documents = []
+        for row in df_customer_sales.to_dict('records'):
+            row['partner'] = row.pop('order_partner')
+            row.update(alias=self.alias, asOf=as_of)
+            documents.append(row)
+        self.mdb_customer_rfm.save_customers(self.alias, documents)
+        return len(documents)
+
+    def recalibrate(self) -> int:
+        as_of = time_utils.now()
+        df = self.customer_sales()
+        if len(df) < len(RFM_LABELS):
+            logger.info(f"Not enough customers to calibrate RFM scores ({len(df)})")
+            return 0
+        edges = rfm_bin_edges(df)
+        df = apply_rfm_scores(df, edges)
+        count = self._save(df, as_of)
+        # 窗口内已没有订单的客户
+        self.mdb_customer_rfm.delete_customers_not_in(self.alias, df['order_partner'].tolist())
+        self.mdb_customer_rfm.save_calibration(self.alias, dict(edges=edges, windowDays=self.window_days,
+                                                                calibratedAt=as_of, asOf=as_of))
+        logger.info(f"Recalibrated RFM scores of {count} customers")
+        return count
+
+    def update(self, partners: List[str]) -> int:
+        partners = [p for p in set(partners) if p]
+        if not partners:
+            return 0
+        calibration = self.mdb_customer_rfm.get_calibration(self.alias)
+        if calibration is None:
+            return self.recalibrate()
+        as_of = time_utils.now()
+        df = apply_rfm_scores(self.customer_sales(partners), calibration['edges'])
+        count = self._save(df, as_of)
+        self.mdb_customer_rfm.delete_customers(self.alias, list(set(partners) - set(df['order_partner'])))
+        self.mdb_customer_rfm.save_calibration(self.alias, dict(asOf=as_of))
+        logger.info(f"Updated RFM scores of {count} customers")
+        return count
+
+    def query(self) -> dict:
+        """
+        :return: 缓存的分群结果，asOf 为最后一次更新时间，calibratedAt 为分位点的计算时间
+        """
+        calibration = self.mdb_customer_rfm.get_calibration(self.alias) or {}
+        customers = self.mdb_customer_rfm.query_customers(self.alias)
+        return dict(
+            alias=self.alias,
+            asOf=calibration.get('asOf'),
+            calibratedAt=calibration.get('calibratedAt'),
+            windowDays=calibration.get('windowDays', self.window_days),
+            customers=customers,
+        )
@@ -1,10 +1,10 @@
 import datetime
 from typing import List
 
-import numpy as np
 import pandas as pd
 import plotly.express as px
 from services.odoo.OdooOrderService import OdooOrderService
+from services.odoo.OdooCustomerRfm import RFM_WINDOW_DAYS, customer_sales_frame, score_customers
 
 class OdooOrderDashboardService:
 
@@ -25,8 +25,7 @@ class OdooOrderDashboardService:
         df_sale_order_lines = self.to_sales_orderlines_dataframe(orderlines_data, days_ago)
 
         # 获得所有订单产品
-        product_ids = [line[1]['product_id'] for line in df_sale_order_lines.iterrows()]
-        product_ids = list(set(product_ids))
+        product_ids = [int(pid) for pid in df_sale_order_lines['product_id'].unique()]
         products_data = self.svc_order.svc_product.query_product_templates_by_ids(product_ids)
         df_products = pd.DataFrame.from_dict(
             [d.dict() for d in products_data],
@@ -94,66 +93,41 @@ class OdooOrderDashboardService:
 
         return df_filtered_orderlines
 
-    def __classify_customer(self, row):
+    def stats_sales_order_by_customer(self, days_ago: int = 365):
         """
-        Classify customers into different types based on their RFM scores.
+        客户 RFM 统计，数据来自预聚合的销售数据（sales.cube），不再逐行读取订单行。
+        默认时间窗口直接返回缓存的分群结果（asOf 列为计算时间）。
         """
-        # 高价值客户: 忠诚度评分较高，购买金额、频率较高，且最近购买时间较短。
-        if row['loyalty_score'] >= 4.0:
-            return 'High-Value Customers'
-        # 潜在流失客户: 最近购买时间较久，频率较高，曾经是重要客户，但可能流失。
-        elif row['recency_score'] in [1, 2] and row['frequency_score'] >= 4 and row['monetary_score'] >= 4:
-            return 'At-Risk Customers'
-        # 新客户: 最近购买时间短，但购买频率和金额较低。
-        elif row['recency_score'] >= 4 and row['frequency_score'] <= 2 and row['monetary_score'] <= 2:
-            return 'New Customers'
-        # 其他客户
-        else:
-            return 'Others'
-
-    def stats_sales_order_by_customer(self, days_ago: int = 365):
-        orderlines_data = self.svc_order.query_orderlines_by_salesman_id(salesman_ids=None)
-        df_sale_order_lines = self.to_sales_orderlines_dataframe(orderlines_data, days_ago)
-        reference_date = pd.Timestamp.now()
+        alias = self.api.get_alias()
+        mdb_sales_cube = self.svc_order.mdb_sales_cube
+        if not mdb_sales_cube.has_alias(alias):
+            self.svc_order.update_sales_cube()
+        if days_ago == RFM_WINDOW_DAYS:
+            segments = self.query_customer_segments()
+            if segments['customers']:
+                df_customer_sales = pd.DataFrame(segments['customers'])
+                df_customer_sales = df_customer_sales.rename(columns={'partner': 'order_partner'})
+                return df_customer_sales.drop(columns=['alias', 'last_day'], errors='ignore')
+
+        since_day = (datetime.date.today() - datetime.timedelta(days=days_ago)).isoformat()
         # 统计每一个客户的销售额 (不含运费，不含未结的)
-        df_customer_sales = df_sale_order_lines.groupby('order_partner') \
-            .agg({'price_subtotal': "sum", 'currency': 'first', 'order_number': 'nunique'})
-
-        df_customer_sales = df_customer_sales.rename(columns={'order_number': 'order_count'})
-
-        df_customer_sales = df_customer_sales.sort_values('price_subtotal', ascending=False)
-        df_customer_sales['avg_order_price'] = df_customer_sales['price_subtotal'] / df_customer_sales['order_count']
-        df_customer_sales['avg_order_price'] = df_customer_sales['avg_order_price'].round(2)
-
-        # 距离上次购买时间 (天)
-        last_order_days = df_sale_order_lines.groupby('order_partner')['create_date'].max().reset_index()
-        last_order_days['last_order_days'] = (reference_date - last_order_days['create_date']).dt.days
-        df_customer_sales = pd.merge(df_customer_sales, last_order_days[['order_partner', 'last_order_days']],
-                                     on='order_partner', how='left')
-
-        # 订单金额评分
-        df_customer_sales['monetary_score'] = pd.qcut(df_customer_sales['price_subtotal'], 5, labels=[1, 2, 3, 4, 5])
-        # 订单次数评分
-        df_customer_sales['noisy_order_count'] = df_customer_sales['order_count'] + np.random.uniform(0, 0.01, size=len(
-            df_customer_sales))
-        df_customer_sales['frequency_score'] = pd.qcut(df_customer_sales['noisy_order_count'], 5,
-                                                       labels=[1, 2, 3, 4, 5])
-        # 回购评分
-        df_customer_sales['recency_score'] = pd.qcut(df_customer_sales['last_order_days'], 5, labels=[5, 4, 3, 2, 1])
+        rows = mdb_sales_cube.aggregate_sales(alias, group_by=['partner'], since_day=since_day)
+        df_customer_sales = score_customers(customer_sales_frame(rows))
+        return df_customer_sales.drop(columns=['last_day'])
 
-        df_customer_sales.drop(columns=['noisy_order_count'], inplace=True)
-
-        # 忠诚度得分：综合 RFM 评分（可加权）
-        df_customer_sales['loyalty_score'] = df_customer_sales['recency_score'].astype(int) + \
-                                             df_customer_sales['frequency_score'].astype(int) + \
-                                             df_customer_sales['monetary_score'].astype(int)
-        df_customer_sales['loyalty_score'] = df_customer_sales['loyalty_score'] / 3
-        df_customer_sales['loyalty_score'] = df_customer_sales['loyalty_score'].round(1)
-
-        # 客户类型分类
-        df_customer_sales['tag'] = df_customer_sales.apply(self.__classify_customer, axis=1)
-        return df_customer_sales
+    def query_customer_segments(self) -> dict:
+        """
+        缓存的客户 RFM 分群（最近 RFM_WINDOW_DAYS 天），尚未计算时先计算一次。
+        """
+        rfm = self.svc_order.customer_rfm()
+        segments = rfm.query()
+        if segments['calibratedAt'] is None:
+            rfm.recalibrate()
+            segments = rfm.query()
+        return segments
 
+    def recalibrate_customer_segments(self) -> int:
+        return self.svc_order.customer_rfm().recalibrate()
 
     def stats_sales_order_by_customer_bubble_chart(self, days_ago: int = 365):
         df_customer_sales2 = self.stats_sales_order_by_customer(days_ago)
@@ -221,7 +195,3 @@ class OdooOrderDashboardService:
         )
 
         return fig.to_html(full_html=True)
-
-
-
-
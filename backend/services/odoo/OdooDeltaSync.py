@@ -0,0 +1,82 @@
+import base64
+import datetime
+import json
+from typing import Callable, Optional, Tuple
+
+import utils.time as time_utils
+from crud.odoo import TOMBSTONE_RETENTION_DAYS
+
+DELTA_PAGE_SIZE = 1000
+# 新令牌回退的秒数：同步时 fetchedAt 在写入之前生成，回退一段时间以免漏掉正在写入的文档
+DELTA_OVERLAP_SEC = 120
+
+
+def encode_sync_token(fetched_at: str, after_id, deleted_at: str) -> str:
+    payload = json.dumps(dict(f=fetched_at, i=after_id, d=deleted_at), separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_sync_token(token: str) -> Tuple[str, Optional[int], str]:
+    """
+    :return: (fetched_at, after_id, deleted_at)
+    :raises ValueError: 令牌无效
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return payload['f'], payload['i'], payload['d']
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid sync token: {token}") from e
+
+
+def query_delta(mdb, alias: str, since: Optional[str], limit: int,
+                to_item: Callable[[dict], Optional[dict]], projection=None) -> dict:
+    """
+    客户端增量同步。返回 since 令牌之后新增或修改的记录 (upserts) 和删除的记录 id (deleted)。
+    - since 为空、无效或早于墓碑保留期时 reset=True，返回全部记录，客户端应先清空本地缓存
+    - hasMore=True 时用返回的 token 继续读取下一页
+    :param mdb: 继承 DeltaSyncMixin 的 MongoDB 管理器（已连接）
+    :param to_item: 文档 -> 客户端记录；返回 None 表示记录对客户端不可见（例如已停用），按删除处理
+    """
+    now = datetime.datetime.now()
+    started_at = time_utils.datetime_to_str(now)
+    reset = True
+    fetched_at, after_id, deleted_at = "", None, started_at
+    if since:
+        try:
+            fetched_at, after_id, deleted_at = decode_sync_token(since)
+            reset = deleted_at < time_utils.days_ago(TOMBSTONE_RETENTION_DAYS)
+        except ValueError:
+            pass
+        if reset:
+            fetched_at, after_id, deleted_at = "", None, started_at
+
+    documents = mdb.query_changes(alias, fetched_at, after_id, limit=limit + 1, projection=projection)
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+
+    upserts, deleted = [], []
+    for doc in documents:
+        item = to_item(doc)
+        if item is None:
+            deleted.append(doc['_id'])
+        else:
+            upserts.append(item)
+
+    if has_more:
+        # 墓碑在最后一页一起返回，翻页时保持 deleted_at 不变
+        token = encode_sync_token(documents[-1]['fetchedAt'], documents[-1]['_id'], deleted_at)
+    else:
+        if not reset:
+            deleted.extend(mdb.query_deleted_ids(alias, deleted_at))
+        since_at = time_utils.datetime_to_str(now - datetime.timedelta(seconds=DELTA_OVERLAP_SEC))
+        token = encode_sync_token(since_at, None, since_at)
+
+    return dict(
+        alias=alias,
+        reset=reset,
+        hasMore=has_more,
+        token=token,
+        size=len(upserts),
+        upserts=upserts,
+        deleted=sorted(set(deleted)),
+    )
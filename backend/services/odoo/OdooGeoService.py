@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Tuple
 
 from pydantic import BaseModel
 
@@ -68,23 +68,50 @@ class OdooGeoService:
         return list_geo
 
 
-    def query_all_geo_contacts(self, offset, limit, min_customer_rank=0) -> List[GeoContact]:
-        filter_ = {
-            "alias": self.api.get_alias(),
-            "data.customer_rank": {"$gte": min_customer_rank},
-            "data.is_company": True,
-            "data.active": True,
-        }
-        data = self.mdb_contact.query_contacts(offset=offset, limit=limit, filter=filter_)
+    def to_geo_contacts(self, data: List[dict]) -> List[GeoContact]:
         list_geo = []
         for contact in data:
             try:
                 geo_contact = self.to_geo_contact(contact['data'])
+                if 'km_distance' in contact:
+                    geo_contact.km_distance = contact['km_distance']
                 list_geo.append(geo_contact)
             except KeyError as e:
                 logger.error(f"Error parsing contact id={contact['data']['id']}: {e}")
         return list_geo
 
+    def query_all_geo_contacts(self, offset, limit, min_customer_rank=0) -> List[GeoContact]:
+        filter_ = {
+            "alias": self.api.get_alias(),
+            "data.customer_rank": {"$gte": min_customer_rank},
+            "data.is_company": True,
+            "data.active": True,
+        }
+        data = self.mdb_contact.query_contacts(offset=offset, limit=limit, filter=filter_, projection="geo")
+        return self.to_geo_contacts(data)
+
+    def query_nearby_geo_contacts(self, longitude, latitude, radius_km=None, offset=0, limit=None,
+                                  min_customer_rank=0) -> Tuple[List[GeoContact], int]:
+        """
+        按距离排序查询附近的联系人（$geoNear，2dsphere 索引）。没有坐标的联系人不会返回。
+        :param radius_km: 最大距离，None 表示不限，配合 limit 查询最近的 k 个
+        :return: (contacts, total)，total 为半径内的联系人总数（radius_km 为 None 时为返回的数量）
+        """
+        alias = self.api.get_alias()
+        filter_ = {
+            "data.customer_rank": {"$gte": min_customer_rank},
+            "data.is_company": True,
+            "data.active": True,
+        }
+        data = self.mdb_contact.query_nearby(alias, longitude, latitude, max_km=radius_km, filter_=filter_,
+                                             offset=offset, limit=limit, projection="geo")
+        contacts = self.to_geo_contacts(data)
+        if radius_km is None:
+            return contacts, len(contacts)
+        if offset == 0 and (limit is None or len(data) < limit):
+            return contacts, len(data)
+        return contacts, self.mdb_contact.count_nearby(alias, longitude, latitude, radius_km, filter_=filter_)
+
     def query_all_geo_customers(self, offset, limit) -> List[GeoContact]:
         return self.query_all_geo_contacts(offset, limit, min_customer_rank=1)
 
@@ -102,13 +129,6 @@ class OdooGeoService:
                 {"data.mobile": {"$regex": keyword, "$options": "i"}},
             ]
         }
-        data = self.mdb_contact.query_contacts(offset=0, limit=limit, filter=filter_)
-        list_geo = []
-        for contact in data:
-            try:
-                geo_contact = self.to_geo_contact(contact['data'])
-                list_geo.append(geo_contact)
-            except KeyError as e:
-                logger.error(f"Error parsing contact id={contact['data']['id']}: {e}")
-        return list_geo
+        data = self.mdb_contact.query_contacts(offset=0, limit=limit, filter=filter_, projection="geo")
+        return self.to_geo_contacts(data)
 
@@ -0,0 +1,94 @@
+import base64
+import binascii
+import hashlib
+import io
+import os
+from typing import Optional
+
+from PIL import Image, UnidentifiedImageError
+
+from core.config2 import settings
+from core.log import logger
+
+# Odoo 产品图片字段（base64），同步时从文档中移除，只保留 image_digest
+ODOO_IMAGE_FIELDS = ('image_1920', 'image_1024', 'image_512', 'image_256', 'image_128')
+THUMBNAIL_SIZES = (128, 256, 512, 1024)
+
+
+class OdooImageStore:
+    """
+    按内容寻址的产品图片存储。
+    原图只保存一次：{image_dir}/odoo/{digest[:2]}/{digest}.{ext}，
+    同步时生成不同尺寸的 WebP 缩略图：{digest}_{size}.webp。
+    文件名由内容决定，内容不变则 URL 不变，可以长期缓存。
+    """
+
+    def __init__(self, root: str = None):
+        self.root = root or os.path.join(settings.static.image_dir, 'odoo')
+
+    def _dir(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2])
+
+    def save(self, b64_image: str) -> Optional[str]:
+        """
+        保存原图并生成缩略图（已存在则跳过）。
+        :return: 图片的 digest，图片无效时返回 None
+        """
+        if not b64_image:
+            return None
+        try:
+            raw = base64.b64decode(b64_image)
+        except binascii.Error as e:
+            logger.error(f"Invalid base64 product image: {e}")
+            return None
+        digest = hashlib.sha1(raw).hexdigest()
+        directory = self._dir(digest)
+        if os.path.exists(os.path.join(directory, f"{digest}_{THUMBNAIL_SIZES[-1]}.webp")):
+            return digest
+        try:
+            image = Image.open(io.BytesIO(raw))
+            image.load()
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+            # 损坏的图片只跳过这条记录，不影响同一批次中的其他产品
+            logger.error(f"Invalid product image {digest}: {e}")
+            return None
+
+        os.makedirs(directory, exist_ok=True)
+        ext = (image.format or 'bin').lower()
+        original = os.path.join(directory, f"{digest}.{ext}")
+        if not os.path.exists(original):
+            with open(original, "wb") as f:
+                f.write(raw)
+
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        for size in THUMBNAIL_SIZES:
+            thumb = image.copy()
+            thumb.thumbnail((size, size))
+            # 先写临时文件再改名，避免并发读到写了一半的文件
+            filename = os.path.join(directory, f"{digest}_{size}.webp")
+            thumb.save(filename + ".tmp", format='WEBP', quality=80, method=4)
+            os.replace(filename + ".tmp", filename)
+        return digest
+
+    def url(self, digest: str, size: int = 256) -> str:
+        """
+        :return: 相对于 image_dir 的 URL 路径，与 save_product_image 以前返回的格式一致
+        """
+        if not digest:
+            return ""
+        size = min((s for s in THUMBNAIL_SIZES if s >= size), default=THUMBNAIL_SIZES[-1])
+        return f"/odoo/{digest[:2]}/{digest}_{size}.webp"
+
+    def extract_images(self, item_data: dict) -> dict:
+        """
+        从 Odoo 产品数据中取出 base64 图片，存入图片库，用 image_digest 代替。
+        """
+        b64_image = item_data.get('image_1920') or ""
+        item_data['image_digest'] = self.save(b64_image) if b64_image else None
+        for field in ODOO_IMAGE_FIELDS:
+            item_data.pop(field, None)
+        return item_data
+
+
+odoo_image_store = OdooImageStore()
@@ -1,46 +1,84 @@
+import datetime
+from collections import defaultdict
 from typing import List
 
+import utils.time as time_utils
 from core.log import logger
+from crud.odoo import QUANT_SNAPSHOT_RESOLUTIONS
 from models.warehouse import Quant, PutawayRule
-from .base import OdooInventoryServiceBase, save_record
+from .base import OdooInventoryServiceBase, save_record, sync_changed_records
+from .OdooDeltaSync import query_delta, DELTA_PAGE_SIZE
+
+PRODUCT_INVENTORY_MODEL = 'product.inventory'
+PRODUCT_INVENTORY_CHUNK_SIZE = 500
 
 class OdooInventoryService(OdooInventoryServiceBase):
 
     def __init__(self, key_index, *args, **kwargs):
         super().__init__(key_index, *args, **kwargs)
 
-    def save_all_internal_locations(self):
+    def save_all_internal_locations(self, full_sync=False):
+        """
+        :param full_sync: Reconcile by sweeping all ids and write dates instead of
+                          fetching only the records changed since the last checkpoint.
+        """
+        if not full_sync:
+            return sync_changed_records(self.api.fetch_changed_internal_locations, 'stock.location', self.api.get_alias(),
+                                        self.mdb_location.save_storage_locations, self.mdb_checkpoint)
+
         fetch_object_ids = self.api.fetch_internal_location_ids
         fetch_write_date = self.api.fetch_location_write_date
-        query_object_by_id = self.mdb_location.query_storage_location_by_id
-        save_object = self.save_location
+        query_write_dates = self.mdb_location.query_write_dates
+        save_objects = self.save_locations
         object_name = 'stock.location'
-        save_record(fetch_object_ids, fetch_write_date,
-                         query_object_by_id, object_name, save_object)
+        return save_record(fetch_object_ids, fetch_write_date,
+                           query_write_dates, object_name, save_objects,
+                           query_saved_ids=lambda: self.mdb_location.query_ids_by_alias(self.api.get_alias()),
+                           delete_objects=self.mdb_location.delete_by_ids)
+
+    def save_all_quants(self, full_sync=False):
+        """
+        :param full_sync: Reconcile by sweeping all ids and write dates instead of
+                          fetching only the records changed since the last checkpoint.
+        """
+        if not full_sync:
+            return sync_changed_records(self.api.fetch_changed_quants, 'stock.quant', self.api.get_alias(),
+                                        self.mdb_quant.save_quants, self.mdb_checkpoint)
 
-    def save_all_quants(self):
         fetch_object_ids = self.api.fetch_quant_ids
         fetch_write_date = self.api.fetch_quant_write_date
-        query_object_by_id = self.mdb_quant.query_quant_by_id
-        save_object = self.save_quant
+        query_write_dates = self.mdb_quant.query_write_dates
+        save_objects = self.save_quants
         object_name = 'stock.quant'
-        save_record(fetch_object_ids, fetch_write_date,
-                         query_object_by_id, object_name, save_object)
+        return save_record(fetch_object_ids, fetch_write_date,
+                           query_write_dates, object_name, save_objects,
+                           query_saved_ids=lambda: self.mdb_quant.query_ids_by_alias(self.api.get_alias()),
+                           delete_objects=self.delete_quants)
+
+    def save_all_putaway_rules(self, full_sync=False):
+        """
+        :param full_sync: Reconcile by sweeping all ids and write dates instead of
+                          fetching only the records changed since the last checkpoint.
+        """
+        if not full_sync:
+            return sync_changed_records(self.api.fetch_changed_putaway_rules, 'stock.putaway.rule', self.api.get_alias(),
+                                        self.mdb_putaway_rule.save_putaway_rules, self.mdb_checkpoint)
 
-    def save_all_putaway_rules(self):
         fetch_object_ids = self.api.fetch_putaway_rule_ids
         fetch_write_date = self.api.fetch_putaway_rule_write_date
-        query_object_by_id = self.mdb_putaway_rule.query_putaway_rule_by_id
-        save_object = self.save_putaway_rule
+        query_write_dates = self.mdb_putaway_rule.query_write_dates
+        save_objects = self.save_putaway_rules
         object_name = 'stock.putaway.rule'
 
-        save_record(fetch_object_ids, fetch_write_date,
-                         query_object_by_id, object_name, save_object)
+        return save_record(fetch_object_ids, fetch_write_date,
+                           query_write_dates, object_name, save_objects,
+                           query_saved_ids=lambda: self.mdb_putaway_rule.query_ids_by_alias(self.api.get_alias()),
+                           delete_objects=self.delete_putaway_rules)
 
     def query_all_quants(self, offset, limit):
         # Query all quants from DB
         filter_ = {"alias": self.api.get_alias()}
-        data = self.mdb_quant.query_quants(offset=offset, limit=limit, filter=filter_)
+        data = self.mdb_quant.query_quants(offset=offset, limit=limit, filter=filter_, projection="list")
         quants: Quant = []
         for quant in data:
             q = self.to_standard_quant(quant)
@@ -57,7 +95,7 @@ class OdooInventoryService(OdooInventoryServiceBase):
         # Query quants by location ids from DB
         filter_ = {"alias": self.api.get_alias(),
                    "data.id": {"$in": quant_ids}}
-        data = self.mdb_quant.query_quants(offset=offset, limit=limit, filter=filter_)
+        data = self.mdb_quant.query_quants(offset=offset, limit=limit, filter=filter_, projection="list")
         quants: Quant = []
         for quant in data:
             if quant['data']['warehouse_id'] == False:
@@ -65,7 +103,7 @@ class OdooInventoryService(OdooInventoryServiceBase):
             q = self.to_standard_quant(quant)
             quants.append(q)
         location_ids = [int(q.locationId) for q in quants]
-        location_data = self.mdb_location.query_storage_location_by_ids(location_ids)
+        location_data = self.mdb_location.query_storage_location_by_ids(location_ids, projection="scanner")
         barcode_map = {loc['_id']: loc['data']['barcode'] for loc in location_data }
         for quant in quants:
             quant.locationCode = barcode_map.get(int(quant.locationId), "")
@@ -102,11 +140,19 @@ class OdooInventoryService(OdooInventoryServiceBase):
         )
         return ans
 
+    def query_location_changes(self, since=None, limit=DELTA_PAGE_SIZE):
+        # Locations changed or deleted since the sync token, same filter as query_all_locations
+        def to_item(location):
+            if not location['data'].get('active'):
+                return None
+            return dict(fetchedAt=location.get('fetchedAt', ""), location=location.get('data', ""))
+        return query_delta(self.mdb_location, self.api.get_alias(), since, limit, to_item)
+
     def query_all_putaway_rules(self, offset, limit):
         # Query all putaway rules from DB
         filter_ = {"alias": self.api.get_alias(), "data.active": True}
         data = self.mdb_putaway_rule.query_putaway_rules(offset=offset, limit=limit,
-                                                         filter=filter_)
+                                                         filter=filter_, projection="list")
         putaway_rules = []
         for putaway_rule in data:
             putaway_rules.append(dict(
@@ -124,7 +170,7 @@ class OdooInventoryService(OdooInventoryServiceBase):
         filter_ = {"alias": self.api.get_alias(),
                    "data.id": {"$in": putaway_rule_ids}}
         data = self.mdb_putaway_rule.query_putaway_rules(offset=offset, limit=limit,
-                                                         filter=filter_)
+                                                         filter=filter_, projection="list")
 
         # Convert to standard putaway rule
         putaway_rules: List[PutawayRule] = []
@@ -135,7 +181,7 @@ class OdooInventoryService(OdooInventoryServiceBase):
         location_in_ids = [int(rule.locationInId) for rule in putaway_rules]
         location_out_ids = [int(rule.locationOutId) for rule in putaway_rules]
         location_ids = list(set(location_in_ids + location_out_ids))
-        location_data = self.mdb_location.query_storage_location_by_ids(location_ids)
+        location_data = self.mdb_location.query_storage_location_by_ids(location_ids, projection="scanner")
         barcode_map = {loc['_id']: loc['data']['barcode'] for loc in location_data }
         for rule in putaway_rules:
             rule.locationInCode = barcode_map.get(int(rule.locationInId), "")
@@ -148,6 +194,170 @@ class OdooInventoryService(OdooInventoryServiceBase):
         )
         return ans
 
+    def delete_quants(self, quant_ids: List[int]) -> int:
+        """
+        删除库存并重建其产品的库存视图。删除后无法再按 fetchedAt 找到这些产品，因此在删除前读取产品 id。
+        """
+        if not quant_ids:
+            return 0
+        product_ids = self.mdb_quant.query_product_ids_by_ids(quant_ids)
+        deleted = self.mdb_quant.delete_by_ids(quant_ids)
+        self.rebuild_product_inventories(sorted(product_ids))
+        return deleted
+
+    def delete_putaway_rules(self, putaway_rule_ids: List[int]) -> int:
+        """
+        删除上架规则并重建其产品的库存视图。
+        """
+        if not putaway_rule_ids:
+            return 0
+        product_ids = self.mdb_putaway_rule.query_product_ids_by_ids(putaway_rule_ids)
+        deleted = self.mdb_putaway_rule.delete_by_ids(putaway_rule_ids)
+        self.rebuild_product_inventories(sorted(product_ids))
+        return deleted
+
+    def refresh_product_inventories(self, full=False) -> int:
+        """
+        增量更新产品库存视图：重建自上次刷新以来产品、库存、上架规则、包装或库位有变化的产品。
+        删除库存或上架规则时由 delete_quants / delete_putaway_rules 直接重建受影响的产品。
+        :param full: 重建所有产品，并删除已不存在的产品的视图
+        :return: 重建的产品数
+        """
+        alias = self.api.get_alias()
+        # 水位线是本地文档的 fetchedAt；先记录时间，刷新期间写入的变更留到下次
+        started_at = time_utils.now()
+        checkpoint = self.mdb_checkpoint.get_checkpoint(alias, PRODUCT_INVENTORY_MODEL)
+        since = checkpoint.get('fetchedAt') if checkpoint is not None else None
+        if full or since is None:
+            product_ids = set(self.mdb_product.query_ids_by_alias(alias))
+            stale_ids = set(self.mdb_product_inventory.query_ids_by_alias(alias)) - product_ids
+            self.mdb_product_inventory.delete_by_ids(list(stale_ids))
+        else:
+            product_ids = set(self.mdb_product.query_ids_fetched_since(alias, since))
+            product_ids.update(self.mdb_quant.query_product_ids_fetched_since(alias, since))
+            product_ids.update(self.mdb_putaway_rule.query_product_ids_fetched_since(alias, since))
+            product_ids.update(self.mdb_packaging.query_product_ids_fetched_since(alias, since))
+            # 库位名称或条码变化时，重建该库位上的产品
+            location_ids = self.mdb_location.query_ids_fetched_since(alias, since)
+            if location_ids:
+                product_ids.update(self.mdb_quant.query_product_ids_by_location_ids(alias, location_ids))
+                product_ids.update(self.mdb_putaway_rule.query_product_ids_by_location_ids(alias, location_ids))
+
+        rebuilt = self.rebuild_product_inventories(sorted(product_ids))
+        self.mdb_checkpoint.save_watermark(alias, PRODUCT_INVENTORY_MODEL, started_at, time_utils.now())
+        logger.info(f"Rebuilt {rebuilt} product inventory documents ({'full' if full or since is None else 'incremental'})")
+        return rebuilt
+
+    def rebuild_product_inventories(self, product_ids: List[int]) -> int:
+        """
+        重新生成产品库存视图文档：产品信息、各库位库存、上架规则和包装。
+        """
+        alias = self.api.get_alias()
+        rebuilt = 0
+        for i in range(0, len(product_ids), PRODUCT_INVENTORY_CHUNK_SIZE):
+            chunk_ids = product_ids[i:i + PRODUCT_INVENTORY_CHUNK_SIZE]
+            products = self.mdb_product.query_product_by_ids(chunk_ids, projection="list")
+            filter_ = {"alias": alias, "data.product_id": {"$in": chunk_ids}}
+            quants_data = self.mdb_quant.query_quants(filter=filter_, projection="list")
+            rules_data = self.mdb_putaway_rule.query_putaway_rules(filter={**filter_, "data.active": True},
+                                                                   projection="list")
+            packagings_data = self.mdb_packaging.query_packagings(filter=filter_, projection="scanner")
+
+            quants = [self.to_standard_quant(q) for q in quants_data if q['data']['warehouse_id'] != False]
+            rules = [self.to_standard_putaway_rule(r) for r in rules_data]
+            location_ids = {int(q.locationId) for q in quants}
+            location_ids.update(int(r.locationInId) for r in rules)
+            location_ids.update(int(r.locationOutId) for r in rules)
+            location_data = self.mdb_location.query_storage_location_by_ids(list(location_ids), projection="scanner")
+            barcode_map = {loc['_id']: loc['data']['barcode'] for loc in location_data}
+            for quant in quants:
+                quant.locationCode = barcode_map.get(int(quant.locationId), "")
+            for rule in rules:
+                rule.locationInCode = barcode_map.get(int(rule.locationInId), "")
+                rule.locationOutCode = barcode_map.get(int(rule.locationOutId), "")
+
+            quants_by_product, rules_by_product, packagings_by_product = {}, {}, {}
+            for quant in quants:
+                quants_by_product.setdefault(int(quant.productId), []).append(quant.dict())
+            for rule in rules:
+                rules_by_product.setdefault(int(rule.productId), []).append(rule.dict())
+            for packaging in packagings_data:
+                packagings_by_product.setdefault(packaging['data']['product_id'][0], []).append(packaging['data'])
+
+            updated_at = time_utils.now()
+            documents = []
+            for product in products:
+                pid = product['_id']
+                documents.append({
+                    '_id': pid,
+                    'alias': alias,
+                    'updatedAt': updated_at,
+                    'product': product['data'],
+                    'quants': quants_by_product.get(pid, []),
+                    'putaway_rules': rules_by_product.get(pid, []),
+                    'packagings': packagings_by_product.get(pid, []),
+                })
+            self.mdb_product_inventory.save_product_inventories([d['_id'] for d in documents], documents)
+            # 产品已被删除
+            self.mdb_product_inventory.delete_by_ids(list(set(chunk_ids) - {p['_id'] for p in products}))
+            rebuilt += len(documents)
+        return rebuilt
+
+    def query_product_inventory(self, product_id: int):
+        """
+        :return: 产品库存视图文档，尚未生成时返回 None
+        """
+        return self.mdb_product_inventory.query_product_inventory_by_id(product_id)
+
+    def query_product_inventories(self, product_ids: List[int], rebuild_missing=True) -> dict:
+        """
+        :param rebuild_missing: 为尚未生成视图的产品生成视图
+        :return: {产品 id: 产品库存视图文档}
+        """
+        inventories = {d['_id']: d for d in self.mdb_product_inventory.query_product_inventory_by_ids(product_ids)}
+        missing = [pid for pid in product_ids if pid not in inventories]
+        if missing and rebuild_missing:
+            self.rebuild_product_inventories(missing)
+            inventories.update((d['_id'], d) for d in self.mdb_product_inventory.query_product_inventory_by_ids(missing))
+        return inventories
+
+    def save_quant_snapshots(self, resolutions=("day",)) -> int:
+        """
+        从本地 stock.quant 汇总 产品 × 库位 的库存数量，写入库存时间序列快照。
+        :param resolutions: "day" 和/或 "hour"
+        :return: 写入的样本数
+        """
+        alias = self.api.get_alias()
+        at = datetime.datetime.now()
+        quantities = self.mdb_quant.aggregate_quantities(alias)
+        written = 0
+        for resolution in resolutions:
+            written += self.mdb_quant_snapshot.save_snapshot(alias, resolution, at, quantities)
+        logger.info(f"Saved {len(quantities)} quant snapshots ({', '.join(resolutions)})")
+        return written
+
+    def query_quant_history(self, product_ids: List[int], start: datetime.datetime, end: datetime.datetime,
+                            resolution="day", location_ids: List[int] = None) -> List[dict]:
+        """
+        库存趋势：每个产品的总库存和各库位库存的时间序列。
+        :return: [{"productId", "series": [{"time", "quantity"}], "locations": [{"locationId", "series"}]}]
+        """
+        samples = self.mdb_quant_snapshot.query_snapshots(self.api.get_alias(), resolution, product_ids,
+                                                          start, end, location_ids=location_ids)
+        totals = defaultdict(lambda: defaultdict(float))
+        by_location = defaultdict(lambda: defaultdict(list))
+        for sample in samples:
+            time_str = time_utils.datetime_to_str(sample['time'])
+            totals[sample['productId']][time_str] += sample['quantity']
+            by_location[sample['productId']][sample['locationId']].append(
+                dict(time=time_str, quantity=sample['quantity']))
+        return [dict(
+            productId=product_id,
+            series=[dict(time=t, quantity=q) for t, q in totals[product_id].items()],
+            locations=[dict(locationId=location_id, series=series)
+                       for location_id, series in by_location[product_id].items()],
+        ) for product_id in product_ids if product_id in totals]
+
     def move_quants_by_putaway_rules(self, putaway_rule_id):
         # TODO: Move quant by putaway rule
         raise NotImplementedError()
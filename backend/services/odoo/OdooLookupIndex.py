@@ -0,0 +1,310 @@
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.log import logger
+from crud.odoo import OdooProductMongoDB, OdooPackagingMongoDB
+import utils.time as time_utils
+
+# 增量刷新从上次刷新开始前这么多秒读取：fetchedAt 是读取 Odoo 的时间，文档在其后才写入 MongoDB
+WATERMARK_OVERLAP_SEC = 120
+# 文本搜索：命中的三元组占查询三元组的最低比例
+MIN_TRIGRAM_SIMILARITY = 0.6
+
+PRODUCT_KEY_PROJECTION = {"_id": 1, "data.barcode": 1, "data.default_code": 1,
+                          "data.name": 1, "data.active": 1}
+PACKAGING_KEY_PROJECTION = {"_id": 1, "data.barcode": 1, "data.product_id": 1,
+                            "data.name": 1}
+
+
+def normalize_key(value) -> Optional[str]:
+    # Odoo 用 False 表示空字段
+    if not value or not isinstance(value, str):
+        return None
+    return value.strip().lower() or None
+
+
+def watermark(started: datetime) -> str:
+    return time_utils.datetime_to_str(started - timedelta(seconds=WATERMARK_OVERLAP_SEC))
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    每个单词前后各补一个空格再切分，"ab" -> {" ab", "ab "}，短词和词首也能匹配。
+    """
+    grams = set()
+    for word in text.lower().split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class _AliasIndex:
+
+    def __init__(self):
+        self.product_ids_by_key: Dict[str, Set[int]] = {}
+        # 每个记录当前登记的键，记录更新后用来移除旧键
+        self.keys_by_product: Dict[int, Set[str]] = {}
+        self.keys_by_packaging: Dict[int, tuple] = {}
+        # 文本搜索：三元组 -> 产品 id；产品文本由名称、内部参考号和包装名称组成
+        self.product_ids_by_gram: Dict[str, Set[int]] = {}
+        self.grams_by_product: Dict[int, Set[str]] = {}
+        self.text_by_product: Dict[int, str] = {}
+        self.product_texts: Dict[int, str] = {}
+        self.packaging_names: Dict[int, Dict[int, str]] = {}
+        self.packaging_product: Dict[int, int] = {}
+        # 下一次增量刷新读取 fetchedAt 不早于此时间的文档和墓碑
+        self.watermark = ""
+
+    def _add(self, key, product_id):
+        self.product_ids_by_key.setdefault(key, set()).add(product_id)
+
+    def _remove(self, key, product_id):
+        ids = self.product_ids_by_key.get(key)
+        if ids is not None:
+            ids.discard(product_id)
+            if not ids:
+                del self.product_ids_by_key[key]
+
+    def put_product(self, doc):
+        product_id = doc['_id']
+        data = doc.get('data', {})
+        keys = {k for k in (normalize_key(data.get('barcode')), normalize_key(data.get('default_code'))) if k}
+        for key in self.keys_by_product.pop(product_id, set()) - keys:
+            self._remove(key, product_id)
+        for key in keys:
+            self._add(key, product_id)
+        self.keys_by_product[product_id] = keys
+        if data.get('active', True):
+            self.product_texts[product_id] = " ".join(str(v) for v in (data.get('default_code'), data.get('name')) if v)
+        else:
+            self.product_texts.pop(product_id, None)
+        self._update_text(product_id)
+
+    def remove_product(self, product_id):
+        for key in self.keys_by_product.pop(product_id, set()):
+            self._remove(key, product_id)
+        self.product_texts.pop(product_id, None)
+        self._update_text(product_id)
+
+    def put_packaging(self, doc):
+        packaging_id = doc['_id']
+        data = doc.get('data', {})
+        key = normalize_key(data.get('barcode'))
+        product_id = data['product_id'][0] if data.get('product_id') else None
+        self.remove_packaging(packaging_id)
+        if key and product_id:
+            self._add(key, product_id)
+            self.keys_by_packaging[packaging_id] = (key, product_id)
+        if product_id and data.get('name'):
+            self.packaging_product[packaging_id] = product_id
+            self.packaging_names.setdefault(product_id, {})[packaging_id] = data['name']
+            self._update_text(product_id)
+
+    def remove_packaging(self, packaging_id):
+        old = self.keys_by_packaging.pop(packaging_id, None)
+        if old is not None:
+            self._remove(*old)
+        old_product_id = self.packaging_product.pop(packaging_id, None)
+        if old_product_id is not None:
+            self.packaging_names.get(old_product_id, {}).pop(packaging_id, None)
+            self._update_text(old_product_id)
+
+    def apply(self, products, packagings, deleted_product_ids, deleted_packaging_ids):
+        # 先写入变更再删除：文档在墓碑之前读取，读取后才删除的记录也会被移除
+        for doc in products:
+            self.put_product(doc)
+        for doc in packagings:
+            self.put_packaging(doc)
+        for product_id in deleted_product_ids:
+            self.remove_product(product_id)
+        for packaging_id in deleted_packaging_ids:
+            self.remove_packaging(packaging_id)
+
+    def _update_text(self, product_id):
+        # 停用的产品不参与文本搜索
+        text = self.product_texts.get(product_id)
+        if text is not None:
+            text = " ".join([text, *self.packaging_names.get(product_id, {}).values()])
+        grams = trigrams(text) if text else set()
+        old = self.grams_by_product.pop(product_id, set())
+        for gram in old - grams:
+            ids = self.product_ids_by_gram.get(gram)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self.product_ids_by_gram[gram]
+        for gram in grams - old:
+            self.product_ids_by_gram.setdefault(gram, set()).add(product_id)
+        if grams:
+            self.grams_by_product[product_id] = grams
+            self.text_by_product[product_id] = text.lower()
+        else:
+            self.text_by_product.pop(product_id, None)
+
+    def search(self, query: str) -> List[Tuple[int, float]]:
+        """
+        :return: [(product id, score)]，按相关度排序
+        """
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        hits = Counter(chain.from_iterable(self.product_ids_by_gram.get(gram, ()) for gram in query_grams))
+        min_hits = max(1, int(len(query_grams) * MIN_TRIGRAM_SIMILARITY))
+        words = query.lower().split()
+        results = []
+        for product_id, count in hits.items():
+            if count < min_hits:
+                continue
+            text = self.text_by_product[product_id]
+            score = count / len(query_grams)
+            # 完整包含所有查询词的排在前面，再按相似度和文本长度（越短越贴近）排序
+            if all(word in text for word in words):
+                score += 1.0
+            score -= len(text) / 10000
+            results.append((product_id, score))
+        results.sort(key=lambda x: x[1], reverse=True)
+        return results
+
+
+class OdooLookupIndex:
+    """
+    扫码用的产品索引（按 alias 分开）：
+    - 精确匹配：条码、内部参考号（default_code）、包装条码 -> 产品 id
+    - 文本搜索：产品名称、内部参考号和包装名称的三元组倒排索引
+    数据来自 Odoo 同步写入 MongoDB 的文档。查询只读内存，不访问 MongoDB：
+    - 某个 alias 第一次查询时在后台线程中构建，构建完成前查询返回 None，由调用方回退到 MongoDB 查询；
+    - 同步和扫码修改产品后调用 sync/refresh，按 fetchedAt 读取变更并应用删除记录的墓碑；
+    - 全量同步后在锁外重建，完成后整体替换。
+    """
+
+    def __init__(self):
+        self.indexes: Dict[str, _AliasIndex] = {}
+        # 保护 indexes 及其内容；构建和读取 MongoDB 都在锁外进行
+        self.lock = threading.Lock()
+        # 串行执行增量刷新
+        self.refresh_lock = threading.Lock()
+        self._building: Set[str] = set()
+
+    def build(self, alias, mdb_product, mdb_packaging) -> _AliasIndex:
+        """
+        完整构建 alias 的索引并替换旧索引。
+        :param mdb_product: OdooProductMongoDB (已连接)
+        :param mdb_packaging: OdooPackagingMongoDB (已连接)
+        """
+        started, start = datetime.now(), time.monotonic()
+        index = _AliasIndex()
+        index.apply(mdb_product.query_products(filter={"alias": alias}, projection=PRODUCT_KEY_PROJECTION),
+                    mdb_packaging.query_packagings(filter={"alias": alias}, projection=PACKAGING_KEY_PROJECTION),
+                    (), ())
+        index.watermark = watermark(started)
+        with self.lock:
+            self.indexes[alias] = index
+        logger.info(f"Built lookup index for {alias}: {len(index.product_ids_by_key)} keys "
+                    f"in {round(time.monotonic() - start, 2)}s")
+        # 构建期间写入的变更
+        self.refresh(alias, mdb_product, mdb_packaging)
+        return index
+
+    def refresh(self, alias, mdb_product, mdb_packaging):
+        """
+        增量刷新：读取上次刷新以来变更的产品、包装和墓碑。索引尚未加载时不做任何事。
+        """
+        with self.refresh_lock:
+            with self.lock:
+                index = self.indexes.get(alias)
+            if index is None:
+                return
+            started = datetime.now()
+            since = index.watermark
+            products = list(mdb_product.query_products(filter={"alias": alias, "fetchedAt": {"$gte": since}},
+                                                       projection=PRODUCT_KEY_PROJECTION))
+            packagings = list(mdb_packaging.query_packagings(filter={"alias": alias, "fetchedAt": {"$gte": since}},
+                                                             projection=PACKAGING_KEY_PROJECTION))
+            deleted_product_ids = mdb_product.query_deleted_ids(alias, since)
+            deleted_packaging_ids = mdb_packaging.query_deleted_ids(alias, since)
+            with self.lock:
+                index.apply(products, packagings, deleted_product_ids, deleted_packaging_ids)
+                index.watermark = watermark(started)
+
+    def sync(self, alias, mdb_product, mdb_packaging, full=False):
+        """
+        同步写入 MongoDB 后调用：全量同步后重建，否则增量刷新。只更新本进程已加载的索引。
+        """
+        with self.lock:
+            loaded = alias in self.indexes
+        if not loaded:
+            return
+        if full:
+            self.build(alias, mdb_product, mdb_packaging)
+        else:
+            self.refresh(alias, mdb_product, mdb_packaging)
+
+    def _get(self, alias) -> Optional[_AliasIndex]:
+        # 调用方持有 self.lock
+        index = self.indexes.get(alias)
+        if index is None and alias not in self._building:
+            self._building.add(alias)
+            threading.Thread(target=self._build_in_background, args=(alias,),
+                             name=f"lookup-index-{alias}", daemon=True).start()
+        return index
+
+    def _build_in_background(self, alias):
+        try:
+            with OdooProductMongoDB() as mdb_product:
+                mdb_packaging = OdooPackagingMongoDB()
+                mdb_packaging.set_client(mdb_product.get_client())
+                self.build(alias, mdb_product, mdb_packaging)
+        except Exception as e:
+            # 下一次查询时重试
+            logger.error(f"Error in building lookup index for {alias}: {e}")
+        finally:
+            with self.lock:
+                self._building.discard(alias)
+
+    def lookup(self, alias, keyword) -> Optional[List[int]]:
+        """
+        :return: 条码、内部参考号或包装条码与 keyword 完全一致（不区分大小写）的产品 id；索引尚未构建完成时返回 None
+        """
+        with self.lock:
+            index = self._get(alias)
+            if index is None:
+                return None
+            return sorted(index.product_ids_by_key.get(normalize_key(keyword), ()))
+
+    def lookup_many(self, alias, keywords) -> Optional[Dict[str, List[int]]]:
+        """
+        批量精确匹配。
+        :return: {keyword: 产品 id}，未匹配的 keyword 对应空列表；索引尚未构建完成时返回 None
+        """
+        with self.lock:
+            index = self._get(alias)
+            if index is None:
+                return None
+            return {keyword: sorted(index.product_ids_by_key.get(normalize_key(keyword), ()))
+                    for keyword in keywords}
+
+    def search(self, alias, query, offset=0, limit=50) -> Optional[List[int]]:
+        """
+        三元组文本搜索（产品名称、内部参考号、包装名称），不区分大小写，容忍部分拼写错误。
+        :return: 按相关度排序的一页产品 id；索引尚未构建完成时返回 None
+        """
+        with self.lock:
+            index = self._get(alias)
+            if index is None:
+                return None
+            results = index.search(query)
+        return [product_id for product_id, _ in results[offset:offset + limit]]
+
+    def invalidate(self, alias=None):
+        with self.lock:
+            if alias is None:
+                self.indexes.clear()
+            else:
+                self.indexes.pop(alias, None)
+
+
+odoo_lookup_index = OdooLookupIndex()
@@ -1,10 +1,14 @@
+import datetime
 import re
 import xmlrpc
+from collections import defaultdict
 from typing import List, Dict
 from core.config2 import settings
 from core.db import RedisDataManager
 from core.log import logger
+from external.odoo import DATETIME_PATTERN as ODOO_DATETIME_PATTERN
 from external.odoo.base import OdooBasicAPI
+from external.odoo.order import DELIVERY_ORDER_OPEN_STATES
 from models import Address
 from models.orders import StandardProduct
 from schemas.vip import VipOrder, PimProduct, SpuProduct, SkuProduct, CrmAddress, CrmContact, CrmAddressProfile
@@ -12,40 +16,67 @@ from utils.stringutils import split_seller_sku
 from .base import (OdooProductServiceBase, OdooContactServiceBase, OdooProductPackagingServiceBase,
                    convert_datetime_to_utc_format, OrderLine, OdooServiceBase)
 
-from .base import save_record, OdooOrderServiceBase
+from .base import save_record, sync_changed_records, OdooOrderServiceBase
+from .base import SyncResult, SYNC_PAGE_SIZE, count_written, to_odoo_document
+from .OdooDeltaSync import query_delta, DELTA_PAGE_SIZE
 import utils.address as addr_utils
+import utils.time as time_utils
 
 odoo_access_key_index = settings.api_keys.odoo_access_key_index
+# 出库单镜像的两个增量检查点：出库单本身和出库 stock.move
+DELIVERY_SYNC_MODELS = ('stock.picking.delivery', 'stock.move.delivery')
+DELIVERY_SYNC_OVERLAP_SEC = 60
 
 class OdooProductService(OdooProductServiceBase):
 
     def __init__(self, key_index, *args, **kwargs):
         super().__init__(key_index, *args, **kwargs)
 
-    def save_all_product_templates(self):
+    def save_all_product_templates(self, full_sync=False):
+        """
+        :param full_sync: Reconcile by sweeping all ids and write dates instead of
+                          fetching only the records changed since the last checkpoint.
+        """
+        if not full_sync:
+            return sync_changed_records(self.api.fetch_changed_product_templates, 'product.template', self.api.get_alias(),
+                                        self.save_product_template_documents, self.mdb_checkpoint)
+
         fetch_object_ids = self.api.fetch_product_template_ids
         fetch_write_date = self.api.fetch_product_template_write_date
-        query_object_by_id = self.mdb_product_templ.query_product_template_by_id
-        save_object = self.save_product_template
+        query_write_dates = self.mdb_product_templ.query_write_dates
+        save_objects = self.save_product_templates
         object_name = 'product.template'
-        save_record(fetch_object_ids, fetch_write_date,
-                    query_object_by_id, object_name, save_object,
-                    include_inactive=True)
+        return save_record(fetch_object_ids, fetch_write_date,
+                           query_write_dates, object_name, save_objects,
+                           include_inactive=True,
+                           query_saved_ids=lambda: self.mdb_product_templ.query_ids_by_alias(self.api.get_alias()),
+                           delete_objects=self.mdb_product_templ.delete_by_ids)
+
+    def save_all_products(self, full_sync=False):
+        """
+        :param full_sync: Reconcile by sweeping all ids and write dates instead of
+                          fetching only the records changed since the last checkpoint.
+        """
+        if not full_sync:
+            return sync_changed_records(self.api.fetch_changed_products, 'product.product', self.api.get_alias(),
+                                        self.save_product_documents, self.mdb_checkpoint)
 
-    def save_all_products(self):
         fetch_object_ids = self.api.fetch_product_ids
         fetch_write_date = self.api.fetch_product_write_date
-        query_object_by_id = self.mdb_product.query_product_by_id
-        save_object = self.save_product
+        query_write_dates = self.mdb_product.query_write_dates
+        save_objects = self.save_products
         object_name = 'product.product'
-        save_record(fetch_object_ids, fetch_write_date,
-                    query_object_by_id, object_name, save_object,
-                    include_inactive=True)
+        return save_record(fetch_object_ids, fetch_write_date,
+                           query_write_dates, object_name, save_objects,
+                           include_inactive=True,
+                           query_saved_ids=lambda: self.mdb_product.query_ids_by_alias(self.api.get_alias()),
+                           delete_objects=self.mdb_product.delete_by_ids)
 
     def query_all_product_templates(self, offset, limit):
         # Query all products from DB
         filter_ = {"alias": self.api.get_alias(), "data.active": True,  "data.type": "product"}
-        data = self.mdb_product_templ.query_product_templates(offset=offset, limit=limit, filter=filter_)
+        data = self.mdb_product_templ.query_product_templates(offset=offset, limit=limit, filter=filter_,
+                                                         projection="list")
         products = []
         for product in data:
             # To standard product object
@@ -61,7 +92,7 @@ class OdooProductService(OdooProductServiceBase):
     def query_product_templates_by_ids(self, ids: List[int]):
         # Query products by ids from DB
         filter_ = {"alias": self.api.get_alias(), "data.id": {"$in": ids}}
-        data = self.mdb_product_templ.query_product_templates(filter=filter_)
+        data = self.mdb_product_templ.query_product_templates(filter=filter_, projection="list")
         products = []
         for product in data:
             # To standard product object
@@ -75,7 +106,7 @@ class OdooProductService(OdooProductServiceBase):
             "data.active": True,
             "data.default_code": code
         }
-        data = self.mdb_product.query_products(filter=filter_)
+        data = self.mdb_product.query_products(filter=filter_, projection="list")
         if len(data) == 0:
             return None
         product = data[0]
@@ -83,16 +114,23 @@ class OdooProductService(OdooProductServiceBase):
 
     def query_product_by_id(self, id):
         filter_ = {"alias": self.api.get_alias(), "data.id": id}
-        data = self.mdb_product.query_products(filter=filter_)
+        data = self.mdb_product.query_products(filter=filter_, projection="list")
         if len(data) == 0:
             return None
         product = data[0]
         return self.to_standard_product(product)
 
-    def query_all_products(self, offset, limit):
-        # Query all products from DB
+    def query_all_products(self, offset, limit, cursor=None):
+        """
+        Query all products from DB.
+        :param cursor: nextCursor of the previous page (keyset pagination); offset > 0 falls back to skip
+        """
         filter_ = {"alias": self.api.get_alias(), "data.active": True, "data.type": "product"}
-        data = self.mdb_product.query_products(offset=offset, limit=limit, filter=filter_)
+        if offset > 0:
+            data = self.mdb_product.query_products(offset=offset, limit=limit, filter=filter_, projection="list")
+            next_cursor = None
+        else:
+            data, next_cursor = self.mdb_product.query_products_page(filter_, limit, cursor, projection="list")
         products = []
         for product in data:
             # To standard product object
@@ -102,22 +140,42 @@ class OdooProductService(OdooProductServiceBase):
             alias=self.api.get_alias(),
             size=len(products),
             products=products,
+            nextCursor=next_cursor,
         )
         return ans
 
+    def query_product_changes(self, since=None, limit=DELTA_PAGE_SIZE):
+        # Products changed or deleted since the sync token, same filter as query_all_products
+        def to_item(product):
+            data = product['data']
+            if not data.get('active') or data.get('type') != 'product':
+                return None
+            return self.to_standard_product(product)
+        return query_delta(self.mdb_product, self.api.get_alias(), since, limit, to_item, projection="list")
+
 class OdooProductPackagingService(OdooProductPackagingServiceBase):
 
     def __init__(self, key_index, *args, **kwargs):
         super().__init__(key_index, *args, **kwargs)
 
-    def save_all_product_packaging(self):
+    def save_all_product_packaging(self, full_sync=False):
+        """
+        :param full_sync: Reconcile by sweeping all ids and write dates instead of
+                          fetching only the records changed since the last checkpoint.
+        """
+        if not full_sync:
+            return sync_changed_records(self.api.fetch_changed_packaging, 'product.packaging', self.api.get_alias(),
+                                        self.mdb_product_packaging.save_packagings, self.mdb_checkpoint)
+
         fetch_object_ids = self.api.fetch_packaging_ids
         fetch_write_date = self.api.fetch_packaging_write_date
-        query_object_by_id = self.mdb_product_packaging.query_packaging_by_id
-        save_object = self.save_product_packaging
+        query_write_dates = self.mdb_product_packaging.query_write_dates
+        save_objects = self.save_product_packagings
         object_name = 'product.packaging'
-        save_record(fetch_object_ids, fetch_write_date,
-                    query_object_by_id, object_name, save_object)
+        return save_record(fetch_object_ids, fetch_write_date,
+                           query_write_dates, object_name, save_objects,
+                           query_saved_ids=lambda: self.mdb_product_packaging.query_ids_by_alias(self.api.get_alias()),
+                           delete_objects=self.mdb_product_packaging.delete_by_ids)
 
     def query_all_product_packaging(self, offset, limit):
         # Query all product packaging from DB
@@ -150,15 +208,25 @@ class OdooContactService(OdooContactServiceBase):
     def __init__(self, key_index, *args, **kwargs):
         super().__init__(key_index, *args, **kwargs)
 
-    def save_all_contacts(self):
+    def save_all_contacts(self, full_sync=False):
+        """
+        :param full_sync: Reconcile by sweeping all ids and write dates instead of
+                          fetching only the records changed since the last checkpoint.
+        """
+        if not full_sync:
+            return sync_changed_records(self.api.fetch_changed_contacts, 'res.partner', self.api.get_alias(),
+                                        self.mdb_contact.save_contacts, self.mdb_checkpoint)
+
         fetch_object_ids = self.api.fetch_contact_ids
         fetch_write_date = self.api.fetch_contact_write_date
-        query_object_by_id = self.mdb_contact.query_contact_by_id
-        save_object = self.save_contact
+        query_write_dates = self.mdb_contact.query_write_dates
+        save_objects = self.save_contacts
         object_name = 'res.partner'
-        save_record(fetch_object_ids, fetch_write_date,
-                    query_object_by_id, object_name, save_object,
-                    include_inactive=True)
+        return save_record(fetch_object_ids, fetch_write_date,
+                           query_write_dates, object_name, save_objects,
+                           include_inactive=True,
+                           query_saved_ids=lambda: self.mdb_contact.query_ids_by_alias(self.api.get_alias()),
+                           delete_objects=self.mdb_contact.delete_by_ids)
 
     def query_all_contacts(self, offset, limit):
         # Query all contacts from DB
@@ -179,10 +247,17 @@ class OdooContactService(OdooContactServiceBase):
         return ans
 
 
-    def query_all_contact_shipping_addresses(self, offset, limit):
-        # Query all shipping addresses of a contact from DB
+    def query_all_contact_shipping_addresses(self, offset, limit, cursor=None):
+        """
+        Query all shipping addresses of a contact from DB.
+        :param cursor: nextCursor of the previous page (keyset pagination); offset > 0 falls back to skip
+        """
         filter_ = {"alias": self.api.get_alias(), "data.active": True}
-        data = self.mdb_contact.query_contacts(offset=offset, limit=limit, filter=filter_)
+        if offset > 0:
+            data = self.mdb_contact.query_contacts(offset=offset, limit=limit, filter=filter_)
+            next_cursor = None
+        else:
+            data, next_cursor = self.mdb_contact.query_contacts_page(filter_, limit, cursor)
         addresses: Address = []
         for contact in data:
             try:
@@ -195,9 +270,22 @@ class OdooContactService(OdooContactServiceBase):
             alias=self.api.get_alias(),
             size=len(addresses),
             addresses=addresses,
+            nextCursor=next_cursor,
         )
         return ans
 
+    def query_contact_address_changes(self, since=None, limit=DELTA_PAGE_SIZE):
+        # Shipping addresses changed or deleted since the sync token, same filter as query_all_contact_shipping_addresses
+        def to_item(contact):
+            if not contact['data'].get('active'):
+                return None
+            try:
+                return self.to_standard_address(contact)
+            except Exception as e:
+                logger.error(f"Failed to convert contact to address: {e}")
+                return None
+        return query_delta(self.mdb_contact, self.api.get_alias(), since, limit, to_item)
+
     def query_contact_by_company_name(self, company_name, email=None):
         company_regex = re.compile(f"{company_name.strip()}", re.IGNORECASE)
 
@@ -353,9 +441,107 @@ class OdooOrderService(OdooOrderServiceBase):
 
         return ans
 
-    def query_delivery_order_by_order_number(self, order_number):
-        self.api.login()
-        orders = self.api.fetch_delivery_order(order_number)
+    def refresh_delivery_orders(self, full=False) -> SyncResult:
+        """
+        同步待打包出库单的本地镜像。
+        - 全量（或首次）：读取全部未完成出库单，删除镜像中已不再是未完成的出库单
+        - 增量：按 (write_date, id) 检查点读取变更的出库单和出库 stock.move，
+          只重新读取这些出库单。出库单的 write_date 不会随 stock.move 变化，所以两者分别记录检查点。
+        """
+        alias = self.api.get_alias()
+        checkpoints = [self.mdb_checkpoint.get_checkpoint(alias, model) for model in DELIVERY_SYNC_MODELS]
+        if full or not all(checkpoints):
+            return self.__refresh_all_delivery_orders(alias)
+
+        picking_ids = set()
+        fetch_changed = [self.api.fetch_changed_delivery_orders, self.api.fetch_changed_delivery_moves]
+        marks = []
+        for fetch, checkpoint in zip(fetch_changed, checkpoints):
+            since, since_id = checkpoint['write_date'], checkpoint['record_id']
+            while True:
+                records = fetch(since, since_id, SYNC_PAGE_SIZE)
+                for rec in records:
+                    # stock.picking 记录本身的 id，stock.move 取 picking_id
+                    picking = rec.get('picking_id', [rec['id']])
+                    if picking:
+                        picking_ids.add(picking[0])
+                if records:
+                    since, since_id = records[-1]['write_date'], records[-1]['id']
+                if len(records) < SYNC_PAGE_SIZE:
+                    break
+            marks.append((since, since_id))
+
+        result = self.__save_delivery_orders(alias, sorted(picking_ids))
+        for model, (since, since_id) in zip(DELIVERY_SYNC_MODELS, marks):
+            self.mdb_checkpoint.save_checkpoint(alias, model, since, since_id, time_utils.now())
+        logger.info(f"Refreshed {result.fetched} changed delivery orders, "
+                    f"saved {result.written}, deleted {result.deleted}")
+        return result
+
+    def __refresh_all_delivery_orders(self, alias) -> SyncResult:
+        # 先记录水位再读取，读取期间的修改会在下次增量同步中再次读取
+        watermark = (datetime.datetime.utcnow() - datetime.timedelta(seconds=DELIVERY_SYNC_OVERLAP_SEC)) \
+            .strftime(ODOO_DATETIME_PATTERN)
+        open_ids = self.api.fetch_open_delivery_order_ids()
+        result = self.__save_delivery_orders(alias, open_ids)
+        stale_ids = list(set(self.mdb_delivery_order.query_ids_by_alias(alias)) - set(open_ids))
+        result.deleted += self.mdb_delivery_order.delete_by_ids(stale_ids) if stale_ids else 0
+        for model in DELIVERY_SYNC_MODELS:
+            self.mdb_checkpoint.save_checkpoint(alias, model, watermark, 0, time_utils.now())
+        logger.info(f"Refreshed all {len(open_ids)} open delivery orders, deleted {result.deleted}")
+        return result
+
+    def __save_delivery_orders(self, alias, picking_ids: List[int]) -> SyncResult:
+        """ 重新读取出库单及其 stock.move，保存未完成的出库单，删除其他的 """
+        result = SyncResult()
+        for start in range(0, len(picking_ids), SYNC_PAGE_SIZE):
+            chunk = picking_ids[start:start + SYNC_PAGE_SIZE]
+            orders = self.api.fetch_delivery_orders_by_ids(chunk) or []
+            open_orders = [o for o in orders if o['state'] in DELIVERY_ORDER_OPEN_STATES]
+            documents = self.__to_delivery_order_documents(alias, open_orders)
+            bulk_result = self.mdb_delivery_order.save_delivery_orders([doc['_id'] for doc in documents], documents)
+            closed_ids = list(set(chunk) - {o['id'] for o in open_orders})
+            if closed_ids:
+                result.deleted += self.mdb_delivery_order.delete_by_ids(closed_ids)
+            result.fetched += len(orders)
+            result.written += count_written(bulk_result)
+        return result
+
+    def __to_delivery_order_documents(self, alias, orders: List[dict]) -> List[dict]:
+        if not orders:
+            return []
+        moves_by_picking = defaultdict(list)
+        for move in self.api.fetch_delivery_moves_by_picking_ids([o['id'] for o in orders]):
+            moves_by_picking[move['picking_id'][0]].append(move)
+        documents = []
+        for order in orders:
+            doc = to_odoo_document(order, alias)
+            doc['moves'] = moves_by_picking.get(order['id'], [])
+            documents.append(doc)
+        return documents
+
+    def fetch_delivery_orders(self, order_number: str, refresh=False) -> List[dict]:
+        """
+        按单号查询出库单，优先读取本地镜像；镜像中没有或 refresh=True 时从 Odoo 读取。
+        :return: stock.picking 数据，moves 为出库单的 stock.move
+        """
+        alias = self.api.get_alias()
+        if not refresh:
+            docs = self.mdb_delivery_order.query_delivery_orders_by_name(alias, order_number)
+            if docs:
+                return [dict(doc['data'], moves=doc.get('moves', [])) for doc in docs]
+
+        orders = self.api.fetch_delivery_order(order_number) or []
+        documents = self.__to_delivery_order_documents(alias, orders)
+        open_documents = [doc for doc in documents if doc['data']['state'] in DELIVERY_ORDER_OPEN_STATES]
+        self.mdb_delivery_order.save_delivery_orders([doc['_id'] for doc in open_documents], open_documents)
+        closed_ids = [doc['_id'] for doc in documents if doc not in open_documents]
+        if closed_ids:
+            self.mdb_delivery_order.delete_by_ids(closed_ids)
+        return [dict(doc['data'], moves=doc['moves']) for doc in documents]
+
+    def query_delivery_order_by_order_number(self, order_number, refresh=False):
+        orders = self.fetch_delivery_orders(order_number, refresh=refresh)
         if not orders:
             logger.error(f"Delivery order {order_number} not found")
             raise RuntimeError(f"Delivery order {order_number} not found")
@@ -1,14 +1,23 @@
-from typing import List
+import re
+import xmlrpc.client
+from itertools import chain, zip_longest
+from typing import List, Dict
 import utils.time as utils_time
 import external.odoo.product as ext_product
 import models.warehouse as mwh
 from core.log import logger
 from schemas.barcode import ProductFullInfo, ProductUpdate, Quant, ProductPackaging, ProductPackagingUpdate, \
-    PutawayRule, PutawayRuleUpdate
+    PutawayRule, PutawayRuleUpdate, ResolvedBarcode, QuantCount, QuantRelocation, PutawayChange, BulkItemResult
 from services.odoo import OdooProductService, OdooInventoryService
 from services.odoo.OdooOrderService import OdooProductPackagingService, OdooOrderService
+from services.odoo.OdooImageStore import odoo_image_store
+from services.odoo.OdooLookupIndex import odoo_lookup_index, normalize_key, PRODUCT_KEY_PROJECTION, \
+    PACKAGING_KEY_PROJECTION
 import random
 
+# 批量写入 Odoo 时每次 write/create 的记录数
+BULK_WRITE_CHUNK_SIZE = 200
+
 class OdooScannerService:
 
     def __init__(self, key_index, login=True, *args, **kwargs):
@@ -55,51 +64,165 @@ class OdooScannerService:
         }
         return ProductFullInfo(**p)
 
-    def query_products_by_keyword(self, keyword, offset=0, limit=50) -> List[ProductFullInfo]:
-        filter_ = {"alias": self.api.get_alias(),
-                   "$or": [
-                       {"data.default_code":  {"$regex": keyword, "$options": "i"}},
-                       {"data.barcode":  {"$regex": keyword, "$options": "i"}},
-                       {"data.name":  {"$regex": keyword, "$options": "i"}},
-                       {"data.description":  {"$regex": keyword, "$options": "i"}},
-                   ]
-                }
-        products_data = self.mdb_product.query_products(filter=filter_, offset=offset, limit=limit)
-
-        # Query product by packaging barcode
-        packagings = self.query_packaging_by_barcode(keyword)
-        product_ids = [p.product_id for p in packagings]
-        products_data += self.mdb_product.query_product_by_ids(product_ids)
+    def __product_image_url(self, product_odoo, size) -> str:
+        digest = product_odoo.get('image_digest')
+        if digest:
+            return odoo_image_store.url(digest, size)
+        # Documents saved before the image store still embed base64 images
+        b64_image = product_odoo.get('image_1920', "")
+        if b64_image != False and b64_image != "":
+            return self.svc_product.save_product_image(b64_image, size)
+        return ""
 
-        # Query ordered products
+    def query_products_by_keyword(self, keyword, offset=0, limit=50) -> List[ProductFullInfo]:
+        ranked = False
         if keyword == "%ordered%":
-            ordered_products = self.fetch_ordered_products(limit=limit)
-            products_data = ordered_products
-
-        if keyword == "%complete%":
-            complete_products = self.fetch_product_to_complete_details(limit=limit)
-            products_data = complete_products
+            products_data = self.fetch_ordered_products(limit=limit)
+        elif keyword == "%complete%":
+            products_data = self.fetch_product_to_complete_details(limit=limit)
+        else:
+            # 扫码：条码、内部参考号或包装条码的精确匹配
+            product_ids = odoo_lookup_index.lookup(self.api.get_alias(), keyword)
+            if product_ids is None:
+                product_ids = self.__lookup_codes_in_mongodb([keyword])[keyword]
+            products_data = []
+            if product_ids:
+                products_data = [p for p in self.mdb_product.query_product_by_ids(product_ids, projection="scanner")
+                                 if p['data'].get('active', False)]
+            # 索引中的产品可能已停用或从 MongoDB 删除，此时按文本搜索
+            if not products_data:
+                products_data = self.search_products_by_text(keyword, offset=offset, limit=limit)
+                ranked = True
 
         products = []
         for pdata in products_data:
             product = pdata.get('data', "")
-            b64_image = product.get('image_256', "")
+            image_url = self.__product_image_url(product, size=256)
             product = self.__to_barcode_product_full_info(product)
-            if b64_image != False and b64_image != "":
-                product.image_url = self.svc_product.save_product_image(b64_image)
-            else:
-                product.image_url = ""
+            product.image_url = image_url
             products.append(product)
-        products = [p for p in products if p.active == True]
-        products.sort(key=lambda x: x.sku)
+        # 文本搜索在索引和查询条件中排除停用的产品，分页后不再过滤
+        if not ranked:
+            products = [p for p in products if p.active == True]
+            products.sort(key=lambda x: x.sku)
         return products
 
+    def search_products_by_text(self, keyword, offset=0, limit=50):
+        """
+        自由文本搜索（名称、内部参考号、包装名称），按相关度排序并分页。
+        三元组索引没有任何结果时（如部分条码、描述中的词）按正则搜索。
+        """
+        alias = self.api.get_alias()
+        product_ids = odoo_lookup_index.search(alias, keyword, offset=offset, limit=limit)
+        if product_ids is None:
+            return self.search_products_by_regex(keyword, offset=offset, limit=limit)
+        if not product_ids:
+            # 超出最后一页时不回退
+            if offset == 0 or not odoo_lookup_index.search(alias, keyword, offset=0, limit=1):
+                return self.search_products_by_regex(keyword, offset=offset, limit=limit)
+            return []
+        products_data = {p['_id']: p for p in self.mdb_product.query_product_by_ids(product_ids, projection="scanner")}
+        return [products_data[pid] for pid in product_ids if pid in products_data]
+
+    def search_products_by_regex(self, keyword, offset=0, limit=50):
+        # 查找索引尚未构建完成或没有结果时的文本搜索（正则，无法使用索引）
+        pattern = re.escape(keyword)
+        filter_ = {"alias": self.api.get_alias(),
+                   "data.active": True,
+                   "$or": [
+                       {"data.default_code":  {"$regex": pattern, "$options": "i"}},
+                       {"data.barcode":  {"$regex": pattern, "$options": "i"}},
+                       {"data.name":  {"$regex": pattern, "$options": "i"}},
+                       {"data.description":  {"$regex": pattern, "$options": "i"}},
+                   ]
+                }
+        return self.mdb_product.query_products(filter=filter_, offset=offset, limit=limit,
+                                               projection="scanner")
+
+    def __lookup_codes_in_mongodb(self, codes: List[str]) -> Dict[str, List[int]]:
+        """
+        查找索引尚未构建完成时的精确匹配：条码、内部参考号或包装条码与 code 一致（不区分大小写）。
+        :return: {code: 产品 id}
+        """
+        alias = self.api.get_alias()
+        codes_by_key = {}
+        for code in codes:
+            key = normalize_key(code)
+            if key is not None:
+                codes_by_key.setdefault(key, []).append(code)
+        ids_by_code = {code: set() for code in codes}
+        if not codes_by_key:
+            return {code: [] for code in codes}
+        patterns = [re.compile(f"^{re.escape(key)}$", re.IGNORECASE) for key in codes_by_key]
+
+        def add(value, product_id):
+            for code in codes_by_key.get(normalize_key(value), ()):
+                ids_by_code[code].add(product_id)
+
+        filter_ = {"alias": alias, "$or": [{"data.barcode": {"$in": patterns}},
+                                           {"data.default_code": {"$in": patterns}}]}
+        for doc in self.mdb_product.query_products(filter=filter_, projection=PRODUCT_KEY_PROJECTION):
+            add(doc['data'].get('barcode'), doc['_id'])
+            add(doc['data'].get('default_code'), doc['_id'])
+        filter_ = {"alias": alias, "data.barcode": {"$in": patterns}}
+        for doc in self.mdb_packaging.query_packagings(filter=filter_, projection=PACKAGING_KEY_PROJECTION):
+            if doc['data'].get('product_id'):
+                add(doc['data'].get('barcode'), doc['data']['product_id'][0])
+        return {code: sorted(ids) for code, ids in ids_by_code.items()}
+
+    def resolve_codes(self, codes: List[str], include_quants=True) -> Dict[str, ResolvedBarcode]:
+        """
+        批量解析扫码结果（条码、内部参考号、包装条码、库位条码）。
+        所有条码共用一次索引查找、一次产品库存视图查询和一次库位查询，不登录 Odoo。
+        :return: {code: ResolvedBarcode}，未找到的 code 的 found 为 False
+        """
+        alias = self.api.get_alias()
+        codes = list(dict.fromkeys(code.strip() for code in codes if code and code.strip()))
+        ids_by_code = odoo_lookup_index.lookup_many(alias, codes)
+        if ids_by_code is None:
+            ids_by_code = self.__lookup_codes_in_mongodb(codes)
+        product_ids = sorted(set(chain.from_iterable(ids_by_code.values())))
+        inventories = self.svc_inventory.query_product_inventories(product_ids)
+
+        unresolved = [code for code in codes if not ids_by_code[code]]
+        locations = {}
+        if unresolved:
+            filter_ = {"alias": alias, "data.barcode": {"$in": unresolved}}
+            for loc in self.mdb_location.query_storage_locations(filter=filter_, projection="scanner"):
+                locations[loc['data']['barcode']] = loc['data']
+
+        current_time = utils_time.now()
+        results = {}
+        for code in codes:
+            result = ResolvedBarcode(code=code, found=False)
+            key = code.lower()
+            for pid in ids_by_code[code]:
+                inventory = inventories.get(pid)
+                if inventory is None or not inventory['product'].get('active', True):
+                    continue
+                product = self.__to_barcode_product_full_info(inventory['product'])
+                product.image_url = self.__product_image_url(inventory['product'], size=256)
+                result.products.append(product)
+                result.packagings.extend(self.__to_product_packaging(pd) for pd in inventory['packagings']
+                                         if isinstance(pd.get('barcode'), str) and pd['barcode'].lower() == key)
+                if include_quants:
+                    result.quants.extend(self.__to_quant(mwh.Quant(**q), current_time) for q in inventory['quants'])
+            result.products.sort(key=lambda x: x.sku)
+            result.quants.sort(key=lambda x: (x.sku, x.location_code))
+            location = locations.get(code)
+            if location is not None:
+                result.location_id = location['id']
+                result.location_name = location.get('complete_name') or location.get('name')
+            result.found = bool(result.products) or location is not None
+            results[code] = result
+        return results
+
     def fetch_ordered_products(self, limit=50):
         api = self.svc_order.api.login()
         pids = api.fetch_ordered_product_ids()
         if not pids:
             return []
-        product_data = self.mdb_product.query_product_by_ids(pids)
+        product_data = self.mdb_product.query_product_by_ids(pids, projection="scanner")
         product_data = [p for p in product_data if p['data']['active'] == True]
         product_data = random.sample(product_data, limit)
         # Sort by default_code
@@ -111,7 +234,7 @@ class OdooScannerService:
         pids = api.fetch_product_ids_to_complete_details()
         if not pids:
             return []
-        product_data = self.mdb_product.query_product_by_ids(pids)
+        product_data = self.mdb_product.query_product_by_ids(pids, projection="scanner")
         product_data = [p for p in product_data if p['data']['active'] == True]
         product_data = random.sample(product_data, limit)
         # Sort by default_code
@@ -124,16 +247,13 @@ class OdooScannerService:
             self.svc_inventory.api.login()
             self.save_product_and_quants(id)
 
-        data = self.mdb_product.query_product_by_id(id)
+        data = self.mdb_product.query_product_by_id(id, projection="scanner")
         if not data:
             return None
         product = data['data']
-        b64_image = product.get('image_1920', "")
+        image_url = self.__product_image_url(product, size=1024)
         product = self.__to_barcode_product_full_info(product)
-        if b64_image != False and b64_image != "":
-            product.image_url = self.svc_product.save_product_image(b64_image)
-        else:
-            product.image_url = ""
+        product.image_url = image_url
         return product
 
     def update_product_by_id(self, id, data: ProductUpdate):
@@ -147,51 +267,55 @@ class OdooScannerService:
         self.api.update_product_by_id(id, values_to_update)
         # save product in database
         self.svc_product.save_product(id)
+        self.refresh_lookup_index()
         # query product from database
         return self.query_product_by_id(id)
 
     def query_quants_by_product_id(self, id) -> List[Quant]:
-        product_data = [self.mdb_product.query_product_by_id(id)]
-        if not product_data:
-            return []
-        product_data = product_data[0]['data']
-        quant_ids = product_data['stock_quant_ids']
+        inventory = self.svc_inventory.query_product_inventory(id)
+        if inventory is not None:
+            model_quants = [mwh.Quant(**q) for q in inventory['quants']]
+        else:
+            product_data = self.mdb_product.query_product_by_id(id, projection="scanner")
+            if not product_data:
+                return []
+            quant_ids = product_data['data']['stock_quant_ids']
+            data = self.svc_inventory.query_quants_by_quant_ids(quant_ids, offset=0, limit=1000)
+            model_quants: List[mwh.Quant] = data['quants']
 
         current_time = utils_time.now()
-        data = self.svc_inventory.query_quants_by_quant_ids(quant_ids, offset=0, limit=1000)
-        model_quants: List[mwh.Quant] = data['quants']
-        quants = []
-        for mq in model_quants:
-            last_count_days = 0
-            if mq.lastCountDate != None and mq.lastCountDate != "":
-                last_count_days = utils_time.diff_datetime(current_time, mq.lastCountDate)
-            last_count_days = int(last_count_days / (24 * 60 * 60))
-            quant = {
-                "id": mq.id,
-                "product_id": mq.productId,
-                "product_name": mq.productName,
-                "product_uom": mq.productUom,
-                "sku": mq.sku,
-                "quantity": mq.quantity,
-                "reserved_quantity": mq.reservedQuantity,
-                "available_quantity": mq.availableQuantity,
-                "inventory_quantity": mq.inventoryQuantity,
-                "inventory_quantity_set": mq.inventoryQuantitySet,
-                "location_name": mq.locationName,
-                "location_id": mq.locationId,
-                "location_code": mq.locationCode,
-                "warehouse_id": mq.warehouseId,
-                "warehouse_name": mq.warehouseName,
-                "last_count_days": last_count_days,
-            }
-            quant = Quant(**quant)
-            quants.append(quant)
+        quants = [self.__to_quant(mq, current_time) for mq in model_quants]
         quants.sort(key=lambda x: x.location_code)
         return quants
 
+    def __to_quant(self, mq: mwh.Quant, current_time: str) -> Quant:
+        last_count_days = 0
+        if mq.lastCountDate != None and mq.lastCountDate != "":
+            last_count_days = utils_time.diff_datetime(current_time, mq.lastCountDate)
+        last_count_days = int(last_count_days / (24 * 60 * 60))
+        quant = {
+            "id": mq.id,
+            "product_id": mq.productId,
+            "product_name": mq.productName,
+            "product_uom": mq.productUom,
+            "sku": mq.sku,
+            "quantity": mq.quantity,
+            "reserved_quantity": mq.reservedQuantity,
+            "available_quantity": mq.availableQuantity,
+            "inventory_quantity": mq.inventoryQuantity,
+            "inventory_quantity_set": mq.inventoryQuantitySet,
+            "location_name": mq.locationName,
+            "location_id": mq.locationId,
+            "location_code": mq.locationCode,
+            "warehouse_id": mq.warehouseId,
+            "warehouse_name": mq.warehouseName,
+            "last_count_days": last_count_days,
+        }
+        return Quant(**quant)
+
     def request_quant_by_id(self, quant_id, inv_quantity):
         """ 发起库存调整请求  """
-        quant_data = self.mdb_quant.query_quant_by_id(quant_id)
+        quant_data = self.mdb_quant.query_quant_by_id(quant_id, projection="list")
         if not quant_data:
             return False
         product_id = quant_data['data']['product_id'][0]
@@ -208,7 +332,7 @@ class OdooScannerService:
 
     def quant_relocation_by_id(self, quant_id, location_id):
         message = 'Relocation via Barcode Scanner [API]'
-        quant_data = self.mdb_quant.query_quant_by_id(quant_id)
+        quant_data = self.mdb_quant.query_quant_by_id(quant_id, projection="list")
         if not quant_data:
             return False
         product_id = quant_data['data']['product_id'][0]
@@ -224,19 +348,201 @@ class OdooScannerService:
             self.save_product_and_quants(product_id)
         return success
 
+    def request_quants_bulk(self, items: List[QuantCount]) -> List[BulkItemResult]:
+        """
+        批量盘点。盘点数量相同的库存一次 write，之后一次刷新受影响的产品和库存。
+        同一库存出现多次时以最后一次为准。
+        """
+        quant_ids = list({item.quant_id for item in items})
+        quants = {q['_id']: q for q in self.mdb_quant.query_quant_by_ids(quant_ids, projection="list")}
+        counts = {item.quant_id: item.quantity for item in items if item.quant_id in quants}
+        groups = {}
+        for quant_id, quantity in counts.items():
+            groups.setdefault(quantity, []).append(quant_id)
+
+        api = self.svc_inventory.api.login()
+        errors = self.__write_in_groups(groups, lambda quantity, ids: api.request_quants(ids, quantity))
+        self.save_products_and_quants({quants[qid]['data']['product_id'][0] for qid in counts if qid not in errors})
+        return [self.__bulk_result(index, item.quant_id, item.quant_id in quants, errors, "Quant not found")
+                for index, item in enumerate(items)]
+
+    def relocate_quants_bulk(self, items: List[QuantRelocation]) -> List[BulkItemResult]:
+        """
+        批量移库。移到同一库位的库存共用一次移库向导，之后一次刷新受影响的产品和库存。
+        """
+        message = 'Relocation via Barcode Scanner [API]'
+        quant_ids = list({item.quant_id for item in items})
+        quants = {q['_id']: q for q in self.mdb_quant.query_quant_by_ids(quant_ids, projection="list")}
+        locations = self.__location_ids_by_barcodes([item.location_barcode for item in items])
+        destinations = {item.quant_id: locations[item.location_barcode] for item in items
+                        if item.quant_id in quants and item.location_barcode in locations}
+        groups = {}
+        for quant_id, location_id in destinations.items():
+            groups.setdefault(location_id, []).append(quant_id)
+
+        api = self.svc_inventory.api.login()
+        errors = self.__write_in_groups(
+            groups, lambda location_id, ids: isinstance(api.relocate_quants(ids, location_id, message), dict))
+        self.save_products_and_quants({quants[qid]['data']['product_id'][0] for qid in destinations
+                                       if qid not in errors})
+        results = []
+        for index, item in enumerate(items):
+            if item.location_barcode not in locations:
+                results.append(BulkItemResult(index=index, id=item.quant_id, success=False,
+                                              message=f"Location with barcode {item.location_barcode} not found"))
+            else:
+                results.append(self.__bulk_result(index, item.quant_id, item.quant_id in quants, errors,
+                                                  "Quant not found"))
+        return results
+
+    def upsert_putaway_rules_bulk(self, items: List[PutawayChange]) -> List[BulkItemResult]:
+        """
+        批量设置上架规则：产品已有相同 location_in 的规则时更新，否则新建。
+        目标库位相同的更新一次 write，新建的规则分块一次 create，之后一次刷新受影响的产品。
+        """
+        alias = self.api.get_alias()
+        product_ids = list({item.product_id for item in items})
+        existing_products = {p['_id'] for p in self.mdb_product.query_product_by_ids(product_ids, projection={"_id": 1})}
+        locations = self.__location_ids_by_barcodes([item.location_barcode for item in items])
+        rules_data = self.mdb_putaway_rule.query_putaway_rules(
+            filter={"alias": alias, "data.product_id": {"$in": product_ids}, "data.active": True}, projection="list")
+        rule_ids = {(r['data']['product_id'][0], r['data']['location_in_id'][0]): r['_id'] for r in rules_data}
+
+        # (product_id, location_in_id) -> location_out_id，同一规则出现多次时以最后一次为准
+        changes = {(item.product_id, item.location_in_id): locations[item.location_barcode] for item in items
+                   if item.product_id in existing_products and item.location_barcode in locations}
+        update_groups, creates = {}, []
+        for key, location_out_id in changes.items():
+            if key in rule_ids:
+                update_groups.setdefault((location_out_id, key[1]), []).append(rule_ids[key])
+            else:
+                creates.append(key)
+
+        api = self.svc_inventory.api.login()
+        rule_errors = self.__write_in_groups(
+            update_groups, lambda value, ids: api.update_putaway_rules(ids, value[0], location_in_id=value[1]))
+        errors = {key: rule_errors[rule_ids[key]] for key in changes if rule_ids.get(key) in rule_errors}
+        for i in range(0, len(creates), BULK_WRITE_CHUNK_SIZE):
+            chunk = creates[i:i + BULK_WRITE_CHUNK_SIZE]
+            values = [dict(product_id=key[0], location_in_id=key[1], location_out_id=changes[key]) for key in chunk]
+            try:
+                created = api.create_putaway_rules(values)
+            except xmlrpc.client.Fault as e:
+                # Odoo 拒绝时整个 create 回滚，逐条重试不会产生重复的规则
+                logger.error(f"Failed to create {len(chunk)} putaway rules, retrying one by one: {e}")
+                created = []
+                for key in chunk:
+                    try:
+                        created.append(api.create_putaway_rule(key[0], changes[key], location_in_id=key[1]))
+                    except Exception as e:
+                        created.append(None)
+                        errors[key] = str(e)
+            except Exception as e:
+                # 连接错误时不知道 Odoo 是否已经创建，不重试，以免重复创建
+                logger.error(f"Failed to create {len(chunk)} putaway rules: {e}")
+                created = []
+                errors.update({key: str(e) for key in chunk})
+            # Odoo 没有返回 id 的规则视为创建失败
+            for key, rule_id in zip_longest(chunk, created or []):
+                if rule_id:
+                    rule_ids[key] = rule_id
+                elif key not in errors:
+                    errors[key] = "Odoo returned no result"
+
+        self.save_products_and_quants({key[0] for key in changes if key not in errors})
+        results = []
+        for index, item in enumerate(items):
+            key = (item.product_id, item.location_in_id)
+            result = BulkItemResult(index=index, id=item.product_id, success=False)
+            if item.product_id not in existing_products:
+                result.message = "Product not found"
+            elif item.location_barcode not in locations:
+                result.message = f"Location with barcode {item.location_barcode} not found"
+            elif key in errors:
+                result.message = errors[key]
+            else:
+                result.success = True
+                result.record_id = rule_ids.get(key)
+            results.append(result)
+        return results
+
+    def __write_in_groups(self, groups: dict, write_group) -> Dict[int, str]:
+        """
+        分组分块写入 Odoo：同一组的记录写入相同的值，每块一次调用；失败的块逐条重试，定位出错的记录。
+        :param groups: {写入的值: [记录 id]}
+        :param write_group: write_group(value, ids)，成功时返回真值
+        :return: {记录 id: 错误信息}，只包含失败的记录
+        """
+        def try_write(value, ids):
+            try:
+                return None if write_group(value, ids) else "Odoo returned no result"
+            except Exception as e:
+                return str(e)
+
+        errors = {}
+        for value, ids in groups.items():
+            for i in range(0, len(ids), BULK_WRITE_CHUNK_SIZE):
+                chunk = ids[i:i + BULK_WRITE_CHUNK_SIZE]
+                error = try_write(value, chunk)
+                if error is None:
+                    continue
+                if len(chunk) == 1:
+                    errors[chunk[0]] = error
+                    continue
+                logger.error(f"Bulk write of {len(chunk)} records failed, retrying one by one: {error}")
+                for id_ in chunk:
+                    error = try_write(value, [id_])
+                    if error is not None:
+                        errors[id_] = error
+        return errors
+
+    def __bulk_result(self, index, id_, found, errors, not_found_message) -> BulkItemResult:
+        if not found:
+            return BulkItemResult(index=index, id=id_, success=False, message=not_found_message)
+        if id_ in errors:
+            return BulkItemResult(index=index, id=id_, success=False, message=errors[id_])
+        return BulkItemResult(index=index, id=id_, success=True)
+
+    def __location_ids_by_barcodes(self, barcodes: List[str]) -> Dict[str, int]:
+        filter_ = {"alias": self.api.get_alias(), "data.barcode": {"$in": list(set(barcodes))}}
+        location_data = self.mdb_location.query_storage_locations(filter=filter_, projection="scanner")
+        return {loc['data']['barcode']: loc['data']['id'] for loc in location_data}
+
+    def refresh_lookup_index(self):
+        # 条码可能刚被修改或删除，立即读取变更而不等待下一次同步
+        odoo_lookup_index.refresh(self.api.get_alias(), self.mdb_product, self.mdb_packaging)
+
     def save_product_and_quants(self, product_id):
-        self.svc_product.save_product(product_id)
-        product_ = self.mdb_product.query_product_by_id(product_id)
-        quant_ids = product_['data']['stock_quant_ids']
-        for qid in quant_ids:
-            self.svc_inventory.save_quant(qid)
-        for prid in product_['data']['putaway_rule_ids']:
-            self.svc_inventory.save_putaway_rule(prid)
+        self.save_products_and_quants([product_id])
+
+    def save_products_and_quants(self, product_ids):
+        """
+        重新读取产品及其库存和上架规则：每类记录分块 read，每块一次 bulk_write。
+        """
+        product_ids = sorted(set(product_ids))
+        if not product_ids:
+            return
+        self.svc_product.save_products(product_ids)
+        products = self.mdb_product.query_product_by_ids(product_ids, projection="scanner")
+        quant_ids = [qid for p in products for qid in p['data']['stock_quant_ids']]
+        self.svc_inventory.save_quants(quant_ids)
+        # 移库后 Odoo 删除了原库位的库存，上架规则也可能已被删除；
+        # 删除的记录都属于 product_ids，下面重建这些产品的库存视图时一并更新
+        alias = self.api.get_alias()
+        stale_quant_ids = set(self.mdb_quant.query_ids_by_product_ids(alias, product_ids)) - set(quant_ids)
+        self.mdb_quant.delete_by_ids(sorted(stale_quant_ids))
+        rule_ids = [rid for p in products for rid in p['data']['putaway_rule_ids']]
+        self.svc_inventory.save_putaway_rules(rule_ids)
+        stale_rule_ids = set(self.mdb_putaway_rule.query_ids_by_product_ids(alias, product_ids)) - set(rule_ids)
+        self.mdb_putaway_rule.delete_by_ids(sorted(stale_rule_ids))
+        self.svc_inventory.rebuild_product_inventories(product_ids)
+        self.refresh_lookup_index()
 
     def query_location_by_barcode(self, barcode):
         filter_ = {"alias": self.api.get_alias(),
                    "data.barcode": barcode}
-        location_data = self.mdb_location.query_storage_locations(filter=filter_, offset=0, limit=10)
+        location_data = self.mdb_location.query_storage_locations(filter=filter_, offset=0, limit=10,
+                                                              projection="scanner")
         if not location_data:
             return None
         location = location_data[0]
@@ -257,13 +563,18 @@ class OdooScannerService:
         return ProductPackaging(**p)
 
     def query_packaging_by_product_ids(self, product_id) -> List[ProductPackaging]:
-        # api = self.svc_packaging.api.login()
-        product_data = self.mdb_product.query_product_by_id(product_id)
+        inventory = self.svc_inventory.query_product_inventory(product_id)
+        if inventory is not None:
+            packagings = [self.__to_product_packaging(pd) for pd in inventory['packagings']]
+            packagings.sort(key=lambda x: x.name)
+            return packagings
+
+        product_data = self.mdb_product.query_product_by_id(product_id, projection="scanner")
         packaging_ids = product_data['data']['packaging_ids']
 
         filter_ = {"alias": self.api.get_alias(),
                    "data.id": {"$in": packaging_ids}}
-        packaging_data = self.mdb_packaging.query_packagings(filter=filter_)
+        packaging_data = self.mdb_packaging.query_packagings(filter=filter_, projection="scanner")
         if not packaging_data:
             return []
         packagings = []
@@ -275,7 +586,8 @@ class OdooScannerService:
     def query_packaging_by_barcode(self, barcode: str) -> List[ProductPackaging]:
         filter_ = {"alias": self.api.get_alias(),
                    "data.barcode": barcode}
-        packaging_data = self.mdb_packaging.query_packagings(filter=filter_, offset=0, limit=100)
+        packaging_data = self.mdb_packaging.query_packagings(filter=filter_, offset=0, limit=100,
+                                                          projection="scanner")
         if not packaging_data:
             return []
         packagings = []
@@ -299,15 +611,21 @@ class OdooScannerService:
             logger.info(f"DEBUG MODE: update_packaging_by_id({packaging_id}, {data})")
         # save packaging in database
         self.svc_packaging.save_product_packaging(packaging_id)
+        self.refresh_lookup_index()
         # query packaging from database
         data = self.svc_packaging.query_packaging_by_id(packaging_id)
+        self.svc_inventory.rebuild_product_inventories([data['product_id'][0]])
         return self.__to_product_packaging(data)
 
     def query_putaway_rules_by_product_id(self, product_id: int) -> List[PutawayRule]:
-        product_data = self.mdb_product.query_product_by_id(product_id)
-        putaway_rule_ids = product_data['data']['putaway_rule_ids']
-        data = self.svc_inventory.query_putaway_rules_by_putaway_rule_ids(putaway_rule_ids, offset=0, limit=10)
-        model_putaway_rules: List[mwh.PutawayRule] = data['putaway_rules']
+        inventory = self.svc_inventory.query_product_inventory(product_id)
+        if inventory is not None:
+            model_putaway_rules = [mwh.PutawayRule(**r) for r in inventory['putaway_rules']]
+        else:
+            product_data = self.mdb_product.query_product_by_id(product_id, projection="scanner")
+            putaway_rule_ids = product_data['data']['putaway_rule_ids']
+            data = self.svc_inventory.query_putaway_rules_by_putaway_rule_ids(putaway_rule_ids, offset=0, limit=10)
+            model_putaway_rules: List[mwh.PutawayRule] = data['putaway_rules']
 
         putaway_rules = []
         for mpr in model_putaway_rules:
@@ -331,7 +649,7 @@ class OdooScannerService:
         return PutawayRule(**rule_)
 
     def upsert_putaway_rule_by_product_id(self, product_id: int, rule: PutawayRuleUpdate) -> PutawayRule:
-        product_data = self.mdb_product.query_product_by_id(product_id)
+        product_data = self.mdb_product.query_product_by_id(product_id, projection="scanner")
         putaway_rule_ids = product_data['data']['putaway_rule_ids']
         rules_data = self.svc_inventory.query_putaway_rules_by_putaway_rule_ids(putaway_rule_ids, offset=0, limit=10)
         model_putaway_rules: List[mwh.PutawayRule] = rules_data['putaway_rules']
@@ -355,7 +673,8 @@ class OdooScannerService:
         return self.__to_putaway_rule(rule)
 
 
-    def query_delivery_order_by_order_number(self, order_number: str): # -> List[DeliveryOrder]
-        with OdooOrderService(self.key_index, login=True) as svc:
-            order_data = svc.api.fetch_delivery_order(order_number)
+    def query_delivery_order_by_order_number(self, order_number: str, refresh=False): # -> List[DeliveryOrder]
+        # 优先读取本地镜像，未命中时 execute_kw 会自动登录
+        with OdooOrderService(self.key_index, login=False) as svc:
+            order_data = svc.fetch_delivery_orders(order_number, refresh=refresh)
         return order_data
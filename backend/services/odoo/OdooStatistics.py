@@ -1,75 +1,102 @@
 import datetime
+from typing import Dict, List, Sequence
 
 import pandas as pd
 
+from core.db import RedisDataManager
 from core.log import logger
 from external.odoo import OdooAPIKey
 from external.odoo.base import OdooAPIBase
 
 
+SALES_WINDOWS = (30, 60, 90, 120, 150, 180)
+SALES_CACHE_TTL_SEC = 24 * 3600
+
+
 class OdooStatisticsService:
+    R_SALES_BY_DAY = "odoo:sales_by_day:{alias}:{date}"
 
     def __init__(self, key_index, *args, **kwargs):
         api_key = OdooAPIKey.from_json(key_index)
         self.api = OdooAPIBase(api_key, **kwargs)
         self.alias = self.api.get_alias()
         self.username = self.api.get_username()
+        self.redis_man = RedisDataManager()
         logger.info(f"Odoo username: {self.username} ({self.alias})")
 
-    # Get sales data grouped by product_id
-    def _get_sales_data(self, from_date: str):
+    # Get sales data grouped by product_id and order day
+    def _get_daily_sales_data(self, from_date: str) -> Dict[int, Dict[str, float]]:
+        """
+        一次遍历取得 from_date 以来每个产品每天的销量，所有时间窗口都由它累加得到。
+        :return: {product_id: {"YYYY-MM-DD": qty}}
+        """
         cli = self.api.client
-        return cli.execute_kw(
+        orders = cli.search_read(
+            'sale.order',
+            [[
+                ['date_order', '>=', from_date],
+                ['state', 'in', ['sale', 'done']]  # 已确认，已完成
+            ]],
+            {'fields': ['date_order']})
+        order_days = {order['id']: order['date_order'][:10] for order in orders}
+        groups = cli.execute_kw(
             'sale.order.line', 'read_group',
             [[
                 ['order_id.date_order', '>=', from_date],
                 ['state', 'in', ['sale', 'done']]  # 已确认，已完成
             ]],
             {
-                'fields': ['product_id', 'product_uom_qty:sum'],
-                'groupby': ['product_id']
+                'fields': ['product_id', 'order_id', 'product_uom_qty:sum'],
+                'groupby': ['product_id', 'order_id'],
+                'lazy': False,
             })
+        sales_by_day = {}
+        for rec in groups:
+            if not rec['product_id'] or not rec['order_id']:
+                continue
+            day = order_days.get(rec['order_id'][0])
+            if day is None:
+                continue
+            days = sales_by_day.setdefault(rec['product_id'][0], {})
+            days[day] = days.get(day, 0) + rec['product_uom_qty']
+        return sales_by_day
+
+    def get_daily_sales(self, from_date: str) -> Dict[int, Dict[str, float]]:
+        """
+        按 alias 和日期缓存每日销量；当天已缓存的数据覆盖 from_date 时不再请求 Odoo。
+        """
+        today = datetime.date.today().isoformat()
+        key = self.R_SALES_BY_DAY.format(alias=self.alias, date=today)
+        cached = self.redis_man.get_json(key)
+        if cached is not None and cached['from_date'] <= from_date:
+            return {int(pid): days for pid, days in cached['items'].items()}
+        sales_by_day = self._get_daily_sales_data(from_date)
+        self.redis_man.set_json(key, {"from_date": from_date, "items": sales_by_day}, SALES_CACHE_TTL_SEC)
+        return sales_by_day
 
     # 生成产品销量报表
-    def product_sales_report(self):
+    def product_sales_report(self, windows: Sequence[int] = SALES_WINDOWS):
+        """
+        只缓存每日销量（get_daily_sales），在库和预测数量每次从 Odoo 读取。
+        :param windows: 统计销量的时间窗口（天）
+        """
+        windows = sorted(set(int(w) for w in windows))
+        rows = self._product_sales_rows(windows, datetime.date.today())
+        return self._to_report_dataframe(rows, windows)
+
+    def _product_sales_rows(self, windows: List[int], today: datetime.date) -> List[dict]:
         cli = self.api.client
-        # 时间范围
-        today = datetime.datetime.today()
-        date_30 = (today - datetime.timedelta(days=30)).strftime('%Y-%m-%d')
-        date_60 = (today - datetime.timedelta(days=60)).strftime('%Y-%m-%d')
-        date_90 = (today - datetime.timedelta(days=90)).strftime('%Y-%m-%d')
-        date_120 = (today - datetime.timedelta(days=120)).strftime('%Y-%m-%d')
-        date_150 = (today - datetime.timedelta(days=150)).strftime('%Y-%m-%d')
-        date_180 = (today - datetime.timedelta(days=180)).strftime('%Y-%m-%d')
-
-        # 获取销售数据
-        sales_30 = self._get_sales_data(date_30)
-        sales_60 = self._get_sales_data(date_60)
-        sales_90 = self._get_sales_data(date_90)
-        sales_120 = self._get_sales_data(date_120)
-        sales_150 = self._get_sales_data(date_150)
-        sales_180 = self._get_sales_data(date_180)
+        # 增长率和动销比总是需要 30 / 60 天
+        cutoffs = {w: (today - datetime.timedelta(days=w)).isoformat() for w in set(windows) | {30, 60}}
+        sales_by_day = self.get_daily_sales(min(cutoffs.values()))
 
         sales_data = {}
-
-        def merge_sales(data, key):
-            for rec in data:
-                if not rec['product_id']:
-                    continue
-                pid = rec['product_id'][0]
-                if pid not in sales_data:
-                    sales_data[pid] = {}
-                sales_data[pid][key] = rec['product_uom_qty']
-
-        merge_sales(sales_30, '30d')
-        merge_sales(sales_60, '60d')
-        merge_sales(sales_90, '90d')
-        merge_sales(sales_120, '120d')
-        merge_sales(sales_150, '150d')
-        merge_sales(sales_180, '180d')
+        for pid, days in sales_by_day.items():
+            sales_data[pid] = {f'{w}d': sum(qty for day, qty in days.items() if day >= cutoff)
+                               for w, cutoff in cutoffs.items()}
 
         # 只保留有销量的
-        filtered_ids = [pid for pid, vals in sales_data.items() if any(vals.values())]
+        filtered_ids = [pid for pid, vals in sales_data.items() if any(vals[f'{w}d'] for w in windows)]
 
         # 查询产品基本信息
         products = cli.read(
@@ -105,10 +132,6 @@ class OdooStatisticsService:
             min_qty = info.get('min_qty', 1)
             sales30d = round(sales_data[pid].get('30d', 0), 2)
             sales60d = round(sales_data[pid].get('60d', 0), 2)
-            sales90d = round(sales_data[pid].get('90d', 0), 2)
-            sales120d = round(sales_data[pid].get('120d', 0), 2)
-            sales150d = round(sales_data[pid].get('150d', 0), 2)
-            sales180d = round(sales_data[pid].get('180d', 0), 2)
             qty_available = round(product.get('qty_available', 0), 2)
             if int(sales60d-sales30d) == 0:
                 sales_growth_rate = 0
@@ -119,12 +142,7 @@ class OdooStatisticsService:
             row = {
                 'SKU': product.get('default_code') or '',
                 'Product Name': product['name'],
-                'Sales (30d)': sales30d,
-                'Sales (60d)': sales60d,
-                'Sales (90d)': sales90d,
-                'Sales (120d)': sales120d,
-                'Sales (150d)': sales150d,
-                'Sales (180d)': sales180d,
+                **{f'Sales ({w}d)': round(sales_data[pid].get(f'{w}d', 0), 2) for w in windows},
                 'On-Hand Quantity': qty_available,
                 'Forecasted Quantity': round(product.get('virtual_available', 0), 2),
                 'Sell-Through Rate (30d)': round(sales30d / max(qty_available, 1), 2),
@@ -135,18 +153,17 @@ class OdooStatisticsService:
                 'Supplier Name': info.get('partner_id', [None, ''])[1],
             }
             rows.append(row)
+        return rows
 
+    def _to_report_dataframe(self, rows: List[dict], windows: List[int]) -> pd.DataFrame:
         df = pd.DataFrame(rows)
+        if df.empty:
+            return df
         df.sort_values(by='SKU', ascending=True, inplace=True)
         # Rename
         df.rename(columns={
             'Product Name': '产品名称',
-            "Sales (30d)": "30天销量",
-            "Sales (60d)": "60天销量",
-            "Sales (90d)": "90天销量",
-            "Sales (120d)": "120天销量",
-            "Sales (150d)": "150天销量",
-            "Sales (180d)": "180天销量",
+            **{f"Sales ({w}d)": f"{w}天销量" for w in windows},
             "On-Hand Quantity": "在库数量",
             "Forecasted Quantity": "预测库存",
             "Sell-Through Rate (30d)": "30天动销比",
@@ -0,0 +1,124 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List
+
+from core.log import logger
+from external.odoo.base import odoo_request_budget
+from utils.ratelimit import TokenBucket
+from .OdooInventoryService import OdooInventoryService
+from .OdooLookupIndex import odoo_lookup_index
+from .OdooOrderService import (OdooProductService, OdooContactService,
+                               OdooProductPackagingService, OdooOrderService)
+from .base import SyncResult
+
+
+# 同一进程中同时只运行一次同步（定时增量同步与每日对账可能重叠）
+_sync_lock = threading.Lock()
+
+
+class OdooSyncRunner:
+    """
+    并发同步相互独立的 Odoo 模型。
+    所有任务共享同一个 Odoo 请求预算（令牌桶），并统计每个模型的耗时、读取数和写入数。
+    预算只作用于同步的工作线程，同一 Odoo 客户端上的扫码等交互请求不受限制。
+    """
+
+    def __init__(self, key_index, max_workers: int = 3, requests_per_sec: float = 5.0, full_sync=False,
+                 snapshot_resolutions=("day",)):
+        """
+        :param snapshot_resolutions: 同步后写入的库存快照分辨率，"day" 和/或 "hour"
+        """
+        self.key_index = key_index
+        self.max_workers = max_workers
+        self.requests_per_sec = requests_per_sec
+        self.full_sync = full_sync
+        self.snapshot_resolutions = snapshot_resolutions
+
+    def tasks(self):
+        """
+        :return: [(model, service class, callback(svc) -> SyncResult)]
+        """
+        full_sync = self.full_sync
+        return [
+            ('product.template', OdooProductService, lambda svc: svc.save_all_product_templates(full_sync=full_sync)),
+            ('product.product', OdooProductService, lambda svc: svc.save_all_products(full_sync=full_sync)),
+            ('res.partner', OdooContactService, lambda svc: svc.save_all_contacts(full_sync=full_sync)),
+            ('stock.quant', OdooInventoryService, lambda svc: svc.save_all_quants(full_sync=full_sync)),
+            ('stock.putaway.rule', OdooInventoryService, lambda svc: svc.save_all_putaway_rules(full_sync=full_sync)),
+            ('stock.location', OdooInventoryService, lambda svc: svc.save_all_internal_locations(full_sync=full_sync)),
+            ('product.packaging', OdooProductPackagingService, lambda svc: svc.save_all_product_packaging(full_sync=full_sync)),
+            ('sale.order.line', OdooOrderService, lambda svc: svc.save_all_orderlines()),
+            ('stock.picking', OdooOrderService, lambda svc: svc.refresh_delivery_orders(full=full_sync)),
+        ]
+
+    def _run_task(self, limiter, model, service_cls, callback) -> dict:
+        start = time.monotonic()
+        stats = dict(model=model, duration_sec=0.0, fetched=0, written=0, deleted=0, error=None)
+        try:
+            with odoo_request_budget(limiter), service_cls(key_index=self.key_index, login=True) as svc:
+                result = callback(svc)
+            if isinstance(result, SyncResult):
+                stats.update(fetched=result.fetched, written=result.written, deleted=result.deleted)
+        except Exception as e:
+            logger.error(f"Error in syncing {model} from Odoo: {e}")
+            stats['error'] = str(e)
+        stats['duration_sec'] = round(time.monotonic() - start, 1)
+        return stats
+
+    def refresh_product_inventories(self):
+        # 同步结束后更新产品库存视图（只读 MongoDB，不占用 Odoo 请求预算）
+        try:
+            with OdooInventoryService(key_index=self.key_index, login=False) as svc:
+                svc.refresh_product_inventories(full=self.full_sync)
+        except Exception as e:
+            logger.error(f"Error in refreshing product inventories: {e}")
+
+    def refresh_lookup_index(self):
+        # 扫码查找索引读取本次同步的变更和墓碑，全量同步后重建
+        try:
+            with OdooInventoryService(key_index=self.key_index, login=False) as svc:
+                odoo_lookup_index.sync(svc.alias, svc.mdb_product, svc.mdb_packaging, full=self.full_sync)
+        except Exception as e:
+            logger.error(f"Error in refreshing lookup index: {e}")
+
+    def save_quant_snapshots(self):
+        try:
+            with OdooInventoryService(key_index=self.key_index, login=False) as svc:
+                svc.save_quant_snapshots(resolutions=self.snapshot_resolutions)
+        except Exception as e:
+            logger.error(f"Error in saving quant snapshots: {e}")
+
+    def run(self) -> List[dict]:
+        """
+        另一次同步正在运行时，增量同步直接跳过（下一个周期再同步），全量对账等待其结束。
+        """
+        if not _sync_lock.acquire(blocking=self.full_sync):
+            logger.info("Odoo sync skipped: another sync is still running")
+            return []
+        try:
+            return self._run()
+        finally:
+            _sync_lock.release()
+
+    def _run(self) -> List[dict]:
+        limiter = TokenBucket(rate=self.requests_per_sec)
+        start = time.monotonic()
+        results = []
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="odoo-sync") as executor:
+            futures = [executor.submit(self._run_task, limiter, model, service_cls, callback)
+                       for model, service_cls, callback in self.tasks()]
+            for future in as_completed(futures):
+                stats = future.result()
+                logger.info(f"Odoo sync {stats['model']}: {stats['duration_sec']}s, "
+                            f"fetched {stats['fetched']}, written {stats['written']}, "
+                            f"deleted {stats['deleted']}" + (f", error: {stats['error']}" if stats['error'] else ""))
+                results.append(stats)
+        self.refresh_product_inventories()
+        self.refresh_lookup_index()
+        # 库存同步失败时不写快照，避免把过期的数量记为新样本
+        if self.snapshot_resolutions and not any(r['model'] == 'stock.quant' and r['error'] for r in results):
+            self.save_quant_snapshots()
+        logger.info(f"Odoo sync ({'full' if self.full_sync else 'incremental'}) finished "
+                    f"in {round(time.monotonic() - start, 1)}s")
+        return results
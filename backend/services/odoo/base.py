@@ -1,5 +1,3 @@
-import base64
-import os
 import time
 from pydantic import BaseModel
 
@@ -9,7 +7,9 @@ from crud.odoo import (OdooQuantMongoDB,
                        OdooStorageLocationMongoDB,
                        OdooPutawayRuleMongoDB,
                        OdooProductTemplateMongoDB, OdooContactMongoDB, OdooProductMongoDB, OdooPackagingMongoDB,
-                       OdooOrderlineMongoDB)
+                       OdooOrderlineMongoDB, OdooSyncCheckpointMongoDB, OdooProductInventoryMongoDB,
+                       OdooSalesCubeMongoDB, OdooCustomerRfmMongoDB, OdooDeliveryOrderMongoDB,
+                       OdooQuantSnapshotMongoDB)
 from external.odoo import OdooAPIKey, OdooInventoryAPI, OdooProductAPI, OdooContactAPI
 from external.odoo import DATETIME_PATTERN as ODOO_DATETIME_PATTERN
 import utils.time as time_utils
@@ -20,64 +20,50 @@ from models import Address
 from models.orders import StandardProduct
 from models.warehouse import Quant, PutawayRule
 import re
-import random
 
-from utils import stringutils
+from .OdooImageStore import odoo_image_store, ODOO_IMAGE_FIELDS
+from .OdooCustomerRfm import OdooCustomerRfm
 
 IMG_DIR = settings.static.image_dir
+SYNC_PAGE_SIZE = 200   # 每次 XML-RPC read / bulk_write 的记录数
+SYNC_PAUSE_SEC = 0.5   # 每批之间的间隔，避免请求过于频繁
+CHANGE_DETECTION_CHUNK_SIZE = 1000  # 每次 $in 查询 write_date 的 id 数
+MAX_DELETE_RATIO = 0.5  # 对账时一次最多删除的比例，防止 Odoo 返回不完整时误删
 
 
-def need_to_fetch_random(query_method, record_id, current_write_date: str):
-    """
-    判断是否需要从 Odoo 再次获取数据：
-      1. 在数据库中没有查到该记录时；
-      2. 随机抽取到一定概率时（此处为 1%）；
-      3. 数据库中的 write_date 与当前 Odoo 的 write_date 不一致时。
-
-    :param query_method: 数据库查询回调函数
-    :param record_id:    Odoo 记录的 ID
-    :param current_write_date: Odoo 中当前记录的 write_date
-    :return: 需要抓取则返回 True，否则返回 False
-    """
-    is_random_fetch = (random.random() < 0.01)
-    item = query_method(record_id)
+class SyncResult(BaseModel):
+    fetched: int = 0  # 从 Odoo 读取的记录数
+    written: int = 0  # 写入 MongoDB 的记录数（新增 + 修改）
+    deleted: int = 0  # 从 MongoDB 删除的记录数
 
-    # 随机概率或数据库中不存在该记录：直接需要再次抓取
-    if is_random_fetch or not item:
-        logger.info(f"Fetching {'randomly' if is_random_fetch else 'new data'} with id = {record_id}...")
-        return True
+    def add(self, other: 'SyncResult') -> 'SyncResult':
+        self.fetched += other.fetched
+        self.written += other.written
+        self.deleted += other.deleted
+        return self
 
-    # 数据库中已经有记录，但 write_date 不一致，需要更新
-    return item['data']['write_date'] != current_write_date
 
-def need_to_fetch(query_method, record_id, current_write_date: str):
-    """
-    判断是否需要从 Odoo 再次获取数据：
-        1. 在数据库中没有查到该记录时；
-        2. 数据库中的 write_date 与当前 Odoo 的 write_date 不一致时。
-    :param query_method: 数据库查询回调函数
-    :param record_id:    Odoo 记录的 ID
-    :param current_write_date:
-    :return:  需要抓取则返回
-    """
-    item = query_method(record_id)
-    if not item:
-        # Do not find the record in DB, need to fetch it
-        logger.info(f"Fetching new data with id = {record_id}...")
-        return True
-    # 数据库中已经有记录，但 write_date 不一致，需要更新
-    return item['data']['write_date'] != current_write_date
+def count_written(bulk_write_result) -> int:
+    if bulk_write_result is None:
+        return 0
+    return bulk_write_result.upserted_count + bulk_write_result.modified_count
+
 
 def save_record(fetch_object_ids, fetch_write_date,
-                query_object_by_id, object_name, save_object, include_inactive=False):
+                query_write_dates, object_name, save_objects, include_inactive=False,
+                chunk_size=CHANGE_DETECTION_CHUNK_SIZE, query_saved_ids=None, delete_objects=None):
     """
     Save records from Odoo API to MongoDB if the record has changed since last fetch.
 
     :param fetch_object_ids: A callback function of a fetch method of the Odoo API
     :param fetch_write_date: A callback function of a fetch method of the Odoo API
-    :param query_object_by_id: A callback function of a query method of the MongoDB
+    :param query_write_dates: A callback function query_write_dates(ids) -> {id: write_date} of the MongoDB
     :param object_name: The name of the object to be saved
-    :param save_object: A callback function of a save method of the MongoDB
+    :param save_objects: A callback function save_objects(ids) saving records in batches
+    :param query_saved_ids: A callback function query_saved_ids() -> ids saved in the MongoDB for this alias
+    :param delete_objects: A callback function delete_objects(ids) of the MongoDB.
+                           Together with query_saved_ids, removes records that no longer exist in Odoo.
+    :return: SyncResult
     """
     if include_inactive:
         domain = [("active", "in", [True, False])]
@@ -87,13 +73,126 @@ def save_record(fetch_object_ids, fetch_write_date,
     write_dates = fetch_write_date(object_ids)  # Fetch write dates from Odoo API
     dic_write_dates = {item['id']: item['write_date']
                        for item in write_dates}
-    uni_ids = dic_write_dates.keys()  # Unique ids
-    for id in uni_ids:
-        current_write_date = dic_write_dates[id]
-        if need_to_fetch(query_object_by_id, id, current_write_date):
-            # Save object if the record has changed since last fetch
-            logger.info(f"Saving {object_name} with id = {id}")
-            save_object(id)
+    uni_ids = list(dic_write_dates.keys())  # Unique ids
+    changed_ids = []
+    for start in range(0, len(uni_ids), chunk_size):
+        # One projected query per chunk: new records and records whose write_date differs
+        chunk = uni_ids[start:start + chunk_size]
+        saved_write_dates = query_write_dates(chunk)
+        changed_ids.extend(id for id in chunk
+                           if id not in saved_write_dates or saved_write_dates[id] != dic_write_dates[id])
+    # Save objects if the records have changed since last fetch
+    logger.info(f"Saving {len(changed_ids)} changed {object_name} records")
+    result = save_objects(changed_ids)
+    if query_saved_ids is not None and delete_objects is not None:
+        result.deleted = remove_deleted_records(uni_ids, query_saved_ids(), object_name, delete_objects)
+    return result
+
+
+def remove_deleted_records(odoo_ids, saved_ids, object_name, delete_objects,
+                           max_delete_ratio=MAX_DELETE_RATIO):
+    """
+    Remove records from MongoDB that no longer exist in Odoo (the domain of the sweep defines the id set).
+
+    :param odoo_ids: Ids currently in Odoo
+    :param saved_ids: Ids saved in the MongoDB
+    :param object_name: The name of the object
+    :param delete_objects: A callback function delete_objects(ids) of the MongoDB
+    :param max_delete_ratio: Skip deletion if more than this share of saved records would be removed,
+                             e.g. when Odoo returned an incomplete id list.
+    :return: Number of deleted records
+    """
+    gone_ids = sorted(set(saved_ids) - set(odoo_ids))
+    if not gone_ids:
+        return 0
+    if not odoo_ids or len(gone_ids) > len(saved_ids) * max_delete_ratio:
+        logger.warning(f"Skip removing {len(gone_ids)} of {len(saved_ids)} {object_name} records, "
+                       f"Odoo returned {len(odoo_ids)} ids")
+        return 0
+    logger.info(f"Removing {len(gone_ids)} {object_name} records deleted in Odoo: {gone_ids[:50]}")
+    return delete_objects(gone_ids)
+
+
+def save_records_in_batches(fetch_object_by_ids, ids, object_name, alias, save_objects,
+                            chunk_size=SYNC_PAGE_SIZE, pause_sec=SYNC_PAUSE_SEC):
+    """
+    Fetch records by ids in chunks (one XML-RPC read per chunk) and upsert each chunk with one bulk write.
+
+    :param fetch_object_by_ids: A callback function of a fetch method of the Odoo API
+    :param ids: Ids of the records
+    :param object_name: The name of the object to be saved
+    :param alias: Alias of the Odoo instance
+    :param save_objects: A callback function save_objects(ids, documents) of the MongoDB
+    :return: SyncResult
+    """
+    ids = list(ids)
+    result = SyncResult()
+    for start in range(0, len(ids), chunk_size):
+        if start > 0:
+            time.sleep(pause_sec)
+        chunk = ids[start:start + chunk_size]
+        records = fetch_object_by_ids(chunk) or []
+        if len(records) < len(chunk):
+            missing = set(chunk) - {item['id'] for item in records}
+            logger.error(f"Failed to fetch {object_name} with ids = {sorted(missing)}")
+        if records:
+            documents = [to_odoo_document(item_data, alias) for item_data in records]
+            bulk_result = save_objects([doc['_id'] for doc in documents], documents)
+            result.fetched += len(documents)
+            result.written += count_written(bulk_result)
+        logger.info(f"Saved {result.fetched}/{len(ids)} {object_name} records")
+    return result
+
+
+def sync_changed_records(fetch_changed, object_name, alias, save_objects, checkpoint_db: OdooSyncCheckpointMongoDB,
+                         page_size=SYNC_PAGE_SIZE, pause_sec=SYNC_PAUSE_SEC):
+    """
+    Incrementally save records that changed since the last checkpoint of the model/alias.
+    Records are fetched in pages ordered by (write_date, id), and the checkpoint is advanced
+    after each page has been saved, so an interrupted run resumes from the last saved page.
+
+    :param fetch_changed: A callback function fetch_changed(since, since_id, limit) of the Odoo API
+    :param object_name: The name of the object (Odoo model) to be saved
+    :param alias: Alias of the Odoo instance
+    :param save_objects: A callback function save_objects(ids, documents) of the MongoDB
+    :param checkpoint_db: Checkpoint storage
+    :param page_size: Number of records per page
+    :return: SyncResult
+    """
+    checkpoint = checkpoint_db.get_checkpoint(alias, object_name)
+    if checkpoint:
+        since, since_id = checkpoint['write_date'], checkpoint['record_id']
+    else:
+        # 首次运行：从数据库中已有的最新 write_date 开始
+        since, since_id = checkpoint_db.query_latest_write_date(alias, object_name), 0
+    logger.info(f"Syncing {object_name} changed since {since} (id > {since_id})")
+
+    result = SyncResult()
+    while True:
+        records = fetch_changed(since, since_id, page_size)
+        if not records:
+            break
+        documents = [to_odoo_document(item_data, alias) for item_data in records]
+        bulk_result = save_objects([doc['_id'] for doc in documents], documents)
+        since, since_id = records[-1]['write_date'], records[-1]['id']
+        checkpoint_db.save_checkpoint(alias, object_name, since, since_id, time_utils.now())
+        result.fetched += len(records)
+        result.written += count_written(bulk_result)
+        if len(records) < page_size:
+            break
+        time.sleep(pause_sec)
+    logger.info(f"Saved {result.fetched} changed {object_name} records")
+    return result
+
+
+def to_odoo_document(item_data, alias):
+    return {
+        '_id': item_data['id'],
+        'fetchedAt': time_utils.now(),
+        'createdAt': convert_datetime_to_utc_format(item_data['create_date']),
+        'data': item_data,
+        'alias': alias
+    }
 
 
 def convert_datetime_to_utc_format(odoo_datetime: str):
@@ -125,6 +224,12 @@ class OdooInventoryServiceBase:
         self.mdb_location = OdooStorageLocationMongoDB()
         self.mdb_quant = OdooQuantMongoDB()
         self.mdb_putaway_rule = OdooPutawayRuleMongoDB()
+        self.mdb_checkpoint = OdooSyncCheckpointMongoDB()
+        # 生成产品库存视图所需
+        self.mdb_product = OdooProductMongoDB()
+        self.mdb_packaging = OdooPackagingMongoDB()
+        self.mdb_product_inventory = OdooProductInventoryMongoDB()
+        self.mdb_quant_snapshot = OdooQuantSnapshotMongoDB()
         if key_index is not None:
             api_key = OdooAPIKey.from_json(key_index)
             self.api = OdooInventoryAPI(api_key, **kwargs)
@@ -137,67 +242,36 @@ class OdooInventoryServiceBase:
         client = self.mdb_location.get_client()
         self.mdb_quant.set_client(client)
         self.mdb_putaway_rule.set_client(client)
+        self.mdb_checkpoint.set_client(client)
+        self.mdb_product.set_client(client)
+        self.mdb_packaging.set_client(client)
+        self.mdb_product_inventory.set_client(client)
+        self.mdb_quant_snapshot.set_client(client)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.mdb_location.close()
 
     def save_location(self, location_id):
-        results = self.api.fetch_location_by_ids([location_id])
-        if results is None or len(results) == 0:
-            logger.error(f"Failed to fetch location with id = {location_id}")
-            return None
-        item_data = results[0]
-        fetchedAt = time_utils.now()
-        create_date = convert_datetime_to_utc_format(item_data['create_date'])
-        time.sleep(0.2)
-
-        document = {
-            '_id': location_id,
-            'fetchedAt': fetchedAt,
-            'createdAt': create_date,
-            'data': item_data,
-            'alias': self.api.get_alias()
-        }
-        logger.info(f"Saving location [{location_id}] {item_data['complete_name']}...")
-        return self.mdb_location.save_storage_location(location_id, document)
+        return self.save_locations([location_id])
+
+    def save_locations(self, location_ids):
+        return save_records_in_batches(self.api.fetch_location_by_ids, location_ids, 'stock.location',
+                                       self.api.get_alias(), self.mdb_location.save_storage_locations)
 
     def save_quant(self, quant_id):
-        results = self.api.fetch_quant_by_ids([quant_id])
-        if results is None or len(results) == 0:
-            logger.error(f"Failed to fetch quant with id = {quant_id}")
-            return None
-        item_data = results[0]
-        fetchedAt = time_utils.now()
-        create_date = convert_datetime_to_utc_format(item_data['create_date'])
-        time.sleep(0.2)
-        document = {
-            '_id': quant_id,
-            'fetchedAt': fetchedAt,
-            'createdAt': create_date,
-            'data': item_data,
-            'alias': self.api.get_alias()
-        }
-        return self.mdb_quant.save_quant(quant_id, document)
+        return self.save_quants([quant_id])
+
+    def save_quants(self, quant_ids):
+        return save_records_in_batches(self.api.fetch_quant_by_ids, quant_ids, 'stock.quant',
+                                       self.api.get_alias(), self.mdb_quant.save_quants)
 
     def save_putaway_rule(self, putaway_rule_id: int):
-        results = self.api.fetch_putaway_rule_by_ids([putaway_rule_id])
-        if results is None or len(results) == 0:
-            logger.error(f"Failed to fetch putaway rule with id = {putaway_rule_id}")
-            return None
-        item_data = results[0]
-        fetchedAt = time_utils.now()
-        create_date = convert_datetime_to_utc_format(item_data['create_date'])
-        time.sleep(0.2)
-
-        document = {
-            '_id': putaway_rule_id,
-            'fetchedAt': fetchedAt,
-            'createdAt': create_date,
-            'data': item_data,
-            'alias': self.api.get_alias()
-        }
-        return self.mdb_putaway_rule.save_putaway_rule(putaway_rule_id, document)
+        return self.save_putaway_rules([putaway_rule_id])
+
+    def save_putaway_rules(self, putaway_rule_ids):
+        return save_records_in_batches(self.api.fetch_putaway_rule_by_ids, putaway_rule_ids, 'stock.putaway.rule',
+                                       self.api.get_alias(), self.mdb_putaway_rule.save_putaway_rules)
 
     def to_standard_quant(self, quant) -> Quant:
         data = quant['data']
@@ -282,6 +356,7 @@ class OdooProductServiceBase:
         self.key_index = key_index
         self.mdb_product_templ = OdooProductTemplateMongoDB()
         self.mdb_product = OdooProductMongoDB()
+        self.mdb_checkpoint = OdooSyncCheckpointMongoDB()
         if key_index is not None:
             api_key = OdooAPIKey.from_json(key_index)
             self.api = OdooProductAPI(api_key, **kwargs)
@@ -293,60 +368,62 @@ class OdooProductServiceBase:
         self.mdb_product_templ.connect()
         client = self.mdb_product_templ.get_client()
         self.mdb_product.set_client(client)
+        self.mdb_checkpoint.set_client(client)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.mdb_product_templ.close()
 
     def save_product_template(self, product_templ_id):
-        results = self.api.fetch_product_templates_by_ids([product_templ_id])
-        if results is None or len(results) == 0:
-            logger.error(f"Failed to fetch product template with id = {product_templ_id}")
-            return None
-        item_data = results[0]
-        fetchedAt = time_utils.now()
-        create_date = convert_datetime_to_utc_format(item_data['create_date'])
-        time.sleep(0.2)
-
-        document = {
-            '_id': product_templ_id,
-            'fetchedAt': fetchedAt,
-            'createdAt': create_date,
-            'data': item_data,
-            'alias': self.api.get_alias()
-        }
-        return self.mdb_product_templ.save_product_template(product_templ_id, document)
+        return self.save_product_templates([product_templ_id])
+
+    def save_product_templates(self, product_templ_ids):
+        return save_records_in_batches(self.api.fetch_product_templates_by_ids, product_templ_ids, 'product.template',
+                                       self.api.get_alias(), self.save_product_template_documents)
+
+    def save_product_template_documents(self, product_templ_ids, documents):
+        # Images go to the image store, documents keep only data.image_digest
+        for document in documents:
+            odoo_image_store.extract_images(document['data'])
+        return self.mdb_product_templ.save_product_templates(product_templ_ids, documents)
 
     def save_product(self, product_id):
-        results = self.api.fetch_products_by_ids([product_id])
-        if results is None or len(results) == 0:
-            logger.error(f"Failed to fetch product with id = {product_id}")
-            return None
-        item_data = results[0]
-        fetchedAt = time_utils.now()
-        create_date = convert_datetime_to_utc_format(item_data['create_date'])
-        time.sleep(0.2)
-
-        document = {
-            '_id': product_id,
-            'fetchedAt': fetchedAt,
-            'createdAt': create_date,
-            'data': item_data,
-            'alias': self.api.get_alias()
-        }
-        return self.mdb_product.save_product(product_id, document)
-
-    def save_product_image(self, b64_image: str):
-        mid = int(len(b64_image) / 2)
-        md5 = stringutils.text_to_md5(b64_image[:256] + b64_image[mid - 256:mid + 256] + b64_image[-256:])
-        filename = f"{IMG_DIR}/{md5}.jpg"
-        _, rest = filename.split("images", 1)
-        new_path = rest
-        if os.path.exists(filename):
-            return new_path
-        with open(filename, "wb") as f:
-            f.write(base64.b64decode(b64_image))
-        return new_path
+        return self.save_products([product_id])
+
+    def save_products(self, product_ids):
+        return save_records_in_batches(self.api.fetch_products_by_ids, product_ids, 'product.product',
+                                       self.api.get_alias(), self.save_product_documents)
+
+    def save_product_documents(self, product_ids, documents):
+        for document in documents:
+            odoo_image_store.extract_images(document['data'])
+        return self.mdb_product.save_products(product_ids, documents)
+
+    def save_product_image(self, b64_image: str, size: int = 1024):
+        """
+        Save an inline base64 image to the image store.
+        :return: URL path of the thumbnail relative to the image directory
+        """
+        return odoo_image_store.url(odoo_image_store.save(b64_image), size)
+
+    def move_inline_images_to_store(self) -> int:
+        """
+        Move base64 images still embedded in saved product documents to the image store.
+        :return: Number of updated documents
+        """
+        moved = 0
+        unset = {f"data.{field}": "" for field in ODOO_IMAGE_FIELDS}
+        for mdb in (self.mdb_product_templ, self.mdb_product):
+            collection = mdb.get_db_collection()
+            cursor = collection.find({"data.image_1920": {"$exists": True}},
+                                     projection={"data.image_1920": 1})
+            for doc in cursor:
+                digest = odoo_image_store.save(doc['data'].get('image_1920') or "")
+                collection.update_one({"_id": doc["_id"]},
+                                      {"$set": {"data.image_digest": digest}, "$unset": unset})
+                moved += 1
+        logger.info(f"Moved {moved} inline product images to the image store")
+        return moved
 
     def to_standard_product(self, product_data) -> StandardProduct:
         alias = product_data['alias']
@@ -382,6 +459,7 @@ class OdooProductPackagingServiceBase:
     def __init__(self, key_index, *args, **kwargs):
         self.key_index = key_index
         self.mdb_product_packaging = OdooPackagingMongoDB()
+        self.mdb_checkpoint = OdooSyncCheckpointMongoDB()
         if key_index is not None:
             api_key = OdooAPIKey.from_json(key_index)
             self.api = OdooProductPackagingAPI(api_key, **kwargs)
@@ -391,28 +469,18 @@ class OdooProductPackagingServiceBase:
 
     def __enter__(self):
         self.mdb_product_packaging.connect()
+        self.mdb_checkpoint.set_client(self.mdb_product_packaging.get_client())
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.mdb_product_packaging.close()
 
     def save_product_packaging(self, product_packaging_id):
-        results = self.api.fetch_packaging_by_ids([product_packaging_id])
-        if results is None or len(results) == 0:
-            logger.error(f"Failed to fetch product packaging with id = {product_packaging_id}")
-            return None
-        item_data = results[0]
-        fetchedAt = time_utils.now()
-        create_date = convert_datetime_to_utc_format(item_data['create_date'])
-        time.sleep(0.2)
-        document = {
-            '_id': product_packaging_id,
-            'fetchedAt': fetchedAt,
-            'createdAt': create_date,
-            'data': item_data,
-            'alias': self.api.get_alias()
-        }
-        return self.mdb_product_packaging.save_packaging(product_packaging_id, document)
+        return self.save_product_packagings([product_packaging_id])
+
+    def save_product_packagings(self, product_packaging_ids):
+        return save_records_in_batches(self.api.fetch_packaging_by_ids, product_packaging_ids, 'product.packaging',
+                                       self.api.get_alias(), self.mdb_product_packaging.save_packagings)
 
     def to_standard_packaging(self, product_packaging_data) -> dict:
         pass
@@ -423,6 +491,7 @@ class OdooContactServiceBase:
     def __init__(self, key_index, *args, **kwargs):
         self.key_index = key_index
         self.mdb_contact = OdooContactMongoDB()
+        self.mdb_checkpoint = OdooSyncCheckpointMongoDB()
         if key_index is not None:
             api_key = OdooAPIKey.from_json(key_index)
             self.api = OdooContactAPI(api_key, **kwargs)
@@ -432,29 +501,18 @@ class OdooContactServiceBase:
 
     def __enter__(self):
         self.mdb_contact.connect()
+        self.mdb_checkpoint.set_client(self.mdb_contact.get_client())
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.mdb_contact.close()
 
     def save_contact(self, contact_id):
-        results = self.api.fetch_contacts_by_ids([contact_id])
-        if results is None or len(results) == 0:
-            logger.error(f"Failed to fetch contact with id = {contact_id}")
-            return None
-        item_data = results[0]
-        fetchedAt = time_utils.now()
-        create_date = convert_datetime_to_utc_format(item_data['create_date'])
-        time.sleep(0.2)
-
-        document = {
-            '_id': contact_id,
-            'fetchedAt': fetchedAt,
-            'createdAt': create_date,
-            'data': item_data,
-            'alias': self.api.get_alias()
-        }
-        return self.mdb_contact.save_contact(contact_id, document)
+        return self.save_contacts([contact_id])
+
+    def save_contacts(self, contact_ids):
+        return save_records_in_batches(self.api.fetch_contacts_by_ids, contact_ids, 'res.partner',
+                                       self.api.get_alias(), self.mdb_contact.save_contacts)
 
     def to_standard_address(self, contact) -> Address:
         c = contact['data']
@@ -538,6 +596,10 @@ class OdooOrderServiceBase:
     def __init__(self, key_index, *args, **kwargs):
         self.key_index = key_index
         self.mdb_order = OdooOrderlineMongoDB()
+        self.mdb_sales_cube = OdooSalesCubeMongoDB()
+        self.mdb_customer_rfm = OdooCustomerRfmMongoDB()
+        self.mdb_delivery_order = OdooDeliveryOrderMongoDB()
+        self.mdb_checkpoint = OdooSyncCheckpointMongoDB()
         if key_index is not None:
             api_key = OdooAPIKey.from_json(key_index)
             self.api = OdooOrderAPI(api_key, **kwargs)
@@ -563,8 +625,42 @@ class OdooOrderServiceBase:
                 "alias": self.api.get_alias()
             }
             list_docs.append(doc_)
+        # 找出 write_date 有变化的订单行，只重新聚合它们所在日期的销售数据
+        changed_days, changed_partners = set(), set()
+        for i in range(0, len(list_docs), CHANGE_DETECTION_CHUNK_SIZE):
+            chunk = list_docs[i:i + CHANGE_DETECTION_CHUNK_SIZE]
+            saved_write_dates = self.mdb_order.query_write_dates([doc["_id"] for doc in chunk])
+            for doc in chunk:
+                if saved_write_dates.get(doc["_id"]) != doc["data"].get("write_date"):
+                    changed_days.add(doc["data"]["create_date"][:10])
+                    if doc["data"]["order_partner_id"]:
+                        changed_partners.add(doc["data"]["order_partner_id"][1])
         logger.info(f"Saving orderlines")
-        return self.mdb_order.save_orderlines(list_ids_, list_docs)
+        bulk_result = self.mdb_order.save_orderlines(list_ids_, list_docs)
+        self.update_sales_cube(changed_days)
+        try:
+            self.customer_rfm().update(changed_partners)
+        except Exception as e:
+            logger.error(f"Error in updating customer RFM scores: {e}")
+        return SyncResult(fetched=len(list_docs), written=count_written(bulk_result))
+
+    def customer_rfm(self) -> OdooCustomerRfm:
+        return OdooCustomerRfm(self.mdb_sales_cube, self.mdb_customer_rfm, self.api.get_alias())
+
+    def update_sales_cube(self, days=None):
+        """
+        :param days: 需要重新聚合的日期，None 表示全部重建（首次生成时也会全部重建）
+        """
+        alias = self.api.get_alias()
+        if days is not None and not self.mdb_sales_cube.has_alias(alias):
+            days = None
+        if days is not None and not days:
+            return 0
+        cells = self.mdb_sales_cube.rebuild(alias, days=None if days is None else sorted(days),
+                                            updated_at=time_utils.now())
+        logger.info(f"Rebuilt {cells} sales cube cells for "
+                    f"{'all days' if days is None else f'{len(days)} days'}")
+        return cells
 
     def __extract_internal_ref_from_product_name(self, product_name):
         # 正则表达式匹配中括号内的内容
@@ -609,6 +705,10 @@ class OdooOrderServiceBase:
 
     def __enter__(self):
         self.mdb_order.connect()
+        self.mdb_sales_cube.set_client(self.mdb_order.get_client())
+        self.mdb_customer_rfm.set_client(self.mdb_order.get_client())
+        self.mdb_delivery_order.set_client(self.mdb_order.get_client())
+        self.mdb_checkpoint.set_client(self.mdb_order.get_client())
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -0,0 +1,124 @@
+"""
+附近客户查询基准：读取全部联系人后在 pandas 中用 haversine_vectorized 计算距离（原实现） vs. 2dsphere 索引上的 $geoNear。
+
+    python -m test.benchmark_geo_nearby --mongo-uri mongodb://localhost:27017 [--contacts 50000]
+
+合成数据写入临时数据库 benchmark_geo_nearby，测试结束后删除。
+"""
+import argparse
+import random
+import statistics
+import time
+
+import pandas as pd
+import pymongo
+
+from crud.odoo import OdooContactMongoDB
+from utils.utils_math import haversine_vectorized
+
+DB_NAME = "benchmark_geo_nearby"
+ALIAS = "bench"
+# 德国范围内的坐标
+LON_RANGE = (5.9, 15.0)
+LAT_RANGE = (47.3, 55.0)
+FILTER = {"data.customer_rank": {"$gte": 1}, "data.is_company": True, "data.active": True}
+
+
+def make_contacts(n_contacts, seed=42):
+    rnd = random.Random(seed)
+    docs = []
+    for contact_id in range(1, n_contacts + 1):
+        # 约 10% 的联系人没有坐标（Odoo 中为 0）
+        located = rnd.random() < 0.9
+        docs.append({
+            "_id": contact_id, "alias": ALIAS,
+            "data": {
+                "id": contact_id, "complete_name": f"Firma {contact_id}", "industry_id": False,
+                "email": f"info{contact_id}@example.com", "phone": False, "mobile": False,
+                "street": f"Straße {contact_id}", "street2": False, "zip": f"{rnd.randint(10000, 99999)}",
+                "city": "Stadt", "country_code": "DE",
+                "customer_rank": rnd.choice([0, 1, 1, 2, 5]), "total_invoiced": round(rnd.uniform(0, 50000), 2),
+                "active": rnd.random() < 0.95, "is_company": rnd.random() < 0.8,
+                "partner_longitude": rnd.uniform(*LON_RANGE) if located else 0.0,
+                "partner_latitude": rnd.uniform(*LAT_RANGE) if located else 0.0,
+                "user_id": [7, "Vertrieb"],
+            },
+        })
+    return docs
+
+
+def nearby_from_dataframe(mdb_contact, longitude, latitude, radius_km):
+    """ 原实现：读取全部客户，在 pandas 中计算距离、过滤并排序 """
+    data = mdb_contact.query_contacts(filter={"alias": ALIAS, **FILTER}, projection="geo")
+    df = pd.DataFrame([{"id": d["data"]["id"],
+                        "longitude": d["data"]["partner_longitude"],
+                        "latitude": d["data"]["partner_latitude"]} for d in data])
+    df["km_distance"] = haversine_vectorized(latitude, longitude, df["latitude"], df["longitude"])
+    df = df[(df["km_distance"] <= radius_km) & ((df["longitude"] != 0) | (df["latitude"] != 0))]
+    return df.sort_values(by="km_distance")
+
+
+def nearby_from_geo_index(mdb_contact, longitude, latitude, radius_km, limit=None):
+    return mdb_contact.query_nearby(ALIAS, longitude, latitude, max_km=radius_km, filter_=FILTER,
+                                    limit=limit, projection="geo")
+
+
+def timeit(fn, repeat):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--contacts", type=int, default=50_000)
+    parser.add_argument("--radius-km", type=float, default=50)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(args.mongo_uri)
+    mdb_contact = OdooContactMongoDB()
+    mdb_contact.db_name = DB_NAME
+    mdb_contact.set_client(client)
+    try:
+        docs = make_contacts(args.contacts)
+        for collection_name, indexes in mdb_contact.INDEXES.items():
+            client[DB_NAME][collection_name].create_indexes(indexes)
+        start = time.perf_counter()
+        for i in range(0, len(docs), 1000):
+            chunk = docs[i:i + 1000]
+            mdb_contact.save_contacts([d["_id"] for d in chunk], chunk)
+        print(f"{len(docs)} contacts saved with GeoJSON locations in {time.perf_counter() - start:.2f}s")
+
+        longitude, latitude = 9.99, 53.55  # Hamburg
+        t_before, df_before = timeit(
+            lambda: nearby_from_dataframe(mdb_contact, longitude, latitude, args.radius_km), args.repeat)
+        t_after, rows_after = timeit(
+            lambda: nearby_from_geo_index(mdb_contact, longitude, latitude, args.radius_km), args.repeat)
+        print(f"Within {args.radius_km:g} km: DataFrame {t_before:.1f} ms, $geoNear {t_after:.1f} ms "
+              f"({t_before / max(t_after, 1e-6):.1f}x)")
+
+        t_knn, _ = timeit(
+            lambda: nearby_from_geo_index(mdb_contact, longitude, latitude, None, limit=args.k), args.repeat)
+        t_count, total = timeit(
+            lambda: mdb_contact.count_nearby(ALIAS, longitude, latitude, args.radius_km, filter_=FILTER), args.repeat)
+        print(f"{args.k} nearest: $geoNear {t_knn:.1f} ms; count within radius ($geoWithin): {t_count:.1f} ms")
+
+        ids_before, ids_after = list(df_before["id"]), [d["_id"] for d in rows_after]
+        # haversine 与 MongoDB 使用的地球半径略有不同，半径边界上的联系人可能不同
+        max_diff = max((abs(a - b) for a, b in zip(df_before["km_distance"], [d["km_distance"] for d in rows_after])),
+                       default=0)
+        print(f"Contacts: {len(ids_before)} vs {len(ids_after)} (count {total}), "
+              f"same ids: {set(ids_before) == set(ids_after)}, max distance diff {max_diff:.3f} km")
+    finally:
+        client.drop_database(DB_NAME)
+
+
+if __name__ == '__main__':
+    main()
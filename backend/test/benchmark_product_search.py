@@ -0,0 +1,122 @@
+"""
+产品文本搜索基准：三元组索引 vs. 当前的不区分大小写 $regex。
+
+    python -m test.benchmark_product_search [--size 100000] [--mongo-uri mongodb://localhost:27017]
+
+不指定 --mongo-uri 时，正则方案用 Python 逐条匹配代替 MongoDB 的全集合扫描（unanchored $regex 无法使用索引）；
+指定时会把合成数据写入临时数据库 benchmark_product_search 并在测试结束后删除。
+"""
+import argparse
+import random
+import re
+import statistics
+import string
+import time
+
+from services.odoo.OdooLookupIndex import OdooLookupIndex
+
+WORDS = ["Schraube", "Mutter", "Scheibe", "Dübel", "Winkel", "Kabel", "Rohr", "Schelle", "Stahl", "Edelstahl",
+         "verzinkt", "Messing", "Kunststoff", "Holz", "Beton", "Senkkopf", "Sechskant", "Flansch", "Bohrer",
+         "Handschuhe", "Nitril", "Klebeband", "Folie", "Karton", "Palette", "Spray", "Silikon", "Schwarz", "Weiß"]
+QUERIES = ["schraube", "edelstahl senkkopf", "dübel 8", "nitril handschuhe", "SKU-04", "klebeband schwarz",
+           "schelle 25", "sechskantmutter", "zzzz"]
+
+
+class _Collection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def query_products(self, filter=None, projection=None):
+        since = (filter or {}).get("fetchedAt", {}).get("$gte", "")
+        return [doc for doc in self.docs if doc["fetchedAt"] >= since]
+
+    query_packagings = query_products
+
+    def query_deleted_ids(self, alias, since):
+        return []
+
+
+def make_catalog(size, seed=42):
+    rnd = random.Random(seed)
+    products, packagings = [], []
+    for i in range(1, size + 1):
+        name = " ".join(rnd.sample(WORDS, 3)) + f" {rnd.choice([4, 5, 6, 8, 10, 12, 25])}mm"
+        products.append({
+            "_id": i, "alias": "bench", "fetchedAt": "2024-01-01T00:00:00Z",
+            "data": {"id": i, "name": name, "default_code": f"SKU-{i:06d}", "active": True,
+                     "barcode": "".join(rnd.choices(string.digits, k=13)),
+                     "description": " ".join(rnd.sample(WORDS, 5))},
+        })
+        if i % 5 == 0:
+            packagings.append({
+                "_id": i, "alias": "bench", "fetchedAt": "2024-01-01T00:00:00Z",
+                "data": {"id": i, "name": f"Karton {rnd.choice([50, 100, 200])} Stk", "product_id": [i, name],
+                         "barcode": False},
+            })
+    return products, packagings
+
+
+def regex_search(products, keyword, limit=50):
+    pattern = re.compile(keyword, re.IGNORECASE)
+    fields = ("default_code", "barcode", "name", "description")
+    hits = []
+    # 与 find().limit() 一样，找到一页结果即停止（不排序）
+    for p in products:
+        if any(pattern.search(str(p["data"].get(f) or "")) for f in fields):
+            hits.append(p)
+            if len(hits) >= limit:
+                break
+    return hits
+
+
+def timeit(fn, repeat):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+
+    products, packagings = make_catalog(args.size)
+    mdb_product, mdb_packaging = _Collection(products), _Collection(packagings)
+    lookup_index = OdooLookupIndex()
+    start = time.perf_counter()
+    lookup_index.build("bench", mdb_product, mdb_packaging)
+    print(f"Built trigram index for {args.size} products in {time.perf_counter() - start:.1f}s")
+
+    collection = None
+    if args.mongo_uri:
+        import pymongo
+        client = pymongo.MongoClient(args.mongo_uri)
+        collection = client["benchmark_product_search"]["product.product"]
+        collection.drop()
+        collection.insert_many(products)
+
+    print(f"{'query':<22}{'regex (ms)':>12}{'hits':>6}{'mongo (ms)':>12}{'trigram (ms)':>14}{'hits':>6}")
+    try:
+        for query in QUERIES:
+            t_regex, regex_hits = timeit(lambda: regex_search(products, query), args.repeat)
+            t_mongo = float("nan")
+            if collection is not None:
+                filter_ = {"alias": "bench", "$or": [{f"data.{f}": {"$regex": query, "$options": "i"}}
+                                                     for f in ("default_code", "barcode", "name", "description")]}
+                t_mongo, _ = timeit(lambda: list(collection.find(filter_).limit(50)), args.repeat)
+            t_index, index_hits = timeit(
+                lambda: lookup_index.search("bench", query, offset=0, limit=50), args.repeat)
+            print(f"{query:<22}{t_regex:>12.2f}{len(regex_hits):>6}{t_mongo:>12.2f}{t_index:>14.2f}{len(index_hits):>6}")
+    finally:
+        if collection is not None:
+            collection.database.client.drop_database("benchmark_product_search")
+
+
+if __name__ == '__main__':
+    main()
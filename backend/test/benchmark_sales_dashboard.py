@@ -0,0 +1,144 @@
+"""
+客户销售看板基准：逐行读取 sale.order.line 后用 pandas 聚合（原实现） vs. 预聚合的 sales.cube。
+
+    python -m test.benchmark_sales_dashboard --mongo-uri mongodb://localhost:27017 [--lines 200000]
+
+合成数据写入临时数据库 benchmark_sales_dashboard，测试结束后删除。
+"""
+import argparse
+import datetime
+import random
+import statistics
+import time
+
+import pandas as pd
+import pymongo
+
+from crud.odoo import OdooOrderlineMongoDB, OdooSalesCubeMongoDB
+from services.odoo.OdooCustomerRfm import score_customers
+
+DB_NAME = "benchmark_sales_dashboard"
+ALIAS = "bench"
+
+
+def make_orderlines(n_lines, n_customers=800, n_products=3000, days=3 * 365, seed=42):
+    rnd = random.Random(seed)
+    today = datetime.datetime.now().replace(microsecond=0)
+    docs = []
+    line_id = 0
+    order_id = 0
+    while line_id < n_lines:
+        order_id += 1
+        partner = rnd.randint(1, n_customers)
+        create_date = today - datetime.timedelta(days=rnd.randint(0, days), seconds=rnd.randint(0, 86400))
+        state = "sale" if rnd.random() < 0.9 else "cancel"
+        for _ in range(rnd.randint(1, 8)):
+            line_id += 1
+            product = rnd.randint(1, n_products)
+            qty = rnd.randint(1, 50)
+            price_unit = round(rnd.uniform(0.5, 200), 2)
+            subtotal = round(qty * price_unit, 2)
+            docs.append({
+                "_id": line_id, "alias": ALIAS,
+                "data": {
+                    "id": line_id,
+                    "order_id": [order_id, f"S{order_id:06d}"],
+                    "currency_id": [1, "EUR"],
+                    "order_partner_id": [partner, f"Kunde {partner}"],
+                    "salesman_id": [7, "Vertrieb"],
+                    "product_template_id": [product, f"[P{product:05d}] Produkt {product}"],
+                    "state": state, "product_uom": [1, "Stk"],
+                    "product_uom_qty": qty, "product_qty": qty, "price_unit": price_unit,
+                    "price_subtotal": subtotal, "price_tax": round(subtotal * 0.19, 2),
+                    "price_total": round(subtotal * 1.19, 2), "qty_to_invoice": 0, "qty_to_deliver": 0,
+                    "product_type": "product", "is_delivery": False, "discount": 0,
+                    "create_date": create_date.strftime("%Y-%m-%d %H:%M:%S"),
+                    "write_date": create_date.strftime("%Y-%m-%d %H:%M:%S"),
+                },
+            })
+    return docs
+
+
+def customer_stats_from_orderlines(mdb_order, days_ago):
+    """ 原实现：读取全部订单行，在 pandas 中清洗并按客户聚合 """
+    data = mdb_order.query_orderlines(filter={"alias": ALIAS})
+    df = pd.DataFrame([{
+        "order_number": d["data"]["order_id"][1],
+        "order_partner": d["data"]["order_partner_id"][1],
+        "currency": d["data"]["currency_id"][1],
+        "state": d["data"]["state"],
+        "price_unit": d["data"]["price_unit"],
+        "price_subtotal": d["data"]["price_subtotal"],
+        "create_date": d["data"]["create_date"],
+    } for d in data])
+    df["create_date"] = pd.to_datetime(df["create_date"], format="%Y-%m-%d %H:%M:%S")
+    past_days = datetime.datetime.now() - datetime.timedelta(days=days_ago)
+    df = df[(df["state"] == "sale") & (df["create_date"] >= past_days) & (df["price_unit"] != 0)]
+    df_customer_sales = df.groupby("order_partner") \
+        .agg({"price_subtotal": "sum", "currency": "first", "order_number": "nunique", "create_date": "max"}) \
+        .rename(columns={"order_number": "order_count"}).reset_index()
+    df_customer_sales["last_day"] = df_customer_sales.pop("create_date").dt.strftime("%Y-%m-%d")
+    return score_customers(df_customer_sales)
+
+
+def customer_stats_from_cube(mdb_sales_cube, days_ago):
+    since_day = (datetime.date.today() - datetime.timedelta(days=days_ago)).isoformat()
+    rows = mdb_sales_cube.aggregate_sales(ALIAS, group_by=["partner"], since_day=since_day)
+    df_customer_sales = pd.DataFrame(rows, columns=["partner", "price_subtotal", "currency", "order_count", "last_day"])
+    return score_customers(df_customer_sales.rename(columns={"partner": "order_partner"}))
+
+
+def timeit(fn, repeat):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations), result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--days-ago", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(args.mongo_uri)
+    mdb_order, mdb_sales_cube = OdooOrderlineMongoDB(), OdooSalesCubeMongoDB()
+    for mdb in (mdb_order, mdb_sales_cube):
+        mdb.db_name = DB_NAME
+        mdb.set_client(client)
+    try:
+        docs = make_orderlines(args.lines)
+        mdb_order.get_db_collection().insert_many(docs)
+        for mdb in (mdb_order, mdb_sales_cube):
+            for collection_name, indexes in mdb.INDEXES.items():
+                client[DB_NAME][collection_name].create_indexes(indexes)
+
+        start = time.perf_counter()
+        cells = mdb_sales_cube.rebuild(ALIAS)
+        print(f"{len(docs)} order lines -> {cells} cube cells, full build {time.perf_counter() - start:.2f}s")
+
+        days = sorted({d["data"]["create_date"][:10] for d in random.Random(1).sample(docs, 200)})
+        t_incremental, _ = timeit(lambda: mdb_sales_cube.rebuild(ALIAS, days=days), args.repeat)
+        print(f"Incremental rebuild of {len(days)} days: {t_incremental:.0f} ms")
+
+        t_before, df_before = timeit(lambda: customer_stats_from_orderlines(mdb_order, args.days_ago), args.repeat)
+        t_after, df_after = timeit(lambda: customer_stats_from_cube(mdb_sales_cube, args.days_ago), args.repeat)
+        print(f"Customer stats ({args.days_ago} days): order lines {t_before:.0f} ms, sales cube {t_after:.0f} ms "
+              f"({t_before / max(t_after, 1e-6):.1f}x)")
+
+        before = df_before.set_index("order_partner")[["price_subtotal", "order_count"]].sort_index()
+        after = df_after.set_index("order_partner")[["price_subtotal", "order_count"]].sort_index()
+        # 原实现按精确时间截取，cube 按天，边界当天可能略有差异
+        print(f"Customers: {len(before)} vs {len(after)}, "
+              f"max subtotal diff {(before['price_subtotal'] - after['price_subtotal']).abs().max():.2f}")
+    finally:
+        client.drop_database(DB_NAME)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import utils.time as time_utils
+
+
+class FakeCollection:
+    """
+    带 fetchedAt 和墓碑的 MongoDB 管理类（DeltaSyncMixin、OdooProductMongoDB、OdooPackagingMongoDB）的替身。
+    now 为 None 时使用当前时间，测试可以设置 now 模拟之后的同步。
+    """
+
+    def __init__(self, alias="test"):
+        self.alias = alias
+        self.docs = {}
+        self.tombstones = []
+        self.now = None
+
+    def clock(self):
+        return self.now or time_utils.now()
+
+    def save(self, _id, fetched_at=None, **data):
+        self.docs[_id] = {"_id": _id, "alias": self.alias, "fetchedAt": fetched_at or self.clock(),
+                          "data": {"id": _id, **data}}
+
+    def delete(self, _id):
+        del self.docs[_id]
+        self.tombstones.append((_id, self.clock()))
+
+    def query_products(self, filter=None, projection=None):
+        since = (filter or {}).get("fetchedAt", {}).get("$gte", "")
+        return [doc for doc in self.docs.values() if doc["fetchedAt"] >= since]
+
+    query_packagings = query_products
+
+    def query_changes(self, alias, fetched_at, after_id=None, limit=1000, projection=None):
+        # 按 (fetchedAt, _id) 升序的键集分页
+        if after_id is None:
+            docs = [d for d in self.docs.values() if d["fetchedAt"] >= fetched_at]
+        else:
+            docs = [d for d in self.docs.values() if (d["fetchedAt"], d["_id"]) > (fetched_at, after_id)]
+        return sorted(docs, key=lambda d: (d["fetchedAt"], d["_id"]))[:limit]
+
+    def query_deleted_ids(self, alias, since):
+        return [_id for _id, deleted_at in self.tombstones if deleted_at >= since]
@@ -0,0 +1,47 @@
+import datetime
+import unittest
+from unittest.mock import MagicMock
+
+from services.odoo import OdooInventoryService
+
+
+class TestQuantSnapshots(unittest.TestCase):
+    """
+    增量同步库存后写入快照：使用本地 MongoDB 的临时数据库，Odoo API 用 MagicMock 代替。
+    """
+    DB_NAME = "odoo_data_integration_tests"
+    ALIAS = "integration-test"
+
+    def setUp(self):
+        try:
+            self.svc = OdooInventoryService(key_index=None).__enter__()
+        except RuntimeError:
+            self.skipTest("MongoDB is not available")
+        self.addCleanup(self.svc.__exit__, None, None, None)
+        for mdb in (self.svc.mdb_quant, self.svc.mdb_checkpoint, self.svc.mdb_quant_snapshot):
+            mdb.db_name = self.DB_NAME
+        self.addCleanup(self.svc.mdb_quant.get_client().drop_database, self.DB_NAME)
+
+        self.svc.api = MagicMock()
+        self.svc.api.get_alias.return_value = self.ALIAS
+        # 同一产品和库位的两个批次
+        self.svc.api.fetch_changed_quants.side_effect = [[
+            dict(id=quant_id, product_id=[7, "Schraube"], location_id=[8, "WH/Stock/A"], quantity=quantity,
+                 write_date="2024-07-25 10:00:00", create_date="2024-07-25 10:00:00")
+            for quant_id, quantity in ((1, 3.0), (2, 2.0))
+        ]]
+
+    def test_sync_then_snapshot_writes_bucket(self):
+        result = self.svc.save_all_quants()
+        self.assertEqual(result.fetched, 2)
+
+        now = datetime.datetime.now()
+        self.assertEqual(self.svc.save_quant_snapshots(resolutions=("day",)), 1)
+        doc = self.svc.mdb_quant_snapshot.get_db_collection().find_one({"alias": self.ALIAS})
+        self.assertEqual((doc["resolution"], doc["productId"], doc["locationId"], doc["bucket"]),
+                         ("day", 7, 8, now.strftime("%Y-%m")))
+        self.assertEqual(doc["samples"], {now.strftime("%d"): 5.0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import datetime
+import unittest
+
+import pymongo
+from bson import ObjectId
+
+from core.db import (pop_closed_loops, encode_page_cursor, decode_page_cursor, keyset_filter,
+                     MongoDBDataManager)
+
+
+def matches(doc, filter_):
+    # query_page 使用的过滤条件子集：$and、$or、$gt、$lt 和相等
+    for key, cond in filter_.items():
+        if key == "$and":
+            ok = all(matches(doc, f) for f in cond)
+        elif key == "$or":
+            ok = any(matches(doc, f) for f in cond)
+        elif isinstance(cond, dict):
+            ok = all(doc[key] > v if op == "$gt" else doc[key] < v for op, v in cond.items())
+        else:
+            ok = doc[key] == cond
+        if not ok:
+            return False
+    return True
+
+
+class FakeCursor:
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for key, direction in reversed(keys):
+            self.docs.sort(key=lambda d: d[key], reverse=direction == pymongo.DESCENDING)
+        return self
+
+    def limit(self, n):
+        return self.docs[:n]
+
+
+class FakeCollection:
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, filter_, projection=None):
+        return FakeCursor([d for d in self.docs if matches(d, filter_ or {})])
+
+
+class TestCoreUnits(unittest.TestCase):
+
+    def test_pop_closed_loops(self):
+        open_loop, closed_loop = asyncio.new_event_loop(), asyncio.new_event_loop()
+        closed_loop.close()
+        try:
+            resources = {open_loop: "open", closed_loop: "closed"}
+            self.assertEqual(pop_closed_loops(resources), ["closed"])
+            self.assertEqual(resources, {open_loop: "open"})
+        finally:
+            open_loop.close()
+
+
+class TestPageCursor(unittest.TestCase):
+
+    def test_cursor_round_trip(self):
+        for values in (["2024-07-25T10:00:00Z", 42], [3.5, "res.partner:7"],
+                       [datetime.datetime(2024, 7, 25, 10, 0), ObjectId()], [None, 1]):
+            self.assertEqual(decode_page_cursor(encode_page_cursor(values)), values)
+
+    def test_invalid_cursor(self):
+        for cursor in ("not a cursor", encode_page_cursor([1]), encode_page_cursor([1, 2, 3])):
+            with self.assertRaises(ValueError):
+                decode_page_cursor(cursor)
+
+    def test_keyset_filter(self):
+        self.assertEqual(keyset_filter("_id", pymongo.ASCENDING, None, 5), {"_id": {"$gt": 5}})
+        self.assertEqual(keyset_filter("name", pymongo.DESCENDING, "b", 5),
+                         {"$or": [{"name": {"$lt": "b"}}, {"name": "b", "_id": {"$lt": 5}}]})
+
+    def test_pages_cover_all_documents_once(self):
+        docs = [{"_id": i, "name": f"name {i % 4}"} for i in range(1, 24)]
+        mdb = MongoDBDataManager()
+        mdb.set_client({"db": {"c": FakeCollection(docs)}})
+        for direction in (pymongo.ASCENDING, pymongo.DESCENDING):
+            seen, cursor = [], None
+            while True:
+                page, cursor = mdb.query_page("db", "c", {}, limit=5, cursor=cursor, sort_key="name",
+                                              direction=direction)
+                seen.extend(d["_id"] for d in page)
+                if cursor is None:
+                    break
+            expected = sorted(docs, key=lambda d: (d["name"], d["_id"]), reverse=direction == pymongo.DESCENDING)
+            self.assertEqual(seen, [d["_id"] for d in expected])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+import utils.time as time_utils
+from services.odoo.OdooDeltaSync import encode_sync_token, decode_sync_token, query_delta
+from test.fakes import FakeCollection
+
+
+def to_item(doc):
+    return doc["data"] if doc["data"].get("active", True) else None
+
+
+class TestDeltaSync(unittest.TestCase):
+
+    def setUp(self):
+        self.mdb = FakeCollection()
+        yesterday = time_utils.days_ago(1)
+        for i in range(1, 6):
+            self.mdb.save(i, yesterday, name=f"record {i}")
+
+    def sync_all(self, since=None, limit=2):
+        pages = [query_delta(self.mdb, "test", since, limit, to_item)]
+        while pages[-1]["hasMore"]:
+            pages.append(query_delta(self.mdb, "test", pages[-1]["token"], limit, to_item))
+        return pages
+
+    def test_token_round_trip(self):
+        token = encode_sync_token("2024-07-25T10:00:00Z", 42, "2024-07-25T09:58:00Z")
+        self.assertEqual(decode_sync_token(token), ("2024-07-25T10:00:00Z", 42, "2024-07-25T09:58:00Z"))
+        self.assertEqual(decode_sync_token(encode_sync_token("", None, ""))[1], None)
+
+    def test_invalid_token(self):
+        with self.assertRaises(ValueError):
+            decode_sync_token("not a token")
+        pages = self.sync_all(since="not a token")
+        self.assertTrue(pages[0]["reset"])
+
+    def test_initial_sync_pages_through_all_records(self):
+        pages = self.sync_all()
+        self.assertEqual(len(pages), 3)
+        self.assertTrue(pages[0]["reset"])
+        self.assertEqual([item["id"] for page in pages for item in page["upserts"]], [1, 2, 3, 4, 5])
+
+    def test_incremental_sync_returns_changes_and_tombstones(self):
+        token = self.sync_all()[-1]["token"]
+        self.mdb.save(2, time_utils.now(), name="renamed")
+        self.mdb.save(3, time_utils.now(), name="archived", active=False)
+        self.mdb.delete(4)
+        pages = self.sync_all(since=token)
+        self.assertFalse(pages[0]["reset"])
+        self.assertEqual([item["name"] for page in pages for item in page["upserts"]], ["renamed"])
+        self.assertEqual(sorted(_id for page in pages for _id in page["deleted"]), [3, 4])
+        # 墓碑只在最后一页返回
+        self.assertTrue(all(not page["deleted"] or not page["hasMore"] for page in pages))
+
+    def test_tombstones_are_not_returned_twice_after_overlap(self):
+        token = self.sync_all()[-1]["token"]
+        self.mdb.delete(5)
+        token = self.sync_all(since=token)[-1]["token"]
+        # 新令牌回退 DELTA_OVERLAP_SEC，重复返回的墓碑对客户端是幂等的
+        pages = self.sync_all(since=token)
+        self.assertLessEqual(set(_id for page in pages for _id in page["deleted"]), {5})
+        self.assertEqual([item for page in pages for item in page["upserts"]], [])
+
+    def test_expired_token_resets(self):
+        old = time_utils.days_ago(365)
+        pages = self.sync_all(since=encode_sync_token(old, None, old))
+        self.assertTrue(pages[0]["reset"])
+        self.assertEqual(sum(page["size"] for page in pages), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
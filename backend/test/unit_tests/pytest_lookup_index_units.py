@@ -0,0 +1,82 @@
+import unittest
+from unittest.mock import patch
+
+from services.odoo.OdooLookupIndex import OdooLookupIndex
+from test.fakes import FakeCollection
+
+
+class TestOdooLookupIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = OdooLookupIndex()
+        self.products = FakeCollection()
+        self.packagings = FakeCollection()
+        self.later("2024-01-01T00:00:00Z")
+        self.products.save(1, barcode="4001", default_code="SKU-1", name="Schraube M8", active=True)
+        self.products.save(2, barcode="4002", default_code="SKU-2", name="Mutter M8", active=True)
+        self.packagings.save(10, barcode="9001", product_id=[1, "Schraube"], name="Karton 100")
+        self.index.build("test", self.products, self.packagings)
+
+    def later(self, timestamp):
+        self.products.now = self.packagings.now = timestamp
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup("test", "sku-1"), [1])
+        self.assertEqual(self.index.lookup("test", "9001"), [1])
+        self.assertEqual(self.index.lookup("test", "unknown"), [])
+        self.assertEqual(self.index.lookup_many("test", ["4002", "x"]), {"4002": [2], "x": []})
+
+    def test_incremental_refresh(self):
+        self.later("2099-01-01T00:00:00Z")
+        self.products.save(1, barcode="4111", default_code="SKU-1", name="Schraube M8", active=True)
+        self.products.save(3, barcode="4003", default_code="SKU-3", name="Dübel 8", active=True)
+        self.index.refresh("test", self.products, self.packagings)
+        self.assertEqual(self.index.lookup("test", "4001"), [])
+        self.assertEqual(self.index.lookup("test", "4111"), [1])
+        self.assertEqual(self.index.lookup("test", "4003"), [3])
+        self.assertEqual(self.index.search("test", "dübel"), [3])
+
+    def test_inactive_products_are_not_searched(self):
+        self.later("2099-01-01T00:00:00Z")
+        self.products.save(2, barcode="4002", default_code="SKU-2", name="Mutter M8", active=False)
+        self.index.refresh("test", self.products, self.packagings)
+        self.assertEqual(self.index.search("test", "mutter m8"), [])
+        self.assertEqual(self.index.search("test", "m8"), [1])
+
+    def test_refresh_applies_tombstones(self):
+        self.later("2099-01-01T00:00:00Z")
+        self.products.delete(2)
+        self.packagings.delete(10)
+        self.index.refresh("test", self.products, self.packagings)
+        self.assertEqual(self.index.lookup("test", "4002"), [])
+        self.assertEqual(self.index.lookup("test", "9001"), [])
+        self.assertEqual(self.index.search("test", "mutter"), [])
+        self.assertEqual(self.index.search("test", "karton"), [])
+
+    def test_rebuild_swaps_index(self):
+        old = self.index.indexes["test"]
+        self.products.docs.pop(2)
+        self.index.build("test", self.products, self.packagings)
+        self.assertIsNot(self.index.indexes["test"], old)
+        self.assertEqual(self.index.lookup("test", "4002"), [])
+        # 旧索引在替换前保持完整，替换期间的查询不会看到构建了一半的索引
+        self.assertEqual(sorted(old.product_ids_by_key["4002"]), [2])
+
+    def test_missing_index_is_built_in_background(self):
+        with patch("services.odoo.OdooLookupIndex.threading.Thread") as thread:
+            self.assertIsNone(self.index.lookup("other", "4001"))
+            self.assertIsNone(self.index.search("other", "schraube"))
+        thread.assert_called_once()
+        self.assertEqual(thread.call_args.kwargs["args"], ("other",))
+
+    def test_sync_only_updates_loaded_indexes(self):
+        self.index.sync("other", self.products, self.packagings, full=True)
+        self.assertNotIn("other", self.index.indexes)
+        self.later("2099-01-01T00:00:00Z")
+        self.products.delete(1)
+        self.index.sync("test", self.products, self.packagings)
+        self.assertEqual(self.index.lookup("test", "sku-1"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
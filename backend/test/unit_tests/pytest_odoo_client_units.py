@@ -0,0 +1,63 @@
+import http.client
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+from external.odoo.base import OdooAPIKey, OdooClient, odoo_request_budget
+
+
+class TestOdooClientRetry(unittest.TestCase):
+
+    def setUp(self):
+        api_key = OdooAPIKey(alias="test", db="db", username="user", password="pw", host="http://odoo.local")
+        self.client = OdooClient(api_key)
+        self.client.uid = 1
+        self.proxy = MagicMock()
+        patcher = patch("external.odoo.base.xmlrpc.client.ServerProxy", return_value=self.proxy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_read_is_retried_after_connection_error(self):
+        self.proxy.execute_kw.side_effect = [http.client.RemoteDisconnected("closed"), [{"id": 1}]]
+        self.assertEqual(self.client.read("res.partner", [[1]]), [{"id": 1}])
+        self.assertEqual(self.proxy.execute_kw.call_count, 2)
+
+    def test_write_is_not_retried_after_connection_error(self):
+        self.proxy.execute_kw.side_effect = [http.client.RemoteDisconnected("closed"), 42]
+        with self.assertRaises(http.client.RemoteDisconnected):
+            self.client.create("stock.putaway.rule", [{"product_id": 1}])
+        self.assertEqual(self.proxy.execute_kw.call_count, 1)
+
+    def test_write_is_retried_when_connection_refused(self):
+        self.proxy.execute_kw.side_effect = [ConnectionRefusedError(), 42]
+        self.assertEqual(self.client.create("stock.putaway.rule", [{"product_id": 1}]), 42)
+
+    def test_retry_acquires_rate_limit_token(self):
+        limiter = MagicMock()
+        self.proxy.execute_kw.side_effect = [http.client.RemoteDisconnected("closed"), []]
+        with odoo_request_budget(limiter):
+            self.client.search("res.partner", [[]])
+        self.assertEqual(limiter.acquire.call_count, 2)
+
+
+class TestOdooRequestBudget(unittest.TestCase):
+
+    def test_budget_only_applies_to_current_thread(self):
+        api_key = OdooAPIKey(alias="test", db="db", username="user", password="pw", host="http://odoo.local")
+        client = OdooClient(api_key)
+        client.uid = 1
+        limiter = MagicMock()
+        with patch("external.odoo.base.xmlrpc.client.ServerProxy", return_value=MagicMock()):
+            with odoo_request_budget(limiter):
+                other = threading.Thread(target=lambda: client.search("res.partner", [[]]))
+                other.start()
+                other.join()
+                self.assertEqual(limiter.acquire.call_count, 0)
+                client.search("res.partner", [[]])
+            self.assertEqual(limiter.acquire.call_count, 1)
+            client.search("res.partner", [[]])
+        self.assertEqual(limiter.acquire.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
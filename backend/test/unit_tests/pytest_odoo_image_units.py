@@ -0,0 +1,45 @@
+import base64
+import io
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from services.odoo.OdooImageStore import OdooImageStore, THUMBNAIL_SIZES
+
+
+def make_b64_png(size=(32, 16)) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color=(200, 30, 30)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+class TestOdooImageStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = OdooImageStore(root=self.tmp.name)
+
+    def test_save_creates_thumbnails(self):
+        digest = self.store.save(make_b64_png())
+        self.assertIsNotNone(digest)
+        for size in THUMBNAIL_SIZES:
+            self.assertTrue(os.path.exists(os.path.join(self.tmp.name, digest[:2], f"{digest}_{size}.webp")))
+        self.assertEqual(self.store.save(make_b64_png()), digest)
+
+    def test_invalid_base64_is_skipped(self):
+        self.assertIsNone(self.store.save("not base64!"))
+
+    def test_corrupt_image_is_skipped(self):
+        self.assertIsNone(self.store.save(base64.b64encode(b"this is not an image").decode()))
+
+    def test_extract_images_of_corrupt_record(self):
+        item_data = {"id": 1, "image_1920": "x", "image_128": "y"}
+        self.store.extract_images(item_data)
+        self.assertEqual(item_data, {"id": 1, "image_digest": None})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import patch
+
+from utils.ratelimit import TokenBucket
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch("utils.ratelimit.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_up_to_capacity_without_waiting(self):
+        bucket = TokenBucket(rate=5, capacity=3)
+        for _ in range(3):
+            bucket.acquire()
+        self.assertEqual(self.clock.slept, 0)
+
+    def test_waits_for_refill_when_empty(self):
+        bucket = TokenBucket(rate=5, capacity=1)
+        bucket.acquire()
+        bucket.acquire()
+        self.assertAlmostEqual(self.clock.slept, 0.2)
+
+    def test_tokens_do_not_exceed_capacity(self):
+        bucket = TokenBucket(rate=5, capacity=2)
+        self.clock.now += 100
+        for _ in range(3):
+            bucket.acquire()
+        self.assertAlmostEqual(self.clock.slept, 0.2)
+
+    def test_default_capacity_is_rate(self):
+        self.assertEqual(TokenBucket(rate=5).capacity, 5)
+        self.assertEqual(TokenBucket(rate=0.5).capacity, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
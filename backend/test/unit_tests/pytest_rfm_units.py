@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from services.odoo.OdooCustomerRfm import RFM_LABELS, _score, apply_rfm_scores, rfm_bin_edges
+
+
+class TestRfmScore(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.values = pd.Series(rng.gamma(2.0, 500.0, size=1000).round(2))
+
+    def test_score_matches_qcut(self):
+        labels, edges = pd.qcut(self.values, 5, labels=RFM_LABELS, retbins=True)
+        np.testing.assert_array_equal(_score(self.values, edges.tolist()), labels.astype(int).to_numpy())
+
+    def test_values_on_edges_fall_into_lower_bin(self):
+        _, edges = pd.qcut(self.values, 5, retbins=True)
+        self.assertEqual(_score(pd.Series(edges), edges.tolist()).tolist(), [1, 1, 2, 3, 4, 5])
+
+    def test_values_outside_edges_use_outer_bins(self):
+        _, edges = pd.qcut(self.values, 5, retbins=True)
+        scores = _score(pd.Series([edges[0] - 1, edges[-1] + 1]), edges.tolist())
+        self.assertEqual(scores.tolist(), [1, 5])
+
+    def test_stored_edges_reproduce_live_scores(self):
+        rng = np.random.default_rng(7)
+        df = pd.DataFrame({
+            'price_subtotal': self.values,
+            'order_count': rng.integers(1, 40, size=len(self.values)),
+            'last_order_days': rng.integers(0, 365, size=len(self.values)),
+        })
+        scored = apply_rfm_scores(df.copy(), rfm_bin_edges(df))
+        expected = pd.qcut(df['price_subtotal'], 5, labels=RFM_LABELS).astype(int)
+        np.testing.assert_array_equal(scored['monetary_score'].to_numpy(), expected.to_numpy())
+        # 天数越少分数越高
+        expected = pd.qcut(df['last_order_days'], 5, labels=RFM_LABELS[::-1]).astype(int)
+        np.testing.assert_array_equal(scored['recency_score'].to_numpy(), expected.to_numpy())
+
+    def test_frequency_scores_raw_counts_against_noisy_edges(self):
+        rng = np.random.default_rng(7)
+        df = pd.DataFrame({
+            'price_subtotal': self.values,
+            'order_count': rng.integers(1, 40, size=len(self.values)),
+            'last_order_days': rng.integers(0, 365, size=len(self.values)),
+        })
+        np.random.seed(0)
+        edges = rfm_bin_edges(df)
+        np.random.seed(0)
+        noisy_order_count = df['order_count'] + np.random.uniform(0, 0.01, size=len(df))
+        noisy = pd.qcut(noisy_order_count, 5, labels=RFM_LABELS).astype(int)
+        scored = apply_rfm_scores(df.copy(), edges)
+        # 分位点落在同一订单次数的噪声之间时，qcut 会把这些客户拆到两档；
+        # 按原始次数评分则同一次数的客户得分相同，取其中较低的一档
+        expected = noisy.groupby(df['order_count']).transform('min')
+        np.testing.assert_array_equal(scored['frequency_score'].to_numpy(), expected.to_numpy())
+        self.assertTrue((scored['frequency_score'] <= noisy).all())
+
+
+if __name__ == '__main__':
+    unittest.main()